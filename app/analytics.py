@@ -0,0 +1,171 @@
+# app/analytics.py
+"""
+Spaltenorientierter Export der Bewegungshistorie (Parquet / Arrow IPC) für BI-Tools.
+
+CLI:
+    python -m app.analytics bewegungen.parquet --von 2025-01-01 --mit-pulver
+    python -m app.analytics delta.arrow --format arrow --after-id 1500000
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.models import Pulver, PulverBewegung
+
+# Zeilen pro Record-Batch (= Parquet Row Group) – bestimmt den Speicherbedarf
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "50000"))
+
+ANALYTICS_FORMATS = ("parquet", "arrow")
+ANALYTICS_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+BEWEGUNG_FIELDS = [
+    ("id", pa.int64()),
+    ("pulver_id", pa.int64()),
+    ("barcode", pa.string()),
+    ("datum", pa.timestamp("us")),
+    ("menge_alt", pa.float64()),
+    ("menge_neu", pa.float64()),
+    ("beschreibung", pa.string()),
+    ("user_id", pa.int64()),
+]
+
+# Optional aus Pulver dazu-gejoint
+PULVER_FIELDS = [
+    ("artikelnummer", pa.string()),
+    ("hersteller", pa.string()),
+    ("farbe", pa.string()),
+    ("qualitaet", pa.string()),
+    ("oberflaeche", pa.string()),
+    ("lagerort", pa.string()),
+]
+
+
+def movement_schema(mit_pulver: bool = False) -> pa.Schema:
+    return pa.schema(BEWEGUNG_FIELDS + (PULVER_FIELDS if mit_pulver else []))
+
+
+def movement_statement(von: datetime | None = None, bis: datetime | None = None,
+                       pulver_id: int | None = None, user_id: int | None = None,
+                       after_id: int | None = None, mit_pulver: bool = False):
+    """Bewegungen aufsteigend nach id – after_id macht den Export inkrementell"""
+    columns = [getattr(PulverBewegung, name) for name, _ in BEWEGUNG_FIELDS]
+    stmt = select(*columns)
+
+    if mit_pulver:
+        stmt = stmt.add_columns(*(getattr(Pulver, name) for name, _ in PULVER_FIELDS))
+        stmt = stmt.join(Pulver, PulverBewegung.pulver_id == Pulver.id)
+
+    if after_id is not None:
+        stmt = stmt.where(PulverBewegung.id > after_id)
+    if von is not None:
+        stmt = stmt.where(PulverBewegung.datum >= von)
+    if bis is not None:
+        stmt = stmt.where(PulverBewegung.datum < bis)
+    if pulver_id is not None:
+        stmt = stmt.where(PulverBewegung.pulver_id == pulver_id)
+    if user_id is not None:
+        stmt = stmt.where(PulverBewegung.user_id == user_id)
+
+    return stmt.order_by(PulverBewegung.id)
+
+
+def iter_record_batches(db: Session, stmt, schema: pa.Schema, batch_size: int = ANALYTICS_BATCH_SIZE):
+    """Server-seitiger Cursor → je batch_size Zeilen ein RecordBatch (nie alles im Speicher)"""
+    result = db.execute(stmt.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        columns = zip(*rows)
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink:
+    """Datei-Ersatz für pyarrow: sammelt geschriebene Bytes bis zum nächsten take()"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _open_writer(sink, fmt: str, schema: pa.Schema):
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    return pa.ipc.new_file(sink, schema)
+
+
+def stream_movements(db: Session, stmt, schema: pa.Schema, fmt: str):
+    """Generator für StreamingResponse – liefert die Datei Batch für Batch"""
+    sink = _ChunkSink()
+    writer = _open_writer(pa.PythonFile(sink, mode="w"), fmt, schema)
+    for batch in iter_record_batches(db, stmt, schema):
+        writer.write_batch(batch)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def write_movements(db: Session, stmt, schema: pa.Schema, fmt: str, path: str) -> tuple[int, int | None]:
+    """In eine Datei schreiben, gibt (zeilen, letzte_id) für den nächsten --after-id zurück"""
+    rows, last_id = 0, None
+    writer = _open_writer(path, fmt, schema)
+    try:
+        for batch in iter_record_batches(db, stmt, schema):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            last_id = batch.column(0)[-1].as_py()
+    finally:
+        writer.close()
+    return rows, last_id
+
+
+# ------------------------------------------------------------
+# 🔹 CLI
+# ------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bewegungshistorie als Parquet / Arrow exportieren")
+    parser.add_argument("ziel", help="Ausgabedatei")
+    parser.add_argument("--format", choices=ANALYTICS_FORMATS, default="parquet")
+    parser.add_argument("--von", type=datetime.fromisoformat, help="ab Datum (inklusive), ISO-Format")
+    parser.add_argument("--bis", type=datetime.fromisoformat, help="bis Datum (exklusive), ISO-Format")
+    parser.add_argument("--pulver-id", type=int)
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--after-id", type=int, help="nur Bewegungen mit größerer id (inkrementell)")
+    parser.add_argument("--mit-pulver", action="store_true", help="Pulver-Stammdaten dazu-joinen")
+    args = parser.parse_args(argv)
+
+    from app.database import ReadSessionLocal
+
+    stmt = movement_statement(args.von, args.bis, args.pulver_id, args.user_id, args.after_id, args.mit_pulver)
+    db = ReadSessionLocal()
+    try:
+        rows, last_id = write_movements(db, stmt, movement_schema(args.mit_pulver), args.format, args.ziel)
+    finally:
+        db.close()
+
+    print(f"✔ {rows} Bewegungen nach {args.ziel} geschrieben (letzte id: {last_id})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
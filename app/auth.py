@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.hash import pbkdf2_sha256
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User, RolePermission, Permission, Role
+from app.hashing import hashing_service
+from app.models import User, Role
+from app.permissions import permission_registry
+from app.principal_cache import Principal, principal_cache
 from jose.exceptions import ExpiredSignatureError
 
 # Geheimschlüssel für JWT
@@ -23,24 +25,33 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     """JWT Token erzeugen"""
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+# Hashing läuft im eigenen Worker-Pool (siehe app/hashing.py)
 def verify_password(plain_password, hashed_password):
-    return pbkdf2_sha256.verify(plain_password, hashed_password)
+    return hashing_service.verify(plain_password, hashed_password)
 
 
 def hash_password(password):
-    return pbkdf2_sha256.hash(password)
+    return hashing_service.hash(password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await hashing_service.verify_async(plain_password, hashed_password)
+
+
+async def hash_password_async(password):
+    return await hashing_service.hash_async(password)
 
 
 # ----------------------------------------------------
 # Benutzer abrufen aus Token
 # ----------------------------------------------------
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Aktuellen Benutzer anhand Token laden"""
+def decode_access_token(token: str) -> dict:
+    """Token prüfen und Payload zurückgeben (wirft 401 bei ungültigem / abgelaufenem Token)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Ungültige Anmeldedaten",
@@ -49,8 +60,7 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise credentials_exception
     except ExpiredSignatureError:
         raise HTTPException(
@@ -61,45 +71,53 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
-    if user is None or user.deleted or not user.active:
-        raise credentials_exception
-    return user
+    return payload
 
-def require_permission(permission_name: str):
-    """Prüft, ob der aktuelle User die angegebene Permission besitzt."""
 
-    def dependency(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def load_principal(payload: dict, db: Session) -> Principal:
+    """Benutzer zum Token-Payload laden – Cache-Treffer ohne DB-Abfrage"""
+    username = payload["sub"]
+    issued_at = payload.get("iat")
 
-        # 1. Rolle holen
-        role_id = current_user.role_id
+    principal = principal_cache.get(username, issued_at)
+    if principal is None:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None or user.deleted or not user.active:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Ungültige Anmeldedaten",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        principal = Principal(user)
+        principal_cache.put(username, issued_at, principal)
 
-        # 2. Alle Permission-Einträge dieser Rolle holen
-        perms = (
-            db.query(Permission.name)
-            .join(RolePermission, Permission.id == RolePermission.permission_id)
-            .filter(RolePermission.role_id == role_id)
-            .all()
-        )
+    return principal
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Aktuellen Benutzer anhand Token laden (über Principal-Cache)"""
+    return load_principal(decode_access_token(token), db)
+
+def require_permission(permission_name: str):
+    """Prüft, ob der aktuelle User die angegebene Permission besitzt."""
 
-        # Ergebnis ist Liste von Tupeln → normalisieren
-        user_permissions = [p[0] for p in perms]
+    def dependency(current_user: Principal = Depends(get_current_user)):
 
-        # 3. Prüfen
-        if permission_name not in user_permissions:
+        # Vorkompilierte Bitmaske der Rolle prüfen (kein DB-Zugriff)
+        if not permission_registry.has_permission(current_user.role_id, permission_name):
             raise HTTPException(
                 status_code=403,
                 detail=f"Fehlende Berechtigung: {permission_name}"
             )
 
-        # 4. OK → Zugriff gewähren
+        # OK → Zugriff gewähren
         return current_user
 
     return dependency
 
-def assert_can_assign_role(target_role: Role, current_user: User):
+def assert_can_assign_role(target_role: Role, current_user: Principal):
     if target_role.name.lower() == ADMIN_ROLE_NAME:
-        if not current_user.role or current_user.role.name.lower() != ADMIN_ROLE_NAME:
+        if not current_user.role_name or current_user.role_name.lower() != ADMIN_ROLE_NAME:
             raise HTTPException(
                 status_code=403,
                 detail="Nur Admins dürfen Admin-Rollen vergeben"
@@ -0,0 +1,62 @@
+# app/change_tracking.py
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.models import ChangeCounter
+
+
+def next_change_seq(db: Session, name: str = "pulver") -> int:
+    """
+    Zählt den Änderungszähler innerhalb der laufenden Transaktion hoch.
+
+    Das UPDATE sperrt die Zählerzeile bis zum Commit – konkurrierende Schreiber
+    committen dadurch in Zählerreihenfolge und kein Client verpasst eine Änderung.
+    Die Zeile legen Migration bzw. Seeding an; hier wird nie eingefügt (zwei
+    gleichzeitige erste Schreiber würden sonst beide INSERTen).
+    """
+    value = db.execute(
+        update(ChangeCounter)
+        .where(ChangeCounter.name == name)
+        .values(value=ChangeCounter.value + 1)
+        .returning(ChangeCounter.value)
+    ).scalar()
+
+    if value is None:
+        raise RuntimeError(f"Änderungszähler '{name}' fehlt – Migration/Seeding ausführen")
+
+    return value
+
+
+def current_change_seq(db: Session, name: str = "pulver") -> int:
+    value = db.execute(select(ChangeCounter.value).where(ChangeCounter.name == name)).scalar()
+    return value or 0
+
+
+def versioned_update(db: Session, model, object_id: int, version: int | None, values: dict, *criteria):
+    """
+    Optimistic Locking in einer Anweisung: UPDATE … WHERE id=? AND version=? (version + 1).
+    Gibt die neue Zeile zurück oder None, wenn nichts getroffen wurde
+    (Version veraltet, Datensatz fehlt oder criteria nicht erfüllt).
+    Ohne version wird unbedingt aktualisiert und nur hochgezählt.
+    """
+    table = model.__table__
+    stmt = update(table).where(table.c.id == object_id, *criteria)
+    if version is not None:
+        stmt = stmt.where(table.c.version == version)
+
+    return db.execute(
+        stmt.values(version=table.c.version + 1, **values).returning(*table.c)
+    ).first()
+
+
+def parse_version(data: dict, required: bool = False) -> int | None:
+    """Client-Version aus dem Request-Body lesen und prüfen"""
+    version = data.get("version")
+    if version is None:
+        if required:
+            raise HTTPException(status_code=400, detail="version - Wert fehlt (Optimistic Locking)")
+        return None
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise HTTPException(status_code=400, detail="version muss eine Ganzzahl sein")
+    return version
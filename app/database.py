@@ -1,6 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Request
 import os
+import time
+from contextlib import asynccontextmanager
 
 # SQLite-Datenbank im Projektordner
 SQLALCHEMY_DATABASE_URL = os.getenv(
@@ -8,9 +13,95 @@ SQLALCHEMY_DATABASE_URL = os.getenv(
     "sqlite:///./app.db"
 )
 
+# ------------------------------------------------------------
+# 🔹 Engine-Profile (DB_PROFILE = auto | default | sqlite-wal | postgres)
+# ------------------------------------------------------------
+# auto wählt anhand von DATABASE_URL, default lässt alles auf SQLAlchemy-Standard
+DB_PROFILE = os.getenv("DB_PROFILE", "auto")
+
+# SQLite (sqlite-wal)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "5"))
+SQLITE_READ_POOL_OVERFLOW = int(os.getenv("SQLITE_READ_POOL_OVERFLOW", "10"))
+
+# PostgreSQL (postgres)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+DB_PROFILES = ("default", "sqlite-wal", "postgres")
+
+
+def _resolve_profile(url: str) -> str:
+    backend = make_url(url).get_backend_name()
+    profile = DB_PROFILE
+    if profile == "auto":
+        profile = {"sqlite": "sqlite-wal", "postgresql": "postgres"}.get(backend, "default")
+
+    if profile not in DB_PROFILES:
+        raise RuntimeError(f"Unbekanntes DB_PROFILE '{profile}' (erlaubt: auto, {', '.join(DB_PROFILES)})")
+    if profile == "sqlite-wal" and backend != "sqlite" or profile == "postgres" and backend != "postgresql":
+        raise RuntimeError(f"DB_PROFILE '{profile}' passt nicht zu DATABASE_URL ({backend})")
+    return profile
+
+
+def _engine_options(url: str, profile: str, is_async: bool) -> dict:
+    """Engine-Parameter je Profil – async ist die Schreib-Engine der async-Routen"""
+    if profile == "sqlite-wal":
+        if make_url(url).database in (None, "", ":memory:"):
+            return {}  # In-Memory: SQLAlchemy wählt selbst einen passenden Pool
+        if is_async:
+            # Schreib-Engine mit EINER Verbindung: die Schreibzugriffe der Routen, des Scanners und
+            # des Logins (write_session / get_async_db) warten im Pool statt auf "database is locked".
+            # Das WS-Event-Log hat eine eigene Verbindung (event_session), ebenso die sync Engine.
+            return {"pool_size": 1, "max_overflow": 0, "pool_timeout": DB_POOL_TIMEOUT}
+        # Sync Engine (SessionLocal): überwiegend Leser – sync Routen, Token-Prüfung (load_principal,
+        # auch für WebSockets), Permission-Registry, Analytics-CLI. Geschrieben wird hier nur beim
+        # Seeding (run_seed, vor dem Start) – und mit DB_ASYNC=0, dann laufen auch die async Routen hier.
+        # Ein Schreiber außerhalb der Schreib-Engine wartet per busy_timeout auf die Sperre.
+        return {"pool_size": SQLITE_READ_POOL_SIZE, "max_overflow": SQLITE_READ_POOL_OVERFLOW}
+
+    if profile == "postgres":
+        if is_async:
+            connect_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            connect_args = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+            "connect_args": connect_args,
+        }
+
+    return {}
+
+
+def _apply_sqlite_pragmas(sync_engine):
+    """PRAGMAs für jede neue SQLite-Verbindung (WAL, kurze fsyncs, Wartezeit bei Sperren)"""
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.close()
+
+
+ACTIVE_DB_PROFILE = _resolve_profile(SQLALCHEMY_DATABASE_URL)
+
 # Engine & Session
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
+    SQLALCHEMY_DATABASE_URL,
+    **_engine_options(SQLALCHEMY_DATABASE_URL, ACTIVE_DB_PROFILE, is_async=False)
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -24,4 +115,219 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ------------------------------------------------------------
+# 🔹 Async-Modus (für async-Routen, blockiert den Event-Loop nicht)
+# ------------------------------------------------------------
+# Async-Treiber je Datenbank (sqlite → aiosqlite, postgresql → asyncpg)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"Kein Async-Treiber für '{parsed.drivername}' – ASYNC_DATABASE_URL setzen")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+# Gleiche Datenbank wie DATABASE_URL, nur mit Async-Treiber (überschreibbar)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **_engine_options(ASYNC_DATABASE_URL, ACTIVE_DB_PROFILE, is_async=True)
+)
+
+if ACTIVE_DB_PROFILE == "sqlite-wal":
+    _apply_sqlite_pragmas(engine)
+    _apply_sqlite_pragmas(async_engine.sync_engine)
+
+# expire_on_commit=False: Objekte bleiben nach dem Commit lesbar (kein Lazy-Load im Event-Loop)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+# DB_ASYNC=0 → die async-Routen arbeiten auf einer sync Session direkt im Event-Loop
+# (Verhalten vor dem Async-Modus – zum Vergleich, siehe benchmarks/async_routes.py)
+DB_ASYNC = os.getenv("DB_ASYNC", "1") != "0"
+
+
+class BlockingAsyncSession:
+    """Sync Session mit der Schnittstelle von AsyncSession – jeder Aufruf blockiert den Loop"""
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    async def execute(self, *args, **kwargs):
+        return self.sync_session.execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return self.sync_session.scalar(*args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return self.sync_session.scalars(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return self.sync_session.get(*args, **kwargs)
+
+    async def flush(self):
+        self.sync_session.flush()
+
+    async def refresh(self, instance):
+        self.sync_session.refresh(instance)
+
+    async def commit(self):
+        self.sync_session.commit()
+
+    async def rollback(self):
+        self.sync_session.rollback()
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self.sync_session, *args, **kwargs)
+
+
+@asynccontextmanager
+async def write_session():
+    """
+    Session auf der Schreib-Engine. Alle Schreibzugriffe laufen hierüber (Routen, Scanner, Login).
+    Die Verbindung wird erst bei der ersten Abfrage geholt – vorher hashen, nicht mittendrin.
+    """
+    if not DB_ASYNC:
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            yield BlockingAsyncSession(db)
+        finally:
+            db.close()
+        return
+
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_db():
+    async with write_session() as db:
+        yield db
+
+
+# ------------------------------------------------------------
+# 🔹 Eigene Verbindung für das WS-Event-Log (ws_events)
+# ------------------------------------------------------------
+# Die gebündelten Inserts und das Nachholen aus ws_events stehen so nicht in der
+# Warteschlange der Schreib-Engine hinter Benutzer-Schreibzugriffen (und umgekehrt).
+# SQLite vergibt die Schreibsperre trotzdem nacheinander (busy_timeout) – beide
+# Seiten halten sie aber nur für einen kurzen Commit.
+WS_EVENT_DB_POOL_SIZE = int(os.getenv("WS_EVENT_DB_POOL_SIZE", "2"))
+
+
+def _event_engine_options() -> dict:
+    options = _engine_options(ASYNC_DATABASE_URL, ACTIVE_DB_PROFILE, is_async=True)
+    if "pool_size" in options:
+        options.update(pool_size=WS_EVENT_DB_POOL_SIZE, max_overflow=0)
+    return options
+
+
+event_engine = create_async_engine(ASYNC_DATABASE_URL, **_event_engine_options())
+
+if ACTIVE_DB_PROFILE == "sqlite-wal":
+    _apply_sqlite_pragmas(event_engine.sync_engine)
+
+EventSessionLocal = async_sessionmaker(event_engine, autoflush=False, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def event_session():
+    """Session für ws_events – mit DB_ASYNC=0 wie write_session eine blockierende sync Session"""
+    if not DB_ASYNC:
+        async with write_session() as db:
+            yield db
+        return
+
+    async with EventSessionLocal() as db:
+        yield db
+
+
+# ------------------------------------------------------------
+# 🔹 Lese-Replikat (optional, für GET-Listen und Lookups)
+# ------------------------------------------------------------
+# Lokal testbar mit einer zweiten SQLite-Datei oder einem Postgres-Standby
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Nach einem Schreibzugriff liest der Client so lange vom Primary (Read-your-writes)
+READ_PIN_SECONDS = float(os.getenv("READ_PIN_SECONDS", "5"))
+READ_PIN_COOKIE = "db_primary_until"
+
+read_engine = None
+ReadSessionLocal = SessionLocal
+
+if DATABASE_READ_URL:
+    read_profile = _resolve_profile(DATABASE_READ_URL)
+    read_engine = create_engine(
+        DATABASE_READ_URL,
+        **_engine_options(DATABASE_READ_URL, read_profile, is_async=False)
+    )
+    if read_profile == "sqlite-wal":
+        _apply_sqlite_pragmas(read_engine)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+
+def pin_to_primary(response):
+    """Client per Cookie für READ_PIN_SECONDS an den Primary binden (gilt für alle Worker)"""
+    if read_engine is None:
+        return
+    response.set_cookie(
+        READ_PIN_COOKIE,
+        str(time.time() + READ_PIN_SECONDS),
+        max_age=max(1, round(READ_PIN_SECONDS)),
+        httponly=True,
+        samesite="lax",
+    )
+
+
+def is_pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_read_db(request: Request):
+    """Session für reine Lese-Routen – Replikat, außer der Client hat gerade geschrieben"""
+    if read_engine is None or is_pinned_to_primary(request):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ------------------------------------------------------------
+# 🔹 Pool-Statistik (Monitoring)
+# ------------------------------------------------------------
+def _pool_info(pool) -> dict:
+    info = {"pool": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            info[name] = method()
+    return info
+
+
+def pool_stats() -> dict:
+    engines = {
+        "sync": _pool_info(engine.pool),
+        "async": _pool_info(async_engine.pool),
+        "events": _pool_info(event_engine.pool),
+    }
+    if read_engine is not None:
+        engines["read"] = _pool_info(read_engine.pool)
+    return {"profile": ACTIVE_DB_PROFILE, "async_mode": DB_ASYNC, "engines": engines}
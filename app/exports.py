@@ -0,0 +1,130 @@
+# app/exports.py
+
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime
+from itertools import chain, islice
+from typing import Callable, NamedTuple
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from sqlalchemy.orm import Session
+
+# Zeilen pro Fetch (server-seitiger Cursor bei PostgreSQL)
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+
+# Zeilen, aus denen die Spaltenbreite geschätzt wird
+EXPORT_WIDTH_SAMPLE = int(os.getenv("EXPORT_WIDTH_SAMPLE", "200"))
+EXPORT_MAX_WIDTH = 60
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+class ExportColumn(NamedTuple):
+    header: str
+    key: str
+    format: Callable | None = None
+
+
+# ------------------------------------------------------------
+# 🔹 Formatierer
+# ------------------------------------------------------------
+def ja_nein(value) -> str:
+    return "Ja" if value else "Nein"
+
+
+def datum(value) -> str:
+    return value.strftime("%d.%m.%Y %H:%M") if value else ""
+
+
+def oder_strich(value):
+    return value if value is not None else "—"
+
+
+# ------------------------------------------------------------
+# 🔹 Zeilen aus der DB (gestreamt, ohne ORM-Objekte)
+# ------------------------------------------------------------
+def _rows(db: Session, stmt, columns: list[ExportColumn]):
+    result = db.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+    for row in result.mappings():
+        yield [c.format(row[c.key]) if c.format else row[c.key] for c in columns]
+
+
+def _column_widths(columns: list[ExportColumn], sample: list[list]) -> list[int]:
+    widths = []
+    for index, column in enumerate(columns):
+        longest = max((len(str(row[index])) for row in sample if row[index] is not None), default=0)
+        widths.append(min(max(len(column.header), longest) + 2, EXPORT_MAX_WIDTH))
+    return widths
+
+
+def _stream_csv(rows):
+    """CSV mit UTF-8 BOM und Semikolon (öffnet direkt in deutschem Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _write_xlsx(rows, columns: list[ExportColumn], sheet_title: str, sample: list[list]):
+    """
+    Write-only Workbook: Zeilen gehen direkt in eine Temp-Datei, nicht in den Speicher.
+    Spaltenbreiten müssen vor der ersten Zeile stehen → Schätzung aus der Stichprobe.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+
+    for index, width in enumerate(_column_widths(columns, sample), start=1):
+        ws.column_dimensions[get_column_letter(index)].width = width
+
+    ws.append([c.header for c in columns])
+    for row in rows:
+        ws.append(row)
+
+    target = tempfile.TemporaryFile()
+    wb.save(target)
+    target.seek(0)
+    return target
+
+
+def _stream_file(target):
+    try:
+        while chunk := target.read(EXPORT_CHUNK_SIZE):
+            yield chunk
+    finally:
+        target.close()
+
+
+def export_response(db: Session, stmt, columns: list[ExportColumn], name: str, fmt: str = "xlsx",
+                    sheet_title: str | None = None) -> StreamingResponse:
+    """
+    Gemeinsamer Export für Benutzer, Pulver und Bewegungen.
+    `stmt` ist ein Core-Select, dessen Spaltennamen zu den `key`s der Spalten passen.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    headers = {"Content-Disposition": f'attachment; filename="{name}_{today}.{fmt}"'}
+
+    rows = _rows(db, stmt, columns)
+
+    if fmt == "csv":
+        body = _stream_csv(chain([[c.header for c in columns]], rows))
+    else:
+        sample = list(islice(rows, EXPORT_WIDTH_SAMPLE))
+        body = _stream_file(_write_xlsx(chain(sample, rows), columns, sheet_title or name, sample))
+
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[fmt], headers=headers)
@@ -0,0 +1,60 @@
+# app/hashing.py
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.hash import pbkdf2_sha256
+
+# Anzahl paralleler Hash-Berechnungen (pbkdf2 gibt den GIL frei → Threads reichen)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+
+# Obergrenze für laufende + wartende Hash-Aufträge; darüber wird mit 503 abgelehnt
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+
+
+class HashingService:
+    """
+    Führt pbkdf2-Hashing in einem eigenen Worker-Pool aus,
+    damit der Event-Loop (WebSockets, andere Requests) nicht blockiert.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=503,
+                detail="Zu viele gleichzeitige Anmeldungen. Bitte erneut versuchen."
+            )
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    # ----------------------------------------------------
+    # Synchron (für def-Routen im Threadpool)
+    # ----------------------------------------------------
+    def hash(self, password: str) -> str:
+        return self._submit(pbkdf2_sha256.hash, password).result()
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self._submit(pbkdf2_sha256.verify, password, hashed_password).result()
+
+    # ----------------------------------------------------
+    # Asynchron (für async-Routen)
+    # ----------------------------------------------------
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(pbkdf2_sha256.hash, password))
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self._submit(pbkdf2_sha256.verify, password, hashed_password))
+
+
+hashing_service = HashingService()
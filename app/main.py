@@ -1,14 +1,25 @@
-from fastapi import FastAPI, Request
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from app.database import Base, engine
-from app.routes import auth, users, roles, pulver
+from app.database import Base, engine, SessionLocal, pin_to_primary, write_session
+from app.auth import decode_access_token, load_principal
+from app.permissions import permission_registry
+from app.routes import auth, users, roles, pulver, monitoring
 from fastapi import WebSocket
 from .ws_manager import manager
+from .ws_bus import event_bus
 from fastapi import WebSocketDisconnect
 from app.seed_permissions import run_seed
 
+logger = logging.getLogger(__name__)
+
 # *** WICHTIGE KORREKTUR: PATHLIB FÜR ROBUSTE PFADE ***
 from pathlib import Path
 
@@ -20,7 +31,25 @@ Base.metadata.create_all(bind=engine)
 
 run_seed()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Berechtigungen einmal vorab laden – danach nur noch im Hintergrund
+    await run_in_threadpool(permission_registry.rebuild)
+    # Event-Log (seq für Replay) und Event-Bus zwischen den Workern (WS_BUS)
+    await manager.log.start()
+    if event_bus.name != "local" and not manager.log.persist:
+        logger.warning("WS_BUS ohne WS_EVENT_LOG_PERSIST=1: jeder Worker zählt selbst – "
+                       "Reconnects bei einem anderen Worker enden in resync_required")
+    await event_bus.start(manager.deliver_remote)
+    manager.use_bus(event_bus)
+    yield
+    # Offene Sammelfenster noch zustellen
+    await manager.coalescer.flush_all()
+    manager.use_bus(None)
+    await event_bus.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Statische Dateien einbinden
 # Verwenden des absoluten Pfades: BASE_DIR / "static"
@@ -43,22 +72,189 @@ def home(request: Request):
 def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
+# Read-your-writes: nach erfolgreichem Schreibzugriff eine Weile vom Primary lesen
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    response = await call_next(request)
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        pin_to_primary(response)
+    return response
+
 # Router einbinden
 app.include_router(auth.router, prefix="/api", tags=["Auth"])
 app.include_router(roles.router)
 app.include_router(users.router)
 app.include_router(pulver.router)
+app.include_router(monitoring.router)
 
 # --- WEB SOCKETS ---
+def _authenticate_socket(token: str):
+    """JWT beim Verbindungsaufbau prüfen → (Principal, Ablaufzeit)"""
+    db = SessionLocal()
+    try:
+        payload = decode_access_token(token)
+        principal = load_principal(payload, db)
+    finally:
+        db.close()
+    return principal, payload.get("exp")
+
+
+async def _subscribe(websocket: WebSocket, topics: list, since=None, epoch: str = ""):
+    if since is None:
+        current, denied = manager.subscribe(websocket, topics)
+    else:
+        current, denied = await manager.resume(websocket, topics, since, epoch)
+    manager.send(websocket, {"event": "subscribed", "topics": current, "denied": denied, **manager.log.position()})
+
+
+# Globaler Event-Socket: /ws/app?token=<JWT>[&topics=pulver,users][&since=<seq>&epoch=<epoch>]
+# Themen lassen sich jederzeit ändern:
+#   → {"action": "subscribe", "topics": ["pulver"]}
+#   → {"action": "unsubscribe", "topics": ["users"]}
+#   ← {"event": "subscribed", "topics": ["pulver"], "denied": [], "seq": 41, "epoch": "…"}
+# Nach einem Reconnect mit "since" (letzte gesehene seq) und "epoch" aus dem letzten
+# "subscribed" → erst die verpassten Events, dann das "subscribed".
+# Ist die Lücke nicht mehr im Log: ← {"event": "resync_required", "topics": […], …}
 @app.websocket("/ws/app")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = "", topics: str = "",
+                             since: int | None = None, epoch: str = ""):
     try:
+        principal, expires_at = await run_in_threadpool(_authenticate_socket, token)
+    except HTTPException as exc:
+        # Erst annehmen, dann schließen – sonst antwortet der Server mit HTTP 403
+        # und der Browser sieht den Code 4401 nie (→ Reconnect-Schleife)
+        await websocket.accept()
+        await websocket.close(code=4401, reason=str(exc.detail))
+        return
+
+    await manager.connect(websocket, principal.role_id, expires_at)
+
+    try:
+        if topics:
+            await _subscribe(websocket, [t for t in topics.split(",") if t], since, epoch)
+
         while True:
-            await websocket.receive_text()
+            raw = await websocket.receive_text()
+
+            try:
+                command = json.loads(raw)
+                requested = command.get("topics")
+                if not isinstance(requested, list) or not all(isinstance(t, str) for t in requested):
+                    raise ValueError
+            except (ValueError, AttributeError):
+                manager.send(websocket, {"event": "error", "detail": "Ungültige Nachricht"})
+                continue
+
+            action = command.get("action")
+            if action == "subscribe":
+                since = command.get("since")
+                if since is not None and (not isinstance(since, int) or isinstance(since, bool)):
+                    manager.send(websocket, {"event": "error", "detail": "since muss eine Zahl sein"})
+                    continue
+                await _subscribe(websocket, requested, since, str(command.get("epoch") or ""))
+            elif action == "unsubscribe":
+                current = manager.unsubscribe(websocket, requested)
+                manager.send(websocket, {"event": "subscribed", "topics": current, "denied": [], **manager.log.position()})
+            else:
+                manager.send(websocket, {"event": "error", "detail": "Unbekannte Aktion"})
+
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Auch bei unerwarteten Fehlern: Client, Writer-Task und Abos freigeben
         manager.disconnect(websocket)
 
+# --- SCANNER WEB SOCKET ---
+# Handscanner verbinden sich einmal mit ?token=<JWT> und senden danach beliebig
+# viele (auch gepipelinete) Track-Kommandos ohne HTTP-/Auth-Overhead pro Scan:
+#   → {"id": "c1", "action": "track", "barcode": "OZS-00001", "menge_neu": 12.5, "beschreibung": "…"}
+#   ← {"id": "c1", "status": "ok", "menge_alt": 15.0, "menge_neu": 12.5}
+#   ← {"id": "c1", "status": "error", "code": 404, "detail": "Pulver nicht gefunden"}
+SCANNER_PERMISSION = "pulver.track"
+
+
+def _authenticate_scanner(token: str):
+    """Token + Berechtigung einmalig beim Verbindungsaufbau prüfen"""
+    principal, expires_at = _authenticate_socket(token)
+
+    if not permission_registry.has_permission(principal.role_id, SCANNER_PERMISSION):
+        raise HTTPException(status_code=403, detail=f"Fehlende Berechtigung: {SCANNER_PERMISSION}")
+
+    return principal, expires_at
+
+
+async def _scanner_track(command: dict, user_id: int) -> tuple[dict, dict]:
+    """Eine Buchung mit derselben Logik wie POST /api/pulver/track (über die Schreib-Engine)"""
+    barcode = command.get("barcode")
+    menge_neu = command.get("menge_neu")
+    beschreibung = command.get("beschreibung") or "Normaler Verbrauch"
+
+    async with write_session() as db:
+        pulver_obj, menge_alt = await db.run_sync(pulver.record_movement, barcode, menge_neu, beschreibung, user_id)
+    event = pulver.tracked_event(pulver_obj, barcode, menge_neu)
+
+    ack = {"status": "ok", "menge_alt": menge_alt, "menge_neu": menge_neu}
+    return ack, event
+
+
+@app.websocket("/ws/scanner")
+async def scanner_websocket(websocket: WebSocket, token: str = ""):
+    try:
+        principal, expires_at = await run_in_threadpool(_authenticate_scanner, token)
+    except HTTPException as exc:
+        # Erst annehmen, dann schließen – sonst lehnt der Server den Handshake mit HTTP 403 ab
+        # und der Scanner sieht den Close-Code nie
+        await websocket.accept()
+        await websocket.close(code=4403 if exc.status_code == 403 else 4401, reason=str(exc.detail))
+        return
+
+    await websocket.accept()
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+
+            try:
+                command = json.loads(raw)
+                if not isinstance(command, dict):
+                    raise ValueError
+            except ValueError:
+                await websocket.send_json({"id": None, "status": "error", "code": 400, "detail": "Ungültiges JSON"})
+                continue
+
+            command_id = command.get("id")
+
+            # Token ist nur für seine Laufzeit gültig – danach Verbindung beenden
+            if expires_at and time.time() >= expires_at:
+                await websocket.send_json({"id": command_id, "status": "error", "code": 401, "detail": "Token abgelaufen"})
+                await websocket.close(code=4401)
+                return
+
+            if command.get("action") != "track":
+                await websocket.send_json({"id": command_id, "status": "error", "code": 400, "detail": "Unbekannte Aktion"})
+                continue
+
+            # Kommandos werden in Empfangsreihenfolge gebucht
+            try:
+                ack, event = await _scanner_track(command, principal.id)
+            except HTTPException as exc:
+                await websocket.send_json({"id": command_id, "status": "error", "code": exc.status_code, "detail": exc.detail})
+                continue
+            except Exception:
+                # DB-Fehler, Sperr-Timeout, … – Verbindung bleibt, der Scanner bekommt sein Ack
+                logger.exception("Scanner-Buchung fehlgeschlagen (Kommando %s)", command_id)
+                await websocket.send_json({"id": command_id, "status": "error", "code": 500, "detail": "Interner Fehler"})
+                continue
+
+            await websocket.send_json({"id": command_id, **ack})
+            asyncio.create_task(manager.broadcast(event))
+
+    except WebSocketDisconnect:
+        pass
+
 # ******************************************************************
 # *** WICHTIGSTE HINZUFÜGUNG: CATCH-ALL ROUTER FÜR SPA FALLBACK ***
 # ******************************************************************
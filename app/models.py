@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -10,6 +10,7 @@ class Role(Base):
     description = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Optimistic Locking
 
     # Beziehung: eine Rolle hat viele Benutzer
     users = relationship("User", back_populates="role")
@@ -46,6 +47,7 @@ class User(Base):
     must_change_password = Column(Boolean, default=False)
     deleted = Column(Boolean, default=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Optimistic Locking
 
     role = relationship("Role", back_populates="users")
 
@@ -69,6 +71,8 @@ class Pulver(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0", index=True)  # Delta-Sync-Cursor
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Optimistic Locking
 
     # Beziehungen
     creator = relationship("User", back_populates="pulver_created")
@@ -91,9 +95,24 @@ class PulverBewegung(Base):
     pulver = relationship("Pulver", back_populates="bewegungen")
     user = relationship("User")
 
+    # Keyset-Pagination der Historie nach (datum, id) – je Pulver, je Benutzer und global
+    __table_args__ = (
+        Index("ix_pulver_bewegung_pulver_datum", "pulver_id", "datum", "id"),
+        Index("ix_pulver_bewegung_user_datum", "user_id", "datum", "id"),
+        Index("ix_pulver_bewegung_datum", "datum", "id"),
+    )
+
 
 User.pulver_created = relationship("Pulver", back_populates="creator")
 
+
+class ChangeCounter(Base):
+    """Monoton steigender Zähler je Bereich (z. B. "pulver") für den Delta-Sync"""
+    __tablename__ = "change_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
 class Lock(Base):
     __tablename__ = "locks"
 
@@ -103,4 +122,13 @@ class Lock(Base):
     locked_by = Column(Integer, ForeignKey("users.id"), nullable=False)
     locked_at = Column(DateTime, default=datetime.utcnow)
 
-    user = relationship("User", backref="locks")
\ No newline at end of file
+    user = relationship("User", backref="locks")
+
+class WsEvent(Base):
+    """Persistierter Schwanz des WS-Event-Logs (optional, WS_EVENT_LOG_PERSIST=1)"""
+    __tablename__ = "ws_events"
+
+    seq = Column(Integer, primary_key=True)        # globale Sequenznummer
+    topic = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)         # Event-JSON ohne "seq"
+    created_at = Column(DateTime, default=datetime.utcnow)
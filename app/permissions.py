@@ -0,0 +1,126 @@
+# app/permissions.py
+
+import logging
+import threading
+import time
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Permission, RolePermission
+from app.ws_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Sicherheitsnetz: auch ohne Nachricht spätestens nach dieser Zeit neu laden
+# (z. B. wenn eine Bus-Nachricht verloren ging)
+REGISTRY_MAX_AGE_SECONDS = 60
+
+# Steuer-Nachricht an die anderen Worker: Rollen/Permissions geändert → neu laden
+PERMISSIONS_CHANGED = "permissions_changed"
+
+
+class PermissionRegistry:
+    """
+    Hält pro Rolle eine vorkompilierte Bitmaske aller Berechtigungen im Speicher.
+
+    Jede Permission bekommt die feste Bitposition ``Permission.id`` – damit bleibt
+    die Position auch nach einem Neuaufbau stabil. Die Prüfung im Request ist
+    danach nur noch ein einzelnes Integer-AND, ohne DB-Zugriff.
+
+    Nur der allererste Aufbau läuft synchron (beim Start). Danach wird in einem
+    Hintergrund-Thread neu geladen – bis dahin gilt der bisherige Stand, kein
+    Aufrufer (auch nicht im Event-Loop) wartet auf die Datenbank.
+    """
+
+    def __init__(self, max_age: float = REGISTRY_MAX_AGE_SECONDS):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # (name → bit, role_id → maske) werden immer gemeinsam ausgetauscht
+        self._state: tuple[dict[str, int], dict[int, int]] | None = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+
+    # ----------------------------------------------------
+    # Aufbau / Invalidierung
+    # ----------------------------------------------------
+    def rebuild(self, db: Session | None = None):
+        """Bitmasken komplett aus der Datenbank neu aufbauen"""
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            bits = {name: 1 << pid for pid, name in db.query(Permission.id, Permission.name).all()}
+
+            masks: dict[int, int] = {}
+            for role_id, permission_id in db.query(RolePermission.role_id, RolePermission.permission_id).all():
+                if role_id is None or permission_id is None:
+                    continue
+                masks[role_id] = masks.get(role_id, 0) | (1 << permission_id)
+        finally:
+            if own_session:
+                db.close()
+
+        with self._lock:
+            self._state = (bits, masks)
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """Beim nächsten Zugriff (im Hintergrund) neu laden"""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def refresh_in_background(self):
+        """Neu laden in einem eigenen Thread – höchstens ein Lauf gleichzeitig"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="permission-registry", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Permission-Registry konnte nicht neu geladen werden")
+            with self._lock:
+                self._loaded_at = time.monotonic()  # erst nach max_age erneut versuchen
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _get_state(self):
+        state = self._state
+        if state is None:
+            # Erster Zugriff → einmal synchron laden (main.py macht das beim Start)
+            self.rebuild()
+            return self._state
+        if time.monotonic() - self._loaded_at > self.max_age:
+            self.refresh_in_background()
+        return state
+
+    # ----------------------------------------------------
+    # Abfragen
+    # ----------------------------------------------------
+    def role_mask(self, role_id: int | None) -> int:
+        _, masks = self._get_state()
+        return masks.get(role_id, 0)
+
+    def has_permission(self, role_id: int | None, permission_name: str) -> bool:
+        bits, masks = self._get_state()
+        bit = bits.get(permission_name)
+        if bit is None:
+            return False
+        return bool(masks.get(role_id, 0) & bit)
+
+    def permission_names(self, role_id: int | None) -> list[str]:
+        """Alle Permission-Namen einer Rolle (sortiert nach Permission-ID)"""
+        bits, masks = self._get_state()
+        mask = masks.get(role_id, 0)
+        return [name for name, bit in sorted(bits.items(), key=lambda item: item[1]) if mask & bit]
+
+    def permission_ids(self, role_id: int | None) -> set[int]:
+        mask = self.role_mask(role_id)
+        return {pid for pid in range(mask.bit_length()) if mask >> pid & 1}
+
+
+permission_registry = PermissionRegistry()
+event_bus.on_control(PERMISSIONS_CHANGED, lambda data: permission_registry.refresh_in_background())
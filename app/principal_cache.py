@@ -0,0 +1,97 @@
+# app/principal_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from app.models import User
+from app.ws_bus import event_bus
+
+PRINCIPAL_CACHE_TTL_SECONDS = 30
+PRINCIPAL_CACHE_MAX_ENTRIES = 1024
+
+# Steuer-Nachricht an die anderen Worker (Daten: user_id)
+PRINCIPAL_INVALIDATED = "principal_invalidated"
+
+
+class Principal:
+    """
+    Schlanke, sessionunabhängige Kopie des angemeldeten Benutzers.
+    Enthält nur die Felder, die Auth-Prüfungen und Routen benötigen.
+    """
+
+    __slots__ = ("id", "username", "role_id", "role_name", "active", "deleted", "must_change_password")
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.username = user.username
+        self.role_id = user.role_id
+        self.role_name = user.role.name if user.role else None
+        self.active = user.active
+        self.deleted = user.deleted
+        self.must_change_password = user.must_change_password
+
+
+class PrincipalCache:
+    """
+    Begrenzter LRU-Cache mit TTL für authentifizierte Benutzer.
+    Schlüssel ist (username, iat) – ein neues Token erzeugt also immer einen neuen Eintrag.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, Principal]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str, issued_at) -> Principal | None:
+        key = (username, issued_at)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, username: str, issued_at, principal: Principal):
+        with self._lock:
+            self._entries[(username, issued_at)] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end((username, issued_at))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """
+        Alle Einträge eines Benutzers sofort verwerfen (z. B. nach Änderung / Löschung) –
+        in diesem Prozess und per Event-Bus in allen anderen Workern.
+        """
+        self.drop_user(user_id)
+        event_bus.notify(PRINCIPAL_INVALIDATED, str(user_id))
+
+    def drop_user(self, user_id: int):
+        """Einträge eines Benutzers nur in diesem Prozess verwerfen"""
+        with self._lock:
+            for key in [k for k, (_, p) in self._entries.items() if p.id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+principal_cache = PrincipalCache()
+event_bus.on_control(PRINCIPAL_INVALIDATED, lambda data: principal_cache.drop_user(int(data)))
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
 from datetime import datetime
-from app.database import get_db
-from app.models import User, Permission, RolePermission
-from app.auth import create_access_token, verify_password, get_current_user, hash_password, oauth2_scheme
+from app.database import write_session
+from app.models import User
+from app.permissions import permission_registry
+from app.principal_cache import principal_cache
+from app.auth import create_access_token, verify_password_async, get_current_user, hash_password_async, oauth2_scheme
 from pydantic import BaseModel, Field
 from app.auth import SECRET_KEY, ALGORITHM      
 from jose import jwt                            
@@ -15,13 +17,15 @@ from jose.exceptions import ExpiredSignatureError, JWTError
 router = APIRouter()
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    # Zwei kurze Sessions statt einer: die Schreib-Verbindung nicht über das Hashing halten
+    async with write_session() as db:
+        user = await db.scalar(select(User).where(User.username == form_data.username))
 
     if not user or user.deleted or not user.active:
         raise HTTPException(status_code=400, detail="Ungültiger Benutzer oder deaktiviert")
 
-    if not verify_password(form_data.password, user.password_hash):
+    if not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(status_code=400, detail="Falsches Passwort")
 
     if user.must_change_password is None or user.must_change_password is True:
@@ -32,15 +36,13 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
         }
     
     # last_login aktualisieren
-    user.last_login = datetime.utcnow()
-    db.commit()
+    async with write_session() as db:
+        await db.execute(update(User).where(User.id == user.id).values(last_login=datetime.utcnow()))
+        await db.commit()
 
     token = create_access_token({"sub": user.username})
 
-    role_permissions = [
-        rp.permission.name
-        for rp in user.role.permissions
-    ]
+    role_permissions = permission_registry.permission_names(user.role_id)
 
     return {
         "access_token": token,
@@ -57,17 +59,9 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 
 
 @router.get("/me")
-def get_me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    
-    perms = (
-        db.query(Permission.name)
-        .join(RolePermission, Permission.id == RolePermission.permission_id)
-        .filter(RolePermission.role_id == current_user.role_id)
-        .all()
-    )
-
+def get_me(current_user: User = Depends(get_current_user)):
 
-    permission_list = [p[0] for p in perms]
+    permission_list = permission_registry.permission_names(current_user.role_id)
 
     return {
         "id": current_user.id,
@@ -87,16 +81,14 @@ class PasswordChangeRequest(BaseModel):
 
 
 @router.post("/change_password")
-def change_password(
-    data: PasswordChangeRequest,
-    db: Session = Depends(get_db)
-):
-    user = db.query(User).filter(User.username == data.username).first()
+async def change_password(data: PasswordChangeRequest):
+    async with write_session() as db:
+        user = await db.scalar(select(User).where(User.username == data.username))
     if not user:
         raise HTTPException(status_code=404, detail="Benutzer nicht gefunden")
 
     # Altes Passwort prüfen
-    if not verify_password(data.old_password, user.password_hash):
+    if not await verify_password_async(data.old_password, user.password_hash):
         raise HTTPException(status_code=400, detail="Das alte Passwort ist falsch")
 
     # Neue Passwörter vergleichen
@@ -110,11 +102,16 @@ def change_password(
     if data.new_password == data.old_password:
         raise HTTPException(status_code=400, detail="Das neue Passwort darf nicht dem alten entsprechen")
 
-    # Neues Passwort setzen
-    user.password_hash = hash_password(data.new_password)
-    user.must_change_password = False
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Neues Passwort setzen (erst hashen, dann kurz schreiben)
+    password_hash = await hash_password_async(data.new_password)
+    async with write_session() as db:
+        await db.execute(update(User).where(User.id == user.id).values(
+            password_hash=password_hash,
+            must_change_password=False,
+            last_login=datetime.utcnow(),
+        ))
+        await db.commit()
+    principal_cache.invalidate_user(user.id)
 
     return {"message": "Passwort erfolgreich geändert"}
 
@@ -0,0 +1,43 @@
+# app/routes/monitoring.py
+
+from fastapi import APIRouter, Depends
+from app.auth import get_current_user, require_permission
+from app.database import pool_stats
+from app.principal_cache import principal_cache
+from app.single_flight import single_flight
+from app.utils import barcode_cache
+from app.ws_manager import manager
+
+router = APIRouter(
+    prefix="/api/monitoring",
+    tags=["Monitoring"],
+    dependencies=[Depends(get_current_user)]
+)
+
+
+# ------------------------------------------------------------
+# 🔹 1. Datenbank-Pools (Profil, belegte / freie Verbindungen)
+# ------------------------------------------------------------
+@router.get("/db", dependencies=[Depends(require_permission("system.monitor"))])
+def get_db_pool_stats():
+    return pool_stats()
+
+
+# ------------------------------------------------------------
+# 🔹 2. WebSocket-Fan-out (Verbindungen, Queues, Slow Consumer, Sammelfenster)
+# ------------------------------------------------------------
+@router.get("/ws", dependencies=[Depends(require_permission("system.monitor"))])
+def get_ws_stats():
+    return manager.stats()
+
+
+# ------------------------------------------------------------
+# 🔹 3. Caches und Request-Coalescing (Trefferquote pro Prozess)
+# ------------------------------------------------------------
+@router.get("/caches", dependencies=[Depends(require_permission("system.monitor"))])
+def get_cache_stats():
+    return {
+        "principal": principal_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "barcode": barcode_cache.stats(),
+    }
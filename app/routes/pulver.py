@@ -1,17 +1,30 @@
 # app/routes/pulver.py
 
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
+from sqlalchemy import and_, func, insert, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app.auth import get_current_user, require_permission
 from sqlalchemy.exc import IntegrityError
-from app.utils import generate_barcode_base64
-from app.database import get_db
+from app.utils import barcode_cache, render_barcodes_parallel, BARCODE_MEDIA_TYPES, encode_cursor, decode_cursor, like_pattern
+from app.database import get_db, get_async_db, get_read_db
 from app.models import Pulver, PulverBewegung, User
-from fastapi.responses import HTMLResponse
+from app.zpl import render_label_zpl, ZPL_MEDIA_TYPE
+from app.change_tracking import next_change_seq, current_change_seq, versioned_update, parse_version
+from app.single_flight import single_flight, request_scope_key
+from app.serialization import rows_to_dicts
+from app.analytics import movement_statement, movement_schema, stream_movements, ANALYTICS_MEDIA_TYPES
+from app.exports import ExportColumn, export_response, ja_nein, datum, oder_strich
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.templating import Jinja2Templates
 from ..ws_manager import manager
 import asyncio
+import base64
+import math
+import os
+import threading
 from fastapi import Query
 
 templates = Jinja2Templates(directory="app/templates")
@@ -25,38 +38,186 @@ router = APIRouter(
 # ------------------------------------------------------------
 # 🔹 1. Alle Pulver abrufen  (geschützt)
 # ------------------------------------------------------------
-@router.get("/", dependencies=[Depends(get_current_user)])
+# Sortierbare Spalten → SQL-Ausdruck (NULL wird für stabiles Keyset ersetzt)
+PULVER_SORT_COLUMNS = {
+    "id": Pulver.id,
+    "barcode": Pulver.barcode,
+    "artikelnummer": Pulver.artikelnummer,
+    "hersteller": func.coalesce(Pulver.hersteller, ""),
+    "farbe": func.coalesce(Pulver.farbe, ""),
+    "qualitaet": func.coalesce(Pulver.qualitaet, ""),
+    "lagerort": func.coalesce(Pulver.lagerort, ""),
+    "menge_kg": func.coalesce(Pulver.menge_kg, 0.0),
+    "created_at": Pulver.created_at,
+}
+
+# Spalten der Freitextsuche (entspricht der bisherigen Filterung in pulverlager.js)
+PULVER_SEARCH_COLUMNS = [
+    Pulver.barcode, Pulver.artikelnummer, Pulver.hersteller, Pulver.farbe,
+    Pulver.qualitaet, Pulver.oberflaeche, Pulver.anwendung,
+]
+
+
+# Felder der Listenansicht – die Liste selektiert nur diese Spalten
+PULVER_LIST_FIELDS = (
+    "id", "barcode", "artikelnummer", "hersteller", "farbe", "qualitaet", "oberflaeche",
+    "anwendung", "start_menge_kg", "menge_kg", "lagerort", "aktiv", "created_by", "created_at",
+)
+PULVER_LIST_COLUMNS = [getattr(Pulver, field) for field in PULVER_LIST_FIELDS]
+
+
+def _pulver_to_dict(p: Pulver) -> dict:
+    return {field: getattr(p, field) for field in PULVER_LIST_FIELDS}
+
+
+def _pulver_change(p: Pulver) -> dict:
+    """Zeile für Delta-Sync und WS-Events – gelöschte Pulver als Tombstone"""
+    if p.deleted:
+        return {"id": p.id, "deleted": True, "change_seq": p.change_seq}
+    return jsonable_encoder({**_pulver_to_dict(p), "deleted": False, "change_seq": p.change_seq})
+
+
+@router.get("/")
 def get_all_pulver(
+    request: Request,
     show_inactive: bool = Query(False),
-    db: Session = Depends(get_db)
+    hersteller: str | None = Query(None),
+    farbe: str | None = Query(None),
+    qualitaet: str | None = Query(None),
+    lagerort: str | None = Query(None),
+    aktiv: bool | None = Query(None, description="Überschreibt show_inactive, wenn gesetzt"),
+    q: str | None = Query(None, description="Freitextsuche über Barcode, Artikelnummer, Hersteller, Farbe, …"),
+    sort: str = Query("id"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Seitengröße – ohne limit/cursor kommt die komplette Liste"),
+    cursor: str | None = Query(None),
+    include_total: bool = Query(False, description="Gesamtanzahl mitzählen (zusätzliche COUNT-Abfrage)"),
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_user)
 ):
-    query = db.query(Pulver).filter(Pulver.deleted == False)
+    if sort not in PULVER_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Ungültige Sortierung: {sort}")
+
+    def build():
+        # Stand VOR dem Lesen → Startpunkt für /changes?since=…
+        headers = {"X-Change-Cursor": str(current_change_seq(db))}
+        payload = _query_pulver_list(
+            db, show_inactive, hersteller, farbe, qualitaet, lagerort, aktiv,
+            q, sort, order, limit, cursor, include_total,
+        )
+        return payload, headers
+
+    # Gleichzeitige identische Abfragen (z. B. nach einem WS-Event) teilen sich ein Ergebnis
+    return single_flight.json_response("pulver", request_scope_key(request, current_user), build)
+
+
+def _query_pulver_list(db: Session, show_inactive, hersteller, farbe, qualitaet, lagerort, aktiv,
+                       q, sort, order, limit, cursor, include_total):
+    # Nur die benötigten Spalten als Row-Tupel (keine ORM-Objekte / Identity-Map)
+    query = select(*PULVER_LIST_COLUMNS).where(Pulver.deleted == False)
 
     # Standardansicht: nur aktive Pulver
-    if not show_inactive:
-        query = query.filter(Pulver.aktiv == True)
-
-    pulver = query.all()
-
-    result = []
-    for p in pulver:
-        result.append({
-            "id": p.id,
-            "barcode": p.barcode,
-            "artikelnummer": p.artikelnummer,
-            "hersteller": p.hersteller,
-            "farbe": p.farbe,
-            "qualitaet": p.qualitaet,
-            "oberflaeche": p.oberflaeche,
-            "anwendung": p.anwendung,
-            "start_menge_kg": p.start_menge_kg,
-            "menge_kg": p.menge_kg,
-            "lagerort": p.lagerort,
-            "aktiv": p.aktiv,
-            "created_by": p.created_by,
-            "created_at": p.created_at,
-        })
-    return result
+    if aktiv is not None:
+        query = query.where(Pulver.aktiv == aktiv)
+    elif not show_inactive:
+        query = query.where(Pulver.aktiv == True)
+
+    # Spaltenfilter (Teilstring, Groß-/Kleinschreibung egal)
+    for column, value in (
+        (Pulver.hersteller, hersteller),
+        (Pulver.farbe, farbe),
+        (Pulver.qualitaet, qualitaet),
+        (Pulver.lagerort, lagerort),
+    ):
+        if value:
+            query = query.where(column.ilike(like_pattern(value), escape="\\"))
+
+    if q:
+        pattern = like_pattern(q)
+        query = query.where(or_(*(c.ilike(pattern, escape="\\") for c in PULVER_SEARCH_COLUMNS)))
+
+    sort_expr = PULVER_SORT_COLUMNS[sort]
+    descending = order == "desc"
+
+    # Abwärtskompatibel: ohne limit/cursor die komplette Liste wie bisher
+    if limit is None and cursor is None:
+        if sort != "id" or descending:
+            query = query.order_by(*_keyset_order(sort_expr, descending))
+        return rows_to_dicts(db.execute(query))
+
+    limit = limit or 100
+    total = db.scalar(select(func.count()).select_from(query.subquery())) if include_total else None
+
+    # Keyset: (sortwert, id) des letzten Eintrags der vorigen Seite
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor)
+            if sort == "created_at":
+                last_value = datetime.fromisoformat(last_value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+        if descending:
+            query = query.where(or_(sort_expr < last_value, and_(sort_expr == last_value, Pulver.id < last_id)))
+        else:
+            query = query.where(or_(sort_expr > last_value, and_(sort_expr == last_value, Pulver.id > last_id)))
+
+    rows = rows_to_dicts(db.execute(query.order_by(*_keyset_order(sort_expr, descending)).limit(limit + 1)))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([_sort_value(last, sort), last["id"]])
+
+    return {
+        "items": rows,
+        "next_cursor": next_cursor,
+        "total": total,
+    }
+
+
+def _keyset_order(sort_expr, descending: bool):
+    if descending:
+        return sort_expr.desc(), Pulver.id.desc()
+    return sort_expr.asc(), Pulver.id.asc()
+
+
+def _sort_value(p: dict, sort: str):
+    """Sortwert eines Eintrags – muss zum coalesce in PULVER_SORT_COLUMNS passen"""
+    value = p[sort]
+    if value is None:
+        return 0.0 if sort == "menge_kg" else ""
+    return value
+
+# ------------------------------------------------------------
+# 🔹 1.1 Änderungen seit Cursor abrufen (Delta-Sync, geschützt)
+# ------------------------------------------------------------
+@router.get("/changes", dependencies=[Depends(get_current_user)])
+def get_pulver_changes(
+    since: int = Query(0, ge=0, description="Letzter bekannter change_seq (X-Change-Cursor / WS-Event)"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    Liefert alle Pulver, die nach `since` geändert wurden – gelöschte als Tombstone.
+    Bei has_more=true mit dem zurückgegebenen cursor erneut abfragen.
+    """
+    rows = (
+        db.query(Pulver)
+        .filter(Pulver.change_seq > since)
+        .order_by(Pulver.change_seq.asc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "changes": [_pulver_change(p) for p in rows],
+        "cursor": rows[-1].change_seq if rows else since,
+        "has_more": has_more,
+    }
 
 # ------------------------------------------------------------
 # 🔹 2. Neues Pulver anlegen  (geschützt)
@@ -64,7 +225,7 @@ def get_all_pulver(
 @router.post("/", dependencies=[Depends(get_current_user)])
 async def create_pulver(
     data: dict = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
 
@@ -76,12 +237,12 @@ async def create_pulver(
     if not artikelnummer or not hersteller:
         raise HTTPException(status_code=400, detail="Artikelnummer und Hersteller sind Pflichtfelder")
 
-    existing = db.query(Pulver).filter(Pulver.artikelnummer == artikelnummer).first()
+    existing = await db.scalar(select(Pulver.id).where(Pulver.artikelnummer == artikelnummer))
     if existing:
         raise HTTPException(status_code=400, detail=f"Artikelnummer '{artikelnummer}' existiert bereits")
 
-    last_pulver = db.query(Pulver).order_by(Pulver.id.desc()).first()
-    next_id = (last_pulver.id + 1) if last_pulver else 1
+    last_id = await db.scalar(select(func.max(Pulver.id)))
+    next_id = (last_id + 1) if last_id else 1
     barcode = f"OZS-{next_id:05d}"
 
     new_pulver = Pulver(
@@ -100,22 +261,28 @@ async def create_pulver(
         created_by=current_user.id,
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow(),
+        # Sync-Helfer laufen per run_sync auf derselben Verbindung
+        change_seq=await db.run_sync(next_change_seq),
     )
 
     try:
         db.add(new_pulver)
-        db.commit()
-        db.refresh(new_pulver)
+        await db.commit()
+        await db.refresh(new_pulver)
 
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Fehler: Artikelnummer oder Barcode bereits vorhanden")
     
+    single_flight.bump("pulver")
+
     asyncio.create_task(manager.broadcast({
         "event": "pulver_created",
         "id": new_pulver.id,
         "barcode": new_pulver.barcode,
         "artikelnummer": new_pulver.artikelnummer,
+        "change_seq": new_pulver.change_seq,
+        "pulver": _pulver_change(new_pulver),
     }))
 
     return {
@@ -132,128 +299,628 @@ async def create_pulver(
 # ------------------------------------------------------------
 # 🔹 3. Pulver bearbeiten  (geschützt)
 # ------------------------------------------------------------
+PULVER_EDIT_FIELDS = ["artikelnummer", "hersteller", "farbe", "qualitaet", "oberflaeche", "anwendung", "start_menge_kg", "lagerort", "aktiv"]
+
+
 @router.put("/{pulver_id}", dependencies=[Depends(get_current_user)])
-async def update_pulver(pulver_id: int, data: dict = Body(...), db: Session = Depends(get_db)):
-    pulver = db.query(Pulver).filter(Pulver.id == pulver_id, Pulver.deleted == False).first()
-    if not pulver:
-        raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
+async def update_pulver(pulver_id: int, data: dict = Body(...), db: AsyncSession = Depends(get_async_db)):
+    # 🟡 1. Optimistic Locking: Version muss mitgeschickt werden
+    client_version = parse_version(data, required=True)
 
-    # 🟡 1. Optimistic Locking: Prüfen, ob updated_at mitgeschickt wurde
-    client_timestamp = data.get("updated_at")
-    if not client_timestamp:
-        raise HTTPException(status_code=400, detail="updated_at - Wert fehlt (Optimistic Locking)")
+    values = {field: data[field] for field in PULVER_EDIT_FIELDS if field in data}
+    values["updated_at"] = datetime.utcnow()
+    values["change_seq"] = await db.run_sync(next_change_seq)
 
-    # 🟡 2. Vergleich mit DB-Wert
-    #    wir wandeln beide in ISO-Strings um, damit alles konsistent ist
-    server_timestamp = pulver.updated_at.isoformat()
+    # 🟢 2. Ein UPDATE … WHERE id=? AND version=? – greift nur bei unveränderter Version
+    try:
+        pulver = await db.run_sync(versioned_update, Pulver, pulver_id, client_version, values, Pulver.deleted == False)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Fehler: Artikelnummer bereits vorhanden")
 
-    if client_timestamp != server_timestamp:
+    if pulver is None:
+        await db.rollback()
+        if not await db.scalar(select(Pulver.id).where(Pulver.id == pulver_id, Pulver.deleted == False)):
+            raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
         raise HTTPException(
             status_code=409,
             detail="Der Datensatz wurde inzwischen von einem anderen Benutzer geändert."
         )
 
-    # 🟢 3. Wenn Version OK → Änderungen übernehmen
-    for field in ["artikelnummer", "hersteller", "farbe", "qualitaet", "oberflaeche", "anwendung", "start_menge_kg", "lagerort", "aktiv"]:
-        if field in data:
-            setattr(pulver, field, data[field])
+    await db.commit()
 
-    pulver.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(pulver)
+    single_flight.bump("pulver")
 
     asyncio.create_task(manager.broadcast({
         "event": "pulver_updated",
-        "id": pulver.id
+        "id": pulver.id,
+        "change_seq": pulver.change_seq,
+        "pulver": _pulver_change(pulver),
     }))
 
     return {
         "message": "Pulver erfolgreich aktualisiert",
         "id": pulver.id,
-        "updated_at": pulver.updated_at  # Wichtig für das Frontend
+        "updated_at": pulver.updated_at,
+        "version": pulver.version  # Wichtig für das Frontend
     }
 
 # ------------------------------------------------------------
 # 🔹 4. Pulver Label erstellen  (öffentliche Route!)
 # ------------------------------------------------------------
 @router.get("/{pulver_id}/label", response_class=HTMLResponse)
-def get_label(pulver_id: int, db: Session = Depends(get_db)):
+def get_label(
+    pulver_id: int,
+    format: str = Query("html", pattern="^(html|zpl)$", description="html (Browserdruck) oder zpl (Zebra-Drucker)"),
+    db: Session = Depends(get_db)
+):
     pulver = db.query(Pulver).filter_by(id=pulver_id).first()
     if not pulver:
         raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
 
-    barcode_image = generate_barcode_base64(pulver.barcode)
+    # Thermodrucker: natives ZPL, Barcode erzeugt der Drucker selbst
+    if format == "zpl":
+        return Response(content=render_label_zpl(pulver), media_type=ZPL_MEDIA_TYPE)
 
+    # Barcode wird per URL eingebunden (cachebar, kein Base64 im HTML)
     return templates.TemplateResponse(
         "etikett.html",
         {
             "request": {},
             "pulver": pulver,
-            "barcode_image": barcode_image,
+            "barcode_url": f"/api/pulver/{pulver.id}/barcode.png",
         },
     )
 
+# ------------------------------------------------------------
+# 🔹 4.1 Barcode-Bild als PNG/SVG  (öffentliche Route!)
+# ------------------------------------------------------------
+@router.get("/{pulver_id}/barcode.{fmt}")
+def get_barcode_image(pulver_id: int, fmt: str, request: Request, db: Session = Depends(get_db)):
+    if fmt not in BARCODE_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Format nicht unterstützt (png, svg)")
+
+    code = db.query(Pulver.barcode).filter(Pulver.id == pulver_id).scalar()
+    if not code:
+        raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
+
+    data, digest = barcode_cache.get(code, fmt)
+
+    # Der Barcode eines Pulvers ändert sich nie → Browser darf dauerhaft cachen
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=data, media_type=BARCODE_MEDIA_TYPES[fmt], headers=headers)
+
+# ------------------------------------------------------------
+# 🔹 4.2 Sammeldruck: mehrere Labels in einem Dokument  (geschützt)
+# ------------------------------------------------------------
+MAX_LABELS_PER_BATCH = 500
+
+# Gleichzeitige Sammeldrucke – jeder belegt bis zu MAX_LABELS_PER_BATCH Jobs im Render-Prozesspool
+MAX_CONCURRENT_LABEL_BATCHES = int(os.getenv("MAX_CONCURRENT_LABEL_BATCHES", "2"))
+_label_batch_slots = threading.BoundedSemaphore(MAX_CONCURRENT_LABEL_BATCHES)
+
+
+class _LabelSheetResponse(StreamingResponse):
+    """Gibt den Sammeldruck-Platz frei, sobald die Antwort fertig oder abgebrochen ist"""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _label_batch_slots.release()
+
+
+@router.get("/labels", response_class=HTMLResponse, dependencies=[Depends(require_permission("powder.label"))])
+def get_labels(
+    ids: list[int] | None = Query(None, description="Pulver-IDs, z. B. ?ids=1&ids=2"),
+    from_barcode: str | None = Query(None, description="Barcode-Bereich von (inkl.), z. B. OZS-00010"),
+    to_barcode: str | None = Query(None, description="Barcode-Bereich bis (inkl.)"),
+    format: str = Query("html", pattern="^(html|zpl)$", description="html (Browserdruck) oder zpl (Zebra-Drucker)"),
+    db: Session = Depends(get_db)
+):
+    query = db.query(Pulver).filter(Pulver.deleted == False)
+
+    if ids:
+        query = query.filter(Pulver.id.in_(ids))
+    elif from_barcode and to_barcode:
+        query = query.filter(Pulver.barcode.between(from_barcode, to_barcode))
+    else:
+        raise HTTPException(status_code=400, detail="ids oder from_barcode/to_barcode erforderlich")
+
+    pulver_list = query.order_by(Pulver.barcode).limit(MAX_LABELS_PER_BATCH + 1).all()
+    if not pulver_list:
+        raise HTTPException(status_code=404, detail="Keine Pulver gefunden")
+    if len(pulver_list) > MAX_LABELS_PER_BATCH:
+        raise HTTPException(status_code=400, detail=f"Maximal {MAX_LABELS_PER_BATCH} Etiketten pro Druck")
+
+    # Daten vor dem Streamen vollständig laden – die DB-Session ist danach geschlossen
+    labels = [
+        {field: getattr(p, field) for field in LABEL_FIELDS}
+        for p in pulver_list
+    ]
+
+    if format == "zpl":
+        return Response(content="".join(render_label_zpl(p) for p in labels), media_type=ZPL_MEDIA_TYPE)
+
+    # Platz erst ganz am Ende holen – ab hier gibt ihn die Antwort selbst wieder frei
+    if not _label_batch_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Zu viele Sammeldrucke gleichzeitig – bitte gleich erneut versuchen")
+
+    return _LabelSheetResponse(_stream_label_sheet(labels), media_type="text/html; charset=utf-8")
+
+
+LABEL_FIELDS = ["id", "barcode", "artikelnummer", "hersteller", "farbe", "qualitaet", "oberflaeche", "start_menge_kg", "lagerort"]
+
+
+def _stream_label_sheet(labels: list[dict]):
+    """Kopf sofort, danach jede Seite sobald ihr Barcode gerendert ist"""
+    sheet = templates.env.get_template("etiketten.html").module
+
+    yield str(sheet.kopf(len(labels)))
+
+    barcodes = render_barcodes_parallel([p["barcode"] for p in labels], "png")
+    for p, (_, data) in zip(labels, barcodes):
+        barcode_src = "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+        yield str(sheet.seite(p, barcode_src))
+
+    yield str(sheet.fuss())
+
+# ------------------------------------------------------------
+# 🔹 4.3 Exporte: Pulverbestand und Bewegungshistorie (XLSX/CSV, gestreamt)
+# ------------------------------------------------------------
+PULVER_EXPORT_COLUMNS = [
+    ExportColumn("ID", "id"),
+    ExportColumn("Barcode", "barcode"),
+    ExportColumn("Artikelnummer", "artikelnummer"),
+    ExportColumn("Hersteller", "hersteller"),
+    ExportColumn("Farbe", "farbe"),
+    ExportColumn("Qualität", "qualitaet"),
+    ExportColumn("Oberfläche", "oberflaeche"),
+    ExportColumn("Anwendung", "anwendung"),
+    ExportColumn("Startmenge kg", "start_menge_kg"),
+    ExportColumn("Menge kg", "menge_kg"),
+    ExportColumn("Lagerort", "lagerort"),
+    ExportColumn("Aktiv", "aktiv", ja_nein),
+    ExportColumn("Erstellt am", "created_at", datum),
+]
+
+BEWEGUNG_EXPORT_COLUMNS = [
+    ExportColumn("ID", "id"),
+    ExportColumn("Datum", "datum", datum),
+    ExportColumn("Barcode", "barcode"),
+    ExportColumn("Artikelnummer", "artikelnummer"),
+    ExportColumn("Menge alt kg", "menge_alt"),
+    ExportColumn("Menge neu kg", "menge_neu"),
+    ExportColumn("Differenz kg", "differenz"),
+    ExportColumn("Beschreibung", "beschreibung"),
+    ExportColumn("Benutzer", "username", oder_strich),
+]
+
+
+@router.get("/export", dependencies=[Depends(require_permission("pulver.manage"))])
+def export_pulver(
+    show_inactive: bool = Query(True),
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    db: Session = Depends(get_read_db)
+):
+    stmt = select(*PULVER_LIST_COLUMNS).where(Pulver.deleted == False).order_by(Pulver.id)
+    if not show_inactive:
+        stmt = stmt.where(Pulver.aktiv == True)
+    return export_response(db, stmt, PULVER_EXPORT_COLUMNS, "pulver", format, sheet_title="Pulver")
+
+
+@router.get("/bewegungen/export", dependencies=[Depends(require_permission("pulver.manage"))])
+def export_bewegungen(
+    pulver_id: int | None = Query(None),
+    von: datetime | None = Query(None),
+    bis: datetime | None = Query(None),
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    db: Session = Depends(get_read_db)
+):
+    stmt = (
+        select(
+            PulverBewegung.id, PulverBewegung.datum, PulverBewegung.barcode, Pulver.artikelnummer,
+            PulverBewegung.menge_alt, PulverBewegung.menge_neu,
+            (PulverBewegung.menge_neu - PulverBewegung.menge_alt).label("differenz"),
+            PulverBewegung.beschreibung, User.username,
+        )
+        .join(Pulver, PulverBewegung.pulver_id == Pulver.id)
+        .outerjoin(User, PulverBewegung.user_id == User.id)
+        .order_by(PulverBewegung.id)
+    )
+    if pulver_id is not None:
+        stmt = stmt.where(PulverBewegung.pulver_id == pulver_id)
+    if von is not None:
+        stmt = stmt.where(PulverBewegung.datum >= von)
+    if bis is not None:
+        stmt = stmt.where(PulverBewegung.datum < bis)
+    return export_response(db, stmt, BEWEGUNG_EXPORT_COLUMNS, "bewegungen", format, sheet_title="Bewegungen")
+
+# ------------------------------------------------------------
+# 🔹 4.4 Bewegungshistorie spaltenorientiert (Parquet / Arrow, für BI-Tools)
+# ------------------------------------------------------------
+@router.get("/bewegungen/analytics", dependencies=[Depends(require_permission("pulver.manage"))])
+def export_bewegungen_analytics(
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+    von: datetime | None = Query(None),
+    bis: datetime | None = Query(None),
+    pulver_id: int | None = Query(None),
+    user_id: int | None = Query(None),
+    after_id: int | None = Query(None, description="Nur Bewegungen mit größerer id (inkrementeller Abzug)"),
+    mit_pulver: bool = Query(False, description="Pulver-Stammdaten dazu-joinen"),
+    db: Session = Depends(get_read_db)
+):
+    stmt = movement_statement(von, bis, pulver_id, user_id, after_id, mit_pulver)
+    today = datetime.now().strftime("%Y-%m-%d")
+    return StreamingResponse(
+        stream_movements(db, stmt, movement_schema(mit_pulver), format),
+        media_type=ANALYTICS_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="bewegungen_{today}.{format}"'},
+    )
+
 # ------------------------------------------------------------
 # 🔹 5. Pulver Tracken  (geschützt)
 # ------------------------------------------------------------
 @router.post("/track", dependencies=[Depends(require_permission("pulver.track"))])
 async def track_pulver(
     data: dict = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_user)
 ):
     barcode = data.get("barcode")
     menge_neu = data.get("menge_neu")
     beschreibung = data.get("beschreibung", "Normaler Verbrauch")
 
+    pulver, menge_alt = await db.run_sync(record_movement, barcode, menge_neu, beschreibung, current_user.id)
+
+    asyncio.create_task(manager.broadcast(tracked_event(pulver, barcode, menge_neu)))
+
+    return {
+        "message": "Bewegung gespeichert",
+        "menge_alt": menge_alt,
+        "menge_neu": menge_neu,
+        "beschreibung": beschreibung
+    }
+
+
+# Wiederholungen, wenn ein anderer Scanner denselben Karton gleichzeitig bucht
+TRACK_MAX_RETRIES = 5
+
+
+def is_number(value) -> bool:
+    """Endliche JSON-Zahl – true/false, Texte, NaN und Infinity zählen nicht"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def record_movement(db: Session, barcode, menge_neu, beschreibung, user_id: int):
+    """
+    Bucht eine Bestandsänderung (gemeinsame Logik für POST /track und den Scanner-WebSocket).
+    Gibt (pulver_zeile, menge_alt) zurück, Fehler als HTTPException.
+
+    Der Bestand wird per Compare-and-Swap geändert: das UPDATE greift nur, wenn
+    menge_kg noch dem gelesenen Wert entspricht – menge_alt der Bewegung ist damit
+    garantiert der tatsächliche Vorgängerwert (kein Lost Update bei parallelen Scans).
+    """
     if not barcode or menge_neu is None:
         raise HTTPException(status_code=400, detail="Barcode und neue Menge erforderlich")
+    if not isinstance(barcode, str):
+        raise HTTPException(status_code=400, detail="barcode muss ein Text sein")
+    if not is_number(menge_neu):
+        raise HTTPException(status_code=400, detail="menge_neu muss eine Zahl sein")
+
+    pulver_table = Pulver.__table__
+
+    for _ in range(TRACK_MAX_RETRIES):
+        current = db.execute(
+            select(pulver_table.c.id, pulver_table.c.menge_kg)
+            .where(pulver_table.c.barcode == barcode, pulver_table.c.deleted == False)
+        ).first()
+        if not current:
+            raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
+
+        if menge_neu < 0:
+            raise HTTPException(status_code=404, detail="Pulverbestand darf nicht negativ sein")
+
+        values = {"menge_kg": menge_neu, "change_seq": next_change_seq(db)}
+        if menge_neu == 0:
+            # Deaktivieren zählt version hoch → alter Bearbeiten-Stand kann es nicht zurückdrehen
+            values["aktiv"] = False
+            values["version"] = pulver_table.c.version + 1
+
+        # Bedingtes UPDATE … RETURNING (SQLite ≥ 3.35 und PostgreSQL)
+        pulver = db.execute(
+            update(pulver_table)
+            .where(
+                pulver_table.c.id == current.id,
+                pulver_table.c.deleted == False,
+                pulver_table.c.menge_kg.is_not_distinct_from(current.menge_kg),
+            )
+            .values(**values)
+            .returning(*pulver_table.c)
+        ).first()
+
+        if pulver is None:
+            # Bestand wurde zwischenzeitlich geändert → neu lesen
+            db.rollback()
+            continue
+
+        db.execute(insert(PulverBewegung.__table__).values(
+            pulver_id=pulver.id,
+            barcode=barcode,
+            datum=datetime.utcnow(),
+            menge_alt=current.menge_kg,
+            menge_neu=menge_neu,
+            beschreibung=beschreibung,
+            user_id=user_id,
+        ))
+        db.commit()
 
-    pulver = db.query(Pulver).filter(Pulver.barcode == barcode, Pulver.deleted == False).first()
-    if not pulver:
-        raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
-    
-    if menge_neu < 0:
-        raise HTTPException(status_code=404, detail="Pulverbestand darf nicht negativ sein")
-    
-    if menge_neu == 0:
-        pulver.aktiv = False
+        single_flight.bump("pulver")
 
-    menge_alt = pulver.menge_kg
+        return pulver, current.menge_kg
 
-    bewegung = PulverBewegung(
-        pulver_id=pulver.id,
-        barcode=barcode,
-        datum=datetime.utcnow(),
-        menge_alt=menge_alt,
-        menge_neu=menge_neu,
-        beschreibung=beschreibung,
-        user_id=current_user.id,
+    raise HTTPException(
+        status_code=409,
+        detail="Der Bestand wurde gleichzeitig geändert. Bitte erneut scannen."
     )
-    db.add(bewegung)
 
-    pulver.menge_kg = menge_neu
-    db.commit()
 
-    asyncio.create_task(manager.broadcast({
+def tracked_event(pulver, barcode: str, menge_neu) -> dict:
+    """WS-Event nach einer Buchung (solange die Session noch offen ist erzeugen)"""
+    return {
         "event": "pulver_tracked",
         "id": pulver.id,
         "barcode": barcode,
-        "menge_neu": menge_neu
-    }))
+        "menge_neu": menge_neu,
+        "change_seq": pulver.change_seq,
+        "pulver": _pulver_change(pulver),
+    }
+
+# ------------------------------------------------------------
+# 🔹 5.1 Mehrere Bewegungen auf einmal tracken (Inventur, geschützt)
+# ------------------------------------------------------------
+MAX_TRACK_BATCH = 1000
+
+
+def _plan_track_batch(items: list, current: dict, now: datetime, user_id: int):
+    """
+    Rechnet die Scans gegen den gelesenen Bestand durch (noch ohne zu schreiben).
+    Gibt (results, bewegungen, targets) zurück – targets: {pulver_id: (gelesen, neu, deaktivieren)}
+    """
+    results = []
+    bewegungen = []
+    targets: dict[int, tuple] = {}
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({"index": index, "status": "invalid"})
+            continue
+
+        barcode = item.get("barcode")
+        menge_neu = item.get("menge_neu")
+        beschreibung = item.get("beschreibung") or "Normaler Verbrauch"
+
+        if not isinstance(barcode, str) or not barcode or not is_number(menge_neu):
+            results.append({"index": index, "barcode": barcode, "status": "invalid"})
+            continue
+
+        pulver = current.get(barcode)
+        if not pulver:
+            results.append({"index": index, "barcode": barcode, "status": "not_found"})
+            continue
+
+        if menge_neu < 0:
+            results.append({"index": index, "barcode": barcode, "status": "negative"})
+            continue
+
+        # Mehrere Scans desselben Kartons bauen aufeinander auf
+        gelesen, menge_alt, deaktivieren = targets.get(pulver.id, (pulver.menge_kg, pulver.menge_kg, False))
+        bewegungen.append({
+            "pulver_id": pulver.id,
+            "barcode": barcode,
+            "datum": now,
+            "menge_alt": menge_alt,
+            "menge_neu": menge_neu,
+            "beschreibung": beschreibung,
+            "user_id": user_id,
+        })
+        targets[pulver.id] = (gelesen, menge_neu, deaktivieren or menge_neu == 0)
+
+        results.append({
+            "index": index,
+            "barcode": barcode,
+            "status": "ok",
+            "menge_alt": menge_alt,
+            "menge_neu": menge_neu,
+        })
+
+    return results, bewegungen, targets
+
+
+@router.post("/track/batch", dependencies=[Depends(require_permission("pulver.track"))])
+async def track_pulver_batch(
+    data: dict = Body(...),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Bucht eine Liste von Scans in einer Transaktion.
+    Erwartet:
+    {
+        "items": [
+            {"barcode": "OZS-00001", "menge_neu": 12.5, "beschreibung": "Inventur"},
+            ...
+        ]
+    }
+    Ungültige Einträge werden übersprungen und im Ergebnis mit Status gemeldet.
+    """
+    items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items muss eine nicht-leere Liste sein")
 
+    if len(items) > MAX_TRACK_BATCH:
+        raise HTTPException(status_code=400, detail=f"Maximal {MAX_TRACK_BATCH} Einträge pro Batch")
+
+    barcodes = {
+        item["barcode"] for item in items
+        if isinstance(item, dict) and isinstance(item.get("barcode"), str) and item["barcode"]
+    }
+    pulver_table = Pulver.__table__
+
+    for _ in range(TRACK_MAX_RETRIES):
+        # Alle Barcodes mit EINER Abfrage auflösen (nur id + Bestand, keine ORM-Objekte)
+        current = {
+            row.barcode: row
+            for row in await db.execute(
+                select(pulver_table.c.id, pulver_table.c.barcode, pulver_table.c.menge_kg)
+                .where(pulver_table.c.barcode.in_(barcodes), pulver_table.c.deleted == False)
+            )
+        }
+        results, bewegungen, targets = _plan_track_batch(items, current, datetime.utcnow(), current_user.id)
+        if not bewegungen:
+            break
+
+        # Je Pulver ein Compare-and-Swap wie bei POST /track – nach id sortiert (feste Sperrreihenfolge)
+        changed = []
+        for pulver_id in sorted(targets):
+            gelesen, menge_neu, deaktivieren = targets[pulver_id]
+            values = {"menge_kg": menge_neu, "change_seq": await db.run_sync(next_change_seq)}
+            if deaktivieren:
+                values["aktiv"] = False
+                values["version"] = pulver_table.c.version + 1
+
+            row = (await db.execute(
+                update(pulver_table)
+                .where(
+                    pulver_table.c.id == pulver_id,
+                    pulver_table.c.deleted == False,
+                    pulver_table.c.menge_kg.is_not_distinct_from(gelesen),
+                )
+                .values(**values)
+                .returning(*pulver_table.c)
+            )).first()
+            if row is None:
+                break
+            changed.append(row)
+
+        if len(changed) < len(targets):
+            # Ein Scanner war schneller → alles neu lesen und neu rechnen
+            await db.rollback()
+            continue
+
+        await db.execute(insert(PulverBewegung), bewegungen)
+        await db.commit()
+
+        single_flight.bump("pulver")
+
+        # Ein zusammengefasstes Event statt eines pro Scan
+        changes = sorted((_pulver_change(p) for p in changed), key=lambda c: c["change_seq"])
+        asyncio.create_task(manager.broadcast({
+            "event": "pulver_tracked_batch",
+            "ids": [c["id"] for c in changes],
+            "change_seq": changes[-1]["change_seq"],
+            "changes": changes,
+        }))
+        break
+    else:
+        raise HTTPException(
+            status_code=409,
+            detail="Der Bestand wurde gleichzeitig geändert. Bitte Batch erneut senden."
+        )
+
+    ok = len(bewegungen)
     return {
-        "message": "Bewegung gespeichert",
-        "menge_alt": menge_alt,
-        "menge_neu": menge_neu,
-        "beschreibung": beschreibung
+        "message": f"{ok} von {len(items)} Bewegungen gespeichert",
+        "ok": ok,
+        "failed": len(items) - ok,
+        "results": results,
     }
 
+# ------------------------------------------------------------
+# 🔹 5.2 Bewegungshistorie (Keyset-Pagination auf datum, id – neueste zuerst)
+# ------------------------------------------------------------
+BEWEGUNG_COLUMNS = [
+    PulverBewegung.id, PulverBewegung.pulver_id, PulverBewegung.barcode, PulverBewegung.datum,
+    PulverBewegung.menge_alt, PulverBewegung.menge_neu, PulverBewegung.beschreibung,
+    PulverBewegung.user_id, User.username,
+]
+
+
+def _query_bewegungen(db: Session, pulver_id, user_id, von, bis, limit: int, cursor):
+    query = select(*BEWEGUNG_COLUMNS).outerjoin(User, PulverBewegung.user_id == User.id)
+
+    if pulver_id is not None:
+        query = query.where(PulverBewegung.pulver_id == pulver_id)
+    if user_id is not None:
+        query = query.where(PulverBewegung.user_id == user_id)
+    if von is not None:
+        query = query.where(PulverBewegung.datum >= von)
+    if bis is not None:
+        query = query.where(PulverBewegung.datum < bis)
+
+    # Seek statt OFFSET: über Index (… , datum, id) gleich schnell auf jeder Seite
+    if cursor:
+        try:
+            last_datum, last_id = decode_cursor(cursor)
+            last_datum = datetime.fromisoformat(last_datum)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+        query = query.where(tuple_(PulverBewegung.datum, PulverBewegung.id) < tuple_(last_datum, last_id))
+
+    query = query.order_by(PulverBewegung.datum.desc(), PulverBewegung.id.desc()).limit(limit + 1)
+    rows = rows_to_dicts(db.execute(query))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]["datum"], rows[-1]["id"]])
+
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+@router.get("/bewegungen", dependencies=[Depends(require_permission("pulver.manage"))])
+def get_bewegungen(
+    user_id: int | None = Query(None),
+    von: datetime | None = Query(None),
+    bis: datetime | None = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None),
+    db: Session = Depends(get_read_db)
+):
+    """Globaler Bewegungs-Feed aller Pulver"""
+    return _query_bewegungen(db, None, user_id, von, bis, limit, cursor)
+
+
+@router.get("/{pulver_id}/bewegungen", dependencies=[Depends(require_permission("pulver.manage"))])
+def get_pulver_bewegungen(
+    pulver_id: int,
+    user_id: int | None = Query(None),
+    von: datetime | None = Query(None),
+    bis: datetime | None = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = Query(None),
+    db: Session = Depends(get_read_db)
+):
+    """Historie eines Pulvers"""
+    if db.get(Pulver, pulver_id) is None:
+        raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
+    return _query_bewegungen(db, pulver_id, user_id, von, bis, limit, cursor)
+
 # ------------------------------------------------------------
 # 🔹 6. Pulver über Barcode abrufen  (geschützt)
 # ------------------------------------------------------------
 @router.get("/{barcode}", dependencies=[Depends(get_current_user)])
-def get_pulver_by_barcode(barcode: str, db: Session = Depends(get_db)):
+def get_pulver_by_barcode(barcode: str, db: Session = Depends(get_read_db)):
     pulver = db.query(Pulver).filter(Pulver.barcode == barcode, Pulver.deleted == False).first()
 
     if not pulver:
@@ -277,19 +944,24 @@ def get_pulver_by_barcode(barcode: str, db: Session = Depends(get_db)):
 # 🔹 7. Pulver löschen (Soft Delete)
 # ------------------------------------------------------------
 @router.delete("/{pulver_id}", dependencies=[Depends(require_permission("powder.delete"))])
-async def delete_pulver(pulver_id: int, db: Session = Depends(get_db)):
-    pulver = db.query(Pulver).filter(Pulver.id == pulver_id, Pulver.deleted == False).first()
+async def delete_pulver(pulver_id: int, db: AsyncSession = Depends(get_async_db)):
+    # version hochzählen → ein Editor mit altem Stand kann das Löschen nicht rückgängig machen
+    values = {"deleted": True, "updated_at": datetime.utcnow(), "change_seq": await db.run_sync(next_change_seq)}
+    pulver = await db.run_sync(versioned_update, Pulver, pulver_id, None, values, Pulver.deleted == False)
 
     if not pulver:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Pulver nicht gefunden")
 
-    pulver.deleted = True
-    pulver.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+
+    single_flight.bump("pulver")
 
     asyncio.create_task(manager.broadcast({
         "event": "pulver_deleted",
-        "id": pulver.id
+        "id": pulver.id,
+        "change_seq": pulver.change_seq,
+        "pulver": _pulver_change(pulver),
     }))
 
     return {"message": "Pulver erfolgreich gelöscht (Soft Delete)"}
@@ -298,7 +970,7 @@ async def delete_pulver(pulver_id: int, db: Session = Depends(get_db)):
 # 🔹 8. Pulver Daten holen 
 # ------------------------------------------------------------
 @router.get("/id/{pulver_id}", dependencies=[Depends(get_current_user)])
-def get_pulver_by_id(pulver_id: int, db: Session = Depends(get_db)):
+def get_pulver_by_id(pulver_id: int, db: Session = Depends(get_read_db)):
     pulver = db.query(Pulver).filter(Pulver.id == pulver_id, Pulver.deleted == False).first()
 
     if not pulver:
@@ -317,5 +989,6 @@ def get_pulver_by_id(pulver_id: int, db: Session = Depends(get_db)):
         "menge_kg": pulver.menge_kg,
         "lagerort": pulver.lagerort,
         "aktiv": pulver.aktiv,
-        "updated_at": pulver.updated_at
+        "updated_at": pulver.updated_at,
+        "version": pulver.version
     }
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 from app.ws_manager import manager
 import asyncio
 
-from app.database import get_db
+from app.database import get_db, get_async_db, get_read_db
 from app.auth import get_current_user, require_permission
 from app.models import Role, RolePermission, Permission
+from app.permissions import permission_registry, PERMISSIONS_CHANGED
+from app.ws_bus import event_bus
+from app.change_tracking import versioned_update, parse_version
+from app.single_flight import single_flight, request_scope_key
 
 router = APIRouter(
     prefix="/api/roles",
@@ -22,7 +28,7 @@ router = APIRouter(
 @router.post("/", dependencies=[Depends(require_permission("new.role"))])
 async def create_role(
     data: dict = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Neue Rolle anlegen
@@ -35,7 +41,7 @@ async def create_role(
         raise HTTPException(status_code=400, detail="Rollenname ist ein Pflichtfeld")
 
     # prüfen ob Rolle existiert
-    existing = db.query(Role).filter(Role.name == name).first()
+    existing = await db.scalar(select(Role.id).where(Role.name == name))
     if existing:
         raise HTTPException(status_code=400, detail=f"Rolle '{name}' existiert bereits")
 
@@ -48,8 +54,9 @@ async def create_role(
 
     try:
         db.add(new_role)
-        db.commit()
-        db.refresh(new_role)
+        await db.commit()
+        await db.refresh(new_role)
+        single_flight.bump("roles")
 
         # 🔥 WebSocket Event senden
         asyncio.create_task(manager.broadcast({
@@ -59,7 +66,7 @@ async def create_role(
         }))
 
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Fehler: Rolleneintrag bereits vorhanden")
 
     return {
@@ -79,7 +86,7 @@ async def create_role(
 @router.post("/assign_permissions", dependencies=[Depends(require_permission("manage.permission"))])
 async def assign_permissions(
     data: dict = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     """
@@ -88,12 +95,12 @@ async def assign_permissions(
     {
         "role_id": 2,
         "permission_ids": [1,2,3],
-        "updated_at": "2025-11-25T10:15:00"
+        "version": 4
     }
     """
 
     role_id = data.get("role_id")
-    client_updated_at = data.get("updated_at")
+    client_version = parse_version(data, required=True)
     permission_ids = data.get("permission_ids", [])
 
     if not role_id:
@@ -103,7 +110,7 @@ async def assign_permissions(
         raise HTTPException(status_code=400, detail="permission_ids muss eine Liste sein")
 
     # Rolle existiert?
-    role = db.query(Role).filter(Role.id == role_id).first()
+    role = await db.scalar(select(Role).where(Role.id == role_id))
     if not role:
         raise HTTPException(status_code=404, detail="Rolle nicht gefunden")
 
@@ -111,20 +118,9 @@ async def assign_permissions(
     if role.name.lower() == "admin":
         raise HTTPException(status_code=403, detail="Admin-Rechte können nicht verändert werden")
 
-    # OPTIMISTIC LOCKING
-    if client_updated_at:
-        client_dt = datetime.fromisoformat(client_updated_at)
-        if role.updated_at != client_dt:
-            raise HTTPException(
-                status_code=409,
-                detail="Diese Rolle wurde inzwischen von einem anderen Benutzer geändert. Bitte neu laden."
-            )
-
     # Permissions validieren
     valid_ids = set(
-        pid for (pid,) in db.query(Permission.id)
-        .filter(Permission.id.in_(permission_ids))
-        .all()
+        await db.scalars(select(Permission.id).where(Permission.id.in_(permission_ids)))
     )
 
     if len(valid_ids) != len(permission_ids):
@@ -136,12 +132,7 @@ async def assign_permissions(
     # ----------------------------------
     # 🔐 Machtbegrenzung (NEU!)
     # ----------------------------------
-    current_permissions = set(
-        p[0] for p in
-        db.query(Permission.id)
-        .join(RolePermission, Permission.id == RolePermission.permission_id)
-        .filter(RolePermission.role_id == current_user.role_id)
-    )
+    current_permissions = permission_registry.permission_ids(current_user.role_id)
 
     for pid in valid_ids:
         if pid not in current_permissions:
@@ -151,16 +142,28 @@ async def assign_permissions(
             )
 
 
+    # OPTIMISTIC LOCKING: Version in einer Anweisung prüfen und hochzählen
+    updated_role = await db.run_sync(versioned_update, Role, role_id, client_version, {"updated_at": datetime.utcnow()})
+    if updated_role is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Diese Rolle wurde inzwischen von einem anderen Benutzer geändert. Bitte neu laden."
+        )
+
     # Alte Rechte löschen
-    db.query(RolePermission).filter(RolePermission.role_id == role_id).delete()
+    await db.execute(delete(RolePermission).where(RolePermission.role_id == role_id))
 
     # Neue Rechte setzen
     for pid in valid_ids:
         db.add(RolePermission(role_id=role_id, permission_id=pid))
 
-    # updated_at aktualisieren
-    role.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+
+    # Bitmasken der Rollen neu kompilieren – hier und in den anderen Workern
+    await db.run_sync(permission_registry.rebuild)
+    event_bus.notify(PERMISSIONS_CHANGED)
+    single_flight.bump("roles")
 
     # 🔥 WEBSOCKET EVENT SENDEN
     asyncio.create_task(manager.broadcast({
@@ -171,7 +174,8 @@ async def assign_permissions(
     return {
         "message": "Rollenrechte aktualisiert",
         "role_id": role_id,
-        "updated_at": role.updated_at,
+        "updated_at": updated_role.updated_at,
+        "version": updated_role.version,
         "assigned_permissions": list(valid_ids)
     }
 
@@ -179,9 +183,9 @@ async def assign_permissions(
 # 🔹 Permission anlegen
 # ------------------------------------------------------------
 @router.post("/permissions/", dependencies=[Depends(require_permission("manage.permission"))])
-def create_permission(
+async def create_permission(
     data: dict = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     """
@@ -194,8 +198,7 @@ def create_permission(
         raise HTTPException(status_code=400, detail="Name der Permission ist Pflichtfeld")
 
     # prüfen ob Permission existiert
-    existing = db.query(Permission).filter(Permission.name == name).first()
-    if existing:
+    if await db.scalar(select(Permission.id).where(Permission.name == name)):
         raise HTTPException(status_code=400, detail="Permission existiert bereits")
 
     new_perm = Permission(
@@ -206,22 +209,26 @@ def create_permission(
 
     try:
         db.add(new_perm)
-        db.commit()
-        db.refresh(new_perm)
+        await db.flush()
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Fehler beim Erstellen der Permission")
 
-    # 🔥 ADMIN automatisch diese Permission geben
-    admin_role = db.query(Role).filter(Role.name.ilike("admin")).first()
+    # 🔥 ADMIN automatisch diese Permission geben (gleiche Transaktion)
+    admin_role = await db.scalar(select(Role).where(Role.name.ilike("admin")))
     if admin_role:
-        rp = RolePermission(
+        db.add(RolePermission(
             role_id=admin_role.id,
             permission_id=new_perm.id,
             assigned_at=datetime.utcnow()
-        )
-        db.add(rp)
-        db.commit()
+        ))
+
+    await db.commit()
+
+    # neue Permission bekommt ihr Bit → Registry neu aufbauen (auch in den anderen Workern)
+    await db.run_sync(permission_registry.rebuild)
+    event_bus.notify(PERMISSIONS_CHANGED)
+    single_flight.bump("permissions")
 
     return {
         "message": "Permission erfolgreich angelegt",
@@ -237,31 +244,45 @@ def create_permission(
 # 🔹 Permission einholen 
 # ------------------------------------------------------------
 
-@router.get("/permissions", dependencies=[Depends(require_permission("roles.manage"))])
-def get_permissions(db: Session = Depends(get_db)):
-    perms = db.query(Permission).all()
+@router.get("/permissions")
+def get_permissions(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user=Depends(require_permission("roles.manage"))
+):
+    def build():
+        perms = db.query(Permission).all()
+
+        return [
+            {
+                "id": p.id,
+                "name": p.name,
+                "description": p.description
+            }
+            for p in perms
+        ], None
+
+    return single_flight.json_response("permissions", request_scope_key(request, current_user), build)
+
+@router.get("/roles")
+def get_roles(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user=Depends(require_permission("roles.manage"))
+):
+    def build():
+        roles = db.query(Role).all()
 
-    return [
-        {
-            "id": p.id,
-            "name": p.name,
-            "description": p.description
-        }
-        for p in perms
-    ]
-
-@router.get("/roles", dependencies=[Depends(require_permission("roles.manage"))])
-def get_roles(db: Session = Depends(get_db)):
-    roles = db.query(Role).all()
-
-    return [
-        {
-            "id": r.id,
-            "name": r.name,
-            "description": r.description
-        }
-        for r in roles
-    ]
+        return [
+            {
+                "id": r.id,
+                "name": r.name,
+                "description": r.description
+            }
+            for r in roles
+        ], None
+
+    return single_flight.json_response("roles", request_scope_key(request, current_user), build)
 
 @router.get("/roles/{role_id}/permissions", dependencies=[Depends(require_permission("manage.permission"))])
 def get_role_permissions(role_id: int, db: Session = Depends(get_db)):
@@ -275,5 +296,6 @@ def get_role_permissions(role_id: int, db: Session = Depends(get_db)):
         "role_id": role.id,
         "role_name": role.name,
         "permissions": permission_ids,
-        "updated_at": role.updated_at.isoformat()  # 🔥 WICHTIG!
+        "updated_at": role.updated_at.isoformat(),
+        "version": role.version  # 🔥 WICHTIG für Optimistic Locking!
     }
\ No newline at end of file
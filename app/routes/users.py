@@ -1,17 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request
 from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from datetime import datetime
 import secrets, string
 from app.auth import get_current_user, require_permission
-from app.database import get_db
+from app.database import get_db, get_async_db, get_read_db
 from app.models import User
-from app.auth import hash_password 
+from app.auth import hash_password_async
+from app.principal_cache import principal_cache
+from app.single_flight import single_flight, request_scope_key
+from app.serialization import rows_to_dicts
+from app.change_tracking import versioned_update, parse_version
+from sqlalchemy.exc import IntegrityError
 from ..ws_manager import manager
 import asyncio
-from fastapi.responses import StreamingResponse
-from openpyxl import Workbook
-from io import BytesIO
+from app.exports import ExportColumn, export_response, ja_nein, datum, oder_strich
 from app.models import User, Role
 
 router = APIRouter(
@@ -21,40 +26,41 @@ router = APIRouter(
 )
 
 
+# Spalten der Benutzerliste (kein password_hash)
+USER_LIST_COLUMNS = [
+    User.id, User.username, User.email, User.role_id, User.active, User.deleted,
+    User.must_change_password, User.last_login, User.created_at,
+]
+
+
 # ------------------------------------------------------------
 # 🔹 1. Alle Benutzer anzeigen (mit optionaler Ansicht für Gelöschte)
 # ------------------------------------------------------------
-@router.get("/", dependencies=[Depends(require_permission("user.manage"))])
+@router.get("/")
 def get_all_users(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     # NEU: Query-Parameter, um gelöschte Benutzer einzuschließen
-    show_deleted: bool = Query(False, description="Wenn True, werden auch gelöschte Benutzer (deleted=True) angezeigt.")
+    show_deleted: bool = Query(False, description="Wenn True, werden auch gelöschte Benutzer (deleted=True) angezeigt."),
+    current_user: User = Depends(require_permission("user.manage"))
 ):
     """Gibt alle Benutzer (oder alle, inkl. gelöschter) mit Rollenname zurück"""
-    
-    query = db.query(User).options(joinedload(User.role))
-    
-    # NEU: Filterung basierend auf dem Parameter
-    if not show_deleted:
-        query = query.filter(User.deleted == False)
-
-    users = query.all()
-
-    result = []
-    for u in users:
-        result.append({
-            "id": u.id,
-            "username": u.username,
-            "email": u.email,
-            "role_id": u.role_id,
-            "role_name": u.role.name if u.role else None,
-            "active": u.active,
-            "deleted": u.deleted, # WICHTIG: deleted muss immer mitgegeben werden
-            "must_change_password": u.must_change_password,
-            "last_login": u.last_login.isoformat() if u.last_login else None,
-            "created_at": u.created_at.isoformat() if u.created_at else None,
-        })
-    return result
+
+    def build():
+        # Nur die Spalten der Liste, Rollenname per Outer Join
+        query = (
+            select(*USER_LIST_COLUMNS, Role.name.label("role_name"))
+            .outerjoin(Role, User.role_id == Role.id)
+        )
+
+        # NEU: Filterung basierend auf dem Parameter
+        if not show_deleted:
+            query = query.where(User.deleted == False)
+
+        # deleted muss immer mitgegeben werden; Datumswerte serialisiert orjson als ISO-String
+        return rows_to_dicts(db.execute(query)), None
+
+    return single_flight.json_response("users", request_scope_key(request, current_user), build)
 
 # ------------------------------------------------------------
 # 🔹 2. Neuen Benutzer anlegen
@@ -62,7 +68,7 @@ def get_all_users(
 @router.post("/", dependencies=[Depends(require_permission("user.create"))])
 async def create_user(
     data: dict = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     username = data.get("username")
@@ -73,23 +79,23 @@ async def create_user(
     if not username or not email:
         raise HTTPException(status_code=400, detail="Username und E-Mail sind Pflichtfelder")
 
+    # Einmalpasswort VOR der ersten Abfrage hashen – sonst hält der Request die
+    # (einzige) Schreib-Verbindung, während pbkdf2 rechnet
+    temp_pw = generate_temp_password()
+    password_hash = await hash_password_async(temp_pw)
+
     # Prüfen ob Benutzername schon existiert
-    if db.query(User).filter(User.username == username).first():
+    if await db.scalar(select(User.id).where(User.username == username)):
         raise HTTPException(status_code=400, detail="Benutzername existiert bereits")
 
     # 🔐 Rolle sicher laden & prüfen
-    role = db.query(Role).filter(Role.id == role_id).first()
+    role = await db.scalar(select(Role).where(Role.id == role_id))
     if not role:
         raise HTTPException(status_code=400, detail="Ungültige Rolle")
     
     from app.auth import assert_can_assign_role
     assert_can_assign_role(role, current_user)
 
-
-    # Einmalpasswort generieren
-    temp_pw = generate_temp_password()
-    password_hash = hash_password(temp_pw)
-
     new_user = User(
         username=username,
         email=email,
@@ -102,8 +108,9 @@ async def create_user(
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    single_flight.bump("users")
     
     asyncio.create_task(manager.broadcast({
         "event": "user_created",
@@ -125,62 +132,36 @@ async def create_user(
     }
 
 # ------------------------------------------------------------
-# 🔹 3. Benutzerliste exportieren (ROBUSTES CSV mit UTF-8 BOM)
+# 🔹 3. Benutzerliste exportieren (XLSX oder CSV mit UTF-8 BOM, gestreamt)
 # ------------------------------------------------------------
-@router.get("/export", dependencies=[Depends(require_permission("user.manage"))])
-def export_users(db: Session = Depends(get_db)):
-    today = datetime.now().strftime("%Y-%m-%d")
+USER_EXPORT_COLUMNS = [
+    ExportColumn("ID", "id"),
+    ExportColumn("Benutzername", "username"),
+    ExportColumn("Email", "email"),
+    ExportColumn("Rolle", "role_name", oder_strich),
+    ExportColumn("Aktiv", "active", ja_nein),
+    ExportColumn("Erstellt am", "created_at", datum),
+    ExportColumn("Gelöscht", "deleted", ja_nein),
+]
 
-    filename = f"users_{today}.xlsx"
-    
 
-    # --- 1) Benutzer mit Rolle laden ---
-    users = (
-        db.query(User)
-        .join(Role, User.role_id == Role.id, isouter=True)
-        .all()
+@router.get("/export", dependencies=[Depends(require_permission("user.manage"))])
+def export_users(
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$"),
+    db: Session = Depends(get_read_db)
+):
+    stmt = (
+        select(User.id, User.username, User.email, Role.name.label("role_name"),
+               User.active, User.created_at, User.deleted)
+        .outerjoin(Role, User.role_id == Role.id)
+        .order_by(User.id)
     )
+    return export_response(db, stmt, USER_EXPORT_COLUMNS, "users", format, sheet_title="Users")
+
 
-    # --- 2) Excel-Datei erstellen ---
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Users"
-
-    # Kopfzeile
-    headers = ["ID", "Benutzername", "Email", "Rolle", "Aktiv", "Erstellt am", "Gelöscht"]
-    ws.append(headers)
-
-    # --- 3) Jede Zeile ein User ---
-    for u in users:
-        ws.append([
-            u.id,
-            u.username,
-            u.email,
-            u.role.name if u.role else "—",
-            "Ja" if u.active else "Nein",
-            u.created_at.strftime("%d.%m.%Y %H:%M") if u.created_at else "",
-            "Ja" if u.deleted else "Nein",
-        ])
-
-    # Optional: Spaltenbreiten automatisch anpassen
-    for column_cells in ws.columns:
-        length = max(len(str(cell.value)) for cell in column_cells)
-        ws.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-    # --- 4) Datei in Bytes speichern ---
-    stream = BytesIO()
-    wb.save(stream)
-    stream.seek(0)
-
-    # --- 5) Response zurückgeben ---
-    return StreamingResponse(
-        stream,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-    )
 
+# Über PUT änderbare Felder (Passwort nur über eigene Route)
+USER_EDIT_FIELDS = ("username", "email", "active", "role_id")
 
 
 # ------------------------------------------------------------
@@ -190,11 +171,11 @@ def export_users(db: Session = Depends(get_db)):
 async def update_user(
     user_id: int,
     data: dict = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     # Wir erlauben keine Bearbeitung von gelöschten Benutzern über diesen Endpunkt
-    user = db.query(User).filter(User.id == user_id, User.deleted == False).first()
+    user = await db.scalar(select(User).where(User.id == user_id, User.deleted == False))
     if not user:
         raise HTTPException(status_code=404, detail="Benutzer nicht gefunden (oder gelöscht)")
 
@@ -208,7 +189,7 @@ async def update_user(
             )
 
         # Rolle laden
-        role = db.query(Role).filter(Role.id == data["role_id"]).first()
+        role = await db.scalar(select(Role).where(Role.id == data["role_id"]))
         if not role:
             raise HTTPException(status_code=400, detail="Ungültige Rolle")
 
@@ -216,49 +197,62 @@ async def update_user(
         from app.auth import assert_can_assign_role
         assert_can_assign_role(role, current_user)
 
-        # Rolle setzen
-        user.role_id = role.id
-
     # Felder aktualisieren (aber kein Passwort)
-    if "username" in data:
-        user.username = data["username"]
-    if "email" in data:
-        user.email = data["email"]
-    if "active" in data:
-        user.active = data["active"]
-    
-    # Hier müsste die Optimistic Locking Logik stehen
+    values = {field: data[field] for field in USER_EDIT_FIELDS if field in data}
+    values["updated_at"] = datetime.utcnow()
+
+    # OPTIMISTIC LOCKING: Version prüfen und hochzählen in einer Anweisung
+    try:
+        updated = await db.run_sync(versioned_update, User, user_id, parse_version(data, required=True), values, User.deleted == False)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Benutzername existiert bereits")
 
-    db.commit()
+    if updated is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Dieser Benutzer wurde inzwischen von einem anderen Benutzer geändert. Bitte neu laden."
+        )
+
+    await db.commit()
+    principal_cache.invalidate_user(user_id)
+    single_flight.bump("users")
 
     asyncio.create_task(manager.broadcast({
         "event": "user_updated",
-        "id": user.id,
-        "username": user.username,
-        "role_id": user.role_id,
-        "active": user.active
+        "id": updated.id,
+        "username": updated.username,
+        "role_id": updated.role_id,
+        "active": updated.active
     }))
 
-    return {"message": "Benutzerdaten aktualisiert"}
+    return {"message": "Benutzerdaten aktualisiert", "version": updated.version}
 
 
 # ------------------------------------------------------------
 # 🔹 4.1. Benutzer wiederherstellen (NEUE ROUTE)
 # ------------------------------------------------------------
 @router.put("/restore/{user_id}", dependencies=[Depends(require_permission("user.update"))])
-async def restore_user(user_id: int, db: Session = Depends(get_db)):
+async def restore_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Stellt einen zuvor gelöschten Benutzer wieder her (setzt deleted=False)."""
     # Benutzer suchen, auch wenn er deleted=True ist
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Benutzer nicht gefunden")
     
     if not user.deleted:
         return {"message": "Benutzer ist bereits aktiv."}
 
-    user.deleted = False
-    # Optional: user.active = True setzen, falls Wiederherstellung immer Aktivierung bedeutet
-    db.commit()
+    # version hochzählen → ein Editor mit altem Stand bekommt 409 statt zu überschreiben
+    restored = await db.run_sync(versioned_update, User, user_id, None, {"deleted": False, "updated_at": datetime.utcnow()}, User.deleted == True)
+    if restored is None:
+        await db.rollback()
+        return {"message": "Benutzer ist bereits aktiv."}
+    # Optional: active=True setzen, falls Wiederherstellung immer Aktivierung bedeutet
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
+    single_flight.bump("users")
 
     asyncio.create_task(manager.broadcast({
         "event": "user_updated", # Löst ein Frontend-Reload aus
@@ -275,15 +269,23 @@ async def restore_user(user_id: int, db: Session = Depends(get_db)):
 # 🔹 5. Passwort zurücksetzen (neues Einmalpasswort)
 # ------------------------------------------------------------
 @router.post("/{user_id}/reset_password", dependencies=[Depends(require_permission("user.update"))])
-def reset_password(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id, User.deleted == False).first()
+async def reset_password(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    # Erst hashen, dann die Schreib-Verbindung holen
+    temp_pw = generate_temp_password()
+    password_hash = await hash_password_async(temp_pw)
+
+    user = await db.run_sync(versioned_update, User, user_id, None, {
+        "password_hash": password_hash,
+        "must_change_password": True,
+        "updated_at": datetime.utcnow(),
+    }, User.deleted == False)
     if not user:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Benutzer nicht gefunden")
 
-    temp_pw = generate_temp_password()
-    user.password_hash = hash_password(temp_pw)
-    user.must_change_password = True
-    db.commit()
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
+    single_flight.bump("users")
 
     return {
         "message": "Einmalpasswort vergeben",
@@ -296,8 +298,9 @@ def reset_password(user_id: int, db: Session = Depends(get_db)):
 # 🔹 6. Benutzer löschen (Soft Delete)
 # ------------------------------------------------------------
 @router.delete("/{user_id}", dependencies=[Depends(require_permission("user.delete"))])
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    # Rolle gleich mitladen – Lazy-Loading ist mit AsyncSession nicht möglich
+    user = await db.scalar(select(User).options(joinedload(User.role)).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="Benutzer nicht gefunden")
 
@@ -308,8 +311,13 @@ async def delete_user(user_id: int, db: Session = Depends(get_db)):
     if user.deleted:
         raise HTTPException(status_code=400, detail="Benutzer ist bereits gelöscht")
 
-    user.deleted = True
-    db.commit()
+    # version hochzählen → ein späteres Bearbeiten mit altem Stand bekommt 409
+    if await db.run_sync(versioned_update, User, user_id, None, {"deleted": True, "updated_at": datetime.utcnow()}, User.deleted == False) is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Benutzer ist bereits gelöscht")
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
+    single_flight.bump("users")
 
     asyncio.create_task(manager.broadcast({
         "event": "user_deleted",
@@ -340,6 +348,7 @@ def get_user_by_id(user_id: int, db: Session = Depends(get_db)):
         "last_login": user.last_login.isoformat() if user.last_login else None,
         "created_at": user.created_at.isoformat() if user.created_at else None,
         "updated_at": user.updated_at.isoformat() if user.updated_at else None,
+        "version": user.version,
     }
 
 
@@ -1,7 +1,8 @@
 # app/seed_permissions.py
 
 from app.database import SessionLocal
-from app.models import Role, User, Permission, RolePermission
+from sqlalchemy import func
+from app.models import Role, User, Permission, RolePermission, ChangeCounter, Pulver
 from app.auth import hash_password
 from datetime import datetime
 
@@ -29,6 +30,9 @@ PERMISSIONS = [
 
     # Auftragsdisplay
     ("auftraege.manage", "Auftragsdisplay öffnen"),
+
+    # System
+    ("system.monitor", "Systemstatus / DB-Pools abrufen"),
 ]
 
 
@@ -108,6 +112,18 @@ def run_seed():
     else:
         print("ℹ Admin-Benutzer existiert bereits.")
 
+    # -----------------------------------------------------
+    # 4) ÄNDERUNGSZÄHLER (Delta-Sync)
+    # -----------------------------------------------------
+    # Bei create_all-Datenbanken gibt es keine Migration, die die Zeile anlegt
+    if not db.get(ChangeCounter, "pulver"):
+        start = db.query(func.max(Pulver.change_seq)).scalar() or 0
+        db.add(ChangeCounter(name="pulver", value=start))
+        db.commit()
+        print(f"✔ Änderungszähler 'pulver' angelegt (Stand {start}).")
+    else:
+        print("ℹ Änderungszähler existiert bereits.")
+
     db.close()
     print("🎉 Seeding erfolgreich abgeschlossen!")
 
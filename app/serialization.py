@@ -0,0 +1,21 @@
+# app/serialization.py
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+
+def _default(value):
+    """Fallback für Typen, die orjson nicht kennt (Decimal, Pydantic-Modelle, …)"""
+    return jsonable_encoder(value)
+
+
+def dumps(payload) -> bytes:
+    """JSON in einem Durchlauf (datetime, dict, list nativ in orjson)"""
+    return orjson.dumps(payload, default=_default)
+
+
+def rows_to_dicts(result) -> list[dict]:
+    """Core-Ergebnis (nur projizierte Spalten) → Liste von Dicts, ohne ORM-Objekte"""
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
@@ -0,0 +1,92 @@
+# app/single_flight.py
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable
+from fastapi import Request
+from fastapi.responses import Response
+from app.database import is_pinned_to_primary
+from app.serialization import dumps
+
+
+class SingleFlight:
+    """
+    Fasst gleichzeitige, identische Lese-Requests zusammen.
+
+    Der erste Request (Leader) führt die DB-Abfrage aus und serialisiert die Antwort,
+    alle zeitgleich eintreffenden Requests mit gleichem Schlüssel warten darauf und
+    bekommen denselben Response-Body. Schreibende Routen erhöhen per ``bump(area)``
+    die Generation eines Bereichs – spätere Leser hängen sich dann nicht mehr an
+    eine Abfrage, die noch vor dem Commit gestartet wurde.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+        self._generations: dict[str, int] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def bump(self, area: str):
+        with self._lock:
+            self._generations[area] = self._generations.get(area, 0) + 1
+
+    def do(self, area: str, key: Hashable, fn: Callable):
+        with self._lock:
+            flight_key = (area, self._generations.get(area, 0), key)
+            future = self._calls.get(flight_key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[flight_key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(flight_key, None)
+
+    def json_response(self, area: str, key: Hashable, build: Callable) -> Response:
+        """
+        build() liefert (payload, headers). Serialisiert wird nur einmal pro Flight,
+        jeder Request bekommt aber ein eigenes Response-Objekt.
+        """
+        def run():
+            payload, headers = build()
+            return dumps(payload), headers
+
+        body, headers = self.do(area, key, run)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+def request_scope_key(request: Request, current_user) -> tuple:
+    """Schlüssel aus Pfad, normalisierten Query-Parametern, Rolle und Lesequelle (Primary/Replikat)"""
+    return (
+        request.url.path,
+        tuple(sorted(request.query_params.multi_items())),
+        current_user.role_id,
+        is_pinned_to_primary(request),
+    )
+
+
+single_flight = SingleFlight()
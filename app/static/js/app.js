@@ -12,23 +12,84 @@ const PAGE_SCRIPTS = {
     benutzer: "/static/js/user-management.js"
 };
 
+// Welche WS-Themen eine Seite braucht (Server liefert nur abonnierte Events)
+const PAGE_TOPICS = {
+    rollenrechte: ["roles"],
+    pulverlager: ["pulver"],
+    benutzer: ["users"]
+};
+
+let wsTopics = [];
+
+// Position im Event-Log des Servers – beim Reconnect werden nur verpasste Events nachgeliefert
+let wsLastSeq = null;
+let wsEpoch = null;
+let currentPage = null;
+
+// Server schließt mit 4401, wenn der Token ungültig/abgelaufen ist → kein Reconnect damit
+const WS_AUTH_FAILED = 4401;
+let wsToken = null;
+
+function setWebSocketTopics(topics) {
+    const removed = wsTopics.filter(t => !topics.includes(t));
+    wsTopics = topics;
+
+    if (!globalWS || globalWS.readyState !== WebSocket.OPEN) return; // onopen abonniert
+
+    if (removed.length) {
+        globalWS.send(JSON.stringify({ action: "unsubscribe", topics: removed }));
+    }
+    if (topics.length) {
+        globalWS.send(JSON.stringify({ action: "subscribe", topics }));
+    }
+}
+
 function initGlobalWebSocket() {
+    const token = getToken();
+    if (!token) {
+        console.warn("⚠️ Kein Token – globaler WebSocket wird nicht verbunden");
+        return;
+    }
+
     console.log("🔌 Verbinde globalen WebSocket...");
     
     // *** WICHTIGE KORREKTUR FÜR RENDER (WSS/WS) ***
     const protocol = location.protocol === "https:" ? "wss" : "ws";
     
     // Verbinde unter Verwendung des korrekten Protokolls (wss:// auf Render)
-    globalWS = new WebSocket(`${protocol}://${location.host}/ws/app`);
+    // Token bei jedem (Re-)Connect frisch aus dem localStorage
+    wsToken = token;
+    globalWS = new WebSocket(`${protocol}://${location.host}/ws/app?token=${encodeURIComponent(token)}`);
     
-    // ... der Rest Ihrer Funktion bleibt unverändert ...
     globalWS.onopen = () => {
         console.log("✅ Globaler WebSocket verbunden!");
+        if (wsTopics.length) {
+            const resume = wsLastSeq !== null ? { since: wsLastSeq, epoch: wsEpoch } : {};
+            globalWS.send(JSON.stringify({ action: "subscribe", topics: wsTopics, ...resume }));
+        }
     };
 
     globalWS.onmessage = (event) => {
         try {
             const msg = JSON.parse(event.data);
+
+            if (msg.event === "subscribed") {
+                // Neue Zählung (Server-Neustart / anderer Worker) → von vorn
+                wsLastSeq = msg.epoch === wsEpoch ? Math.max(wsLastSeq ?? 0, msg.seq) : msg.seq;
+                wsEpoch = msg.epoch;
+                return;
+            }
+
+            if (msg.event === "resync_required") {
+                console.warn("🔄 WS: Verpasste Events nicht mehr verfügbar → Seite neu laden");
+                wsLastSeq = msg.seq;
+                wsEpoch = msg.epoch;
+                if (currentPage) loadContent(currentPage);
+                return;
+            }
+
+            if (msg.seq) wsLastSeq = Math.max(wsLastSeq ?? 0, msg.seq);
+
             document.dispatchEvent(
                 new CustomEvent("ws-event", { detail: msg })
             );
@@ -41,7 +102,20 @@ function initGlobalWebSocket() {
         console.error("❌ Globaler WebSocket Fehler:", err);
     };
 
-    globalWS.onclose = () => {
+    globalWS.onclose = (event) => {
+        if (event.code === WS_AUTH_FAILED) {
+            // Inzwischen erneuerter Token (apiFetch / Refresh) → sofort damit verbinden
+            const token = getToken();
+            if (token && token !== wsToken) {
+                initGlobalWebSocket();
+                return;
+            }
+            console.warn("🔒 Globaler WebSocket: Sitzung abgelaufen → Login");
+            alert("🔒 Sitzung abgelaufen, bitte erneut anmelden.");
+            logoutUser();
+            return;
+        }
+
         console.warn("⚠️ Globaler WebSocket getrennt — versuche Reconnect in 2s...");
         setTimeout(initGlobalWebSocket, 2000);
     };
@@ -334,6 +408,10 @@ async function loadContent(page) {
         // Alte dynamische Skripte entfernen
         cleanupDynamicScripts();
 
+        // Nur Events der aktuellen Seite empfangen
+        currentPage = page;
+        setWebSocketTopics(PAGE_TOPICS[page] || []);
+
         // Falls die Seite ein JS-Modul hat → laden
         if (PAGE_SCRIPTS[page]) {
             // Prüfen, ob das Script bereits existiert
@@ -4,6 +4,8 @@
 
 let pulverWSInitialized = false;
 let showInactivePowders = false;
+let pulverChangeCursor = null; // letzter bekannter change_seq (Delta-Sync)
+let pulverSyncRunning = null;  // verhindert parallele /changes-Abfragen
 
 // ==========================================================
 //  MODULE INITIALISIERUNG
@@ -67,18 +69,30 @@ async function loadPowders() {
         const res = await apiFetch(url);
         const powders = await res.json();
 
+        // Stand der Liste → Startpunkt für den Delta-Sync
+        pulverChangeCursor = parseInt(res.headers.get("X-Change-Cursor"), 10) || 0;
+
         const tbody = document.querySelector("#pulver-table tbody");
         tbody.innerHTML = "";
 
         powders.forEach(p => {
-            const tr = document.createElement("tr");
-            tr.dataset.id = p.id;
+            tbody.appendChild(renderPowderRow(p));
+        });
 
-            if (!p.aktiv) {
-                tr.classList.add("row-inactive");
-            }
+    } catch (err) {
+        console.error("❌ Fehler beim Laden:", err);
+    }
+}
+
+function renderPowderRow(p) {
+    const tr = document.createElement("tr");
+    tr.dataset.id = p.id;
+
+    if (!p.aktiv) {
+        tr.classList.add("row-inactive");
+    }
 
-            tr.innerHTML = `
+    tr.innerHTML = `
                 <td>${p.id}</td>
                 <td>${p.barcode}</td>
                 <td>${p.artikelnummer || "-"}</td>
@@ -95,12 +109,67 @@ async function loadPowders() {
                     <button class="btn-label btn btn-primary btn-sm">Label</button>
                 </td>
             `;
-            tbody.appendChild(tr);
-        });
+    return tr;
+}
 
-    } catch (err) {
-        console.error("❌ Fehler beim Laden:", err);
+
+// ==========================================================
+//  DELTA-SYNC: einzelne Zeilen statt kompletter Liste
+// ==========================================================
+
+function applyPowderChange(p) {
+    const tbody = document.querySelector("#pulver-table tbody");
+    if (!tbody) return;
+
+    const existing = tbody.querySelector(`tr[data-id="${p.id}"]`);
+    const visible = !p.deleted && (p.aktiv || showInactivePowders);
+
+    if (!visible) {
+        if (existing) existing.remove();
+        return;
+    }
+
+    const tr = renderPowderRow(p);
+    if (existing) {
+        existing.replaceWith(tr);
+        return;
     }
+
+    // Neue Zeile nach ID einsortieren
+    const next = [...tbody.children].find(row => Number(row.dataset.id) > p.id);
+    tbody.insertBefore(tr, next || null);
+}
+
+async function syncPowderChanges() {
+    if (pulverSyncRunning) return pulverSyncRunning;
+
+    pulverSyncRunning = (async () => {
+        try {
+            let hasMore = true;
+            while (hasMore) {
+                const res = await apiFetch(`/api/pulver/changes?since=${pulverChangeCursor}`);
+                if (!res.ok) throw new Error("Delta-Sync fehlgeschlagen");
+                const data = await res.json();
+
+                data.changes.forEach(applyPowderChange);
+                pulverChangeCursor = data.cursor;
+                hasMore = data.has_more;
+            }
+            reapplyFilter();
+        } catch (err) {
+            console.warn("⚠️ Delta-Sync fehlgeschlagen → komplette Liste laden", err);
+            await loadPowders();
+        } finally {
+            pulverSyncRunning = null;
+        }
+    })();
+
+    return pulverSyncRunning;
+}
+
+function reapplyFilter() {
+    const queryInput = document.getElementById("filter-query");
+    if (queryInput) queryInput.dispatchEvent(new Event("input"));
 }
 
 
@@ -165,7 +234,7 @@ async function onPulverClick(e) {
         const tr = e.target.closest("tr");
         const id = tr.dataset.id;
 
-        // 🔄 Daten frisch aus API holen (inkl. updated_at!)
+        // 🔄 Daten frisch aus API holen (inkl. version!)
         const res = await apiFetch(`/api/pulver/id/${id}`);
         const p = await res.json();
 
@@ -183,7 +252,7 @@ async function onPulverClick(e) {
         // 🟡 WICHTIG für Optimistic Locking:
         const form = document.getElementById("editPulverForm");
         form.dataset.id = id;
-        form.dataset.updated_at = p.updated_at;
+        form.dataset.version = p.version;
 
         document.getElementById("editPulverModal").classList.remove("hidden");
         return;
@@ -297,7 +366,7 @@ async function handleEditPulver(form) {
         aktiv: form["edit-aktiv"].checked,
 
         // 🔥 Optimistic Locking
-        updated_at: form.dataset.updated_at
+        version: parseInt(form.dataset.version, 10)
     };
 
     try {
@@ -453,31 +522,36 @@ function setupFilter() {
 function onPulverWebSocketEvent(e) {
     const msg = e.detail;
 
-    // Pulver wurde bearbeitet → Tabelle neu laden
-    if (msg.event === "pulver_updated") {
-        console.log("🔄 WS: pulver_updated → reload");
-        loadPowders();
-        return;
-    }
+    const PULVER_EVENTS = ["pulver_created", "pulver_updated", "pulver_deleted", "pulver_tracked", "pulver_tracked_batch"];
+    if (!PULVER_EVENTS.includes(msg.event)) return;
 
-    // Neues Pulver
-    if (msg.event === "pulver_created") {
-        console.log("🆕 WS: pulver_created → reload");
-        loadPowders();
-        return;
-    }
+    // Tabelle nicht sichtbar oder noch nicht geladen → nichts zu tun
+    if (!document.querySelector("#pulver-table tbody") || pulverChangeCursor === null) return;
 
-    // Pulver gelöscht
-    if (msg.event === "pulver_deleted") {
-        console.log("❌ WS: pulver_deleted → reload");
-        loadPowders();
+    // Genau das nächste Event → Zeile direkt patchen
+    if (msg.pulver && msg.change_seq === pulverChangeCursor + 1) {
+        console.log(`🩹 WS: ${msg.event} → Zeile ${msg.id} aktualisieren`);
+        applyPowderChange(msg.pulver);
+        pulverChangeCursor = msg.change_seq;
+        reapplyFilter();
         return;
     }
 
-    // Pulver getrackt
-    if (msg.event === "pulver_tracked") {
-        console.log("📦 WS: pulver_tracked → reload");
-        loadPowders();
+    // Sammel-Event (Batch-Tracking) → nur patchen, wenn ALLE change_seq lückenlos
+    // an den Cursor anschließen (gesammelte Events können Lücken enthalten)
+    if (msg.changes && msg.changes.length &&
+        msg.changes.every((c, i) => c.change_seq === pulverChangeCursor + 1 + i)) {
+        console.log(`🩹 WS: ${msg.event} → ${msg.changes.length} Zeilen aktualisieren`);
+        msg.changes.forEach(applyPowderChange);
+        pulverChangeCursor = msg.changes[msg.changes.length - 1].change_seq;
+        reapplyFilter();
         return;
     }
-}
\ No newline at end of file
+
+    // Bereits bekannt (z. B. durch laufenden Delta-Sync)
+    if (msg.change_seq && msg.change_seq <= pulverChangeCursor) return;
+
+    // Lücke → nur die fehlenden Änderungen nachladen
+    console.log(`🔄 WS: ${msg.event} → Delta-Sync ab ${pulverChangeCursor}`);
+    syncPowderChanges();
+}
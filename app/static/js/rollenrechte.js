@@ -143,7 +143,7 @@ async function selectRole(roleId) {
         renderPermissionCheckboxes(data.permissions);
 
         // Für Optimistic Locking speichern
-        CURRENT_ROLE.updated_at = data.updated_at;
+        CURRENT_ROLE.version = data.version;
 
     } catch (err) {
         console.error("❌ Fehler beim Laden der Rollenrechte:", err);
@@ -201,7 +201,7 @@ async function handleSavePermissions() {
             body: JSON.stringify({
                 role_id: CURRENT_ROLE.id,
                 permission_ids: ids,
-                updated_at: CURRENT_ROLE.updated_at
+                version: CURRENT_ROLE.version
             })
         });
 
@@ -209,7 +209,7 @@ async function handleSavePermissions() {
 
         if (!res.ok) throw new Error(json.detail || "Fehler");
 
-        CURRENT_ROLE.updated_at = json.updated_at;
+        CURRENT_ROLE.version = json.version;
 
         alert("Rechte erfolgreich gespeichert!");
 
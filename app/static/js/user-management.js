@@ -291,10 +291,10 @@ async function onUserClick(e) {
         
         document.getElementById("edit-active").checked = user.active;
 
-        // OPTIMISTIC LOCKING: updated_at speichern
+        // OPTIMISTIC LOCKING: version speichern
         const form = document.getElementById("editUserForm");
         form.dataset.userid = userId;
-        form.dataset.updated_at = user.updated_at;
+        form.dataset.version = user.version;
 
         document.getElementById("editUserModal").classList.remove("hidden");
         loadRolesIntoEditSelect(user.role_id);
@@ -440,7 +440,7 @@ async function handleEditUser(form) {
         role_id: parseInt(form["edit-role_id"].value),
         active: form["edit-active"].checked,
         
-        updated_at: form.dataset.updated_at
+        version: parseInt(form.dataset.version, 10)
     };
 
     try {
@@ -1,20 +1,192 @@
 import io
+import os
+import json
 import base64
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
 import barcode
-from barcode.writer import ImageWriter
+from barcode.writer import ImageWriter, SVGWriter
 
-def generate_barcode_base64(code: str) -> str:
-    """Erstellt ein Barcode-Bild (Code128) ohne Text darunter und gibt es als Base64 zurück"""
+# Einstellungen für sauberes, randloses Bild
+BARCODE_OPTIONS = {
+    "write_text": False,   # ❌ keine Zahlen unter dem Strichcode
+    "quiet_zone": 2,       # etwas weniger Rand
+    "module_height": 15.0, # Strichhöhe anpassen
+    "module_width": 0.3,   # Strichdicke
+}
+
+BARCODE_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# Optionaler Festplatten-Cache (z. B. "./barcode_cache"), leer = nur im Speicher
+BARCODE_CACHE_DIR = os.getenv("BARCODE_CACHE_DIR", "")
+BARCODE_CACHE_MAX_ENTRIES = int(os.getenv("BARCODE_CACHE_MAX_ENTRIES", "2048"))
+
+
+class BarcodeCache:
+    """
+    Inhaltsadressierter LRU-Cache für gerenderte Barcodes.
+    Schlüssel ist ein Hash aus Barcode-Text, Format und Writer-Optionen –
+    identische Barcodes werden also nur einmal gerendert.
+    """
+
+    def __init__(self, max_entries: int = BARCODE_CACHE_MAX_ENTRIES, cache_dir: str = BARCODE_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._entries: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(code: str, fmt: str, options: dict) -> str:
+        raw = json.dumps([code, fmt, options], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, code: str, fmt: str = "png", options: dict | None = None) -> tuple[bytes, str]:
+        """Gibt (Bilddaten, ETag) zurück und rendert nur bei Cache-Miss"""
+        options = options or BARCODE_OPTIONS
+        entry = self.peek(code, fmt, options)
+        if entry is not None:
+            return entry
+        return self.store(code, fmt, _render_barcode(code, fmt, options), options)
+
+    def peek(self, code: str, fmt: str = "png", options: dict | None = None) -> tuple[bytes, str] | None:
+        """Nur nachsehen (Speicher, dann Festplatte) – rendert nie"""
+        options = options or BARCODE_OPTIONS
+        key = self.key(code, fmt, options)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        data = self._load_from_disk(key, fmt)
+        if data is None:
+            return None
+        return self._remember(key, data)
+
+    def store(self, code: str, fmt: str, data: bytes, options: dict | None = None) -> tuple[bytes, str]:
+        """Extern (z. B. im Prozesspool) gerendertes Bild übernehmen"""
+        key = self.key(code, fmt, options or BARCODE_OPTIONS)
+        self._store_on_disk(key, fmt, data)
+        return self._remember(key, data)
+
+    def _remember(self, key: str, data: bytes) -> tuple[bytes, str]:
+        entry = (data, hashlib.sha256(data).hexdigest()[:32])
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _load_from_disk(self, key: str, fmt: str) -> bytes | None:
+        if not self.cache_dir:
+            return None
+        path = self.cache_dir / f"{key}.{fmt}"
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def _store_on_disk(self, key: str, fmt: str, data: bytes):
+        if not self.cache_dir:
+            return
+        path = self.cache_dir / f"{key}.{fmt}"
+        tmp = path.with_suffix(f".{fmt}.tmp{threading.get_ident()}")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _render_barcode(code: str, fmt: str, options: dict) -> bytes:
+    """Code128-Barcode als PNG (Pillow) oder SVG rendern"""
     barcode_class = barcode.get_barcode_class("code128")
+    writer = ImageWriter() if fmt == "png" else SVGWriter()
     rv = io.BytesIO()
+    barcode_class(code, writer=writer).write(rv, options)
+    return rv.getvalue()
+
+
+barcode_cache = BarcodeCache()
+
+
+# Prozesspool für Sammeldruck – Pillow-Rendering ist CPU-gebunden (0 = Anzahl CPUs)
+LABEL_RENDER_WORKERS = int(os.getenv("LABEL_RENDER_WORKERS", "0")) or None
+_render_pool: ProcessPoolExecutor | None = None
+_render_pool_lock = threading.Lock()
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # "spawn" statt fork: der Server-Prozess hat bereits Threads laufen
+            _render_pool = ProcessPoolExecutor(
+                max_workers=LABEL_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _render_pool
+
+
+def render_barcodes_parallel(codes: list[str], fmt: str = "png"):
+    """
+    Rendert alle fehlenden Barcodes parallel im Prozesspool und liefert
+    (code, bilddaten) in Eingabereihenfolge, sobald der jeweilige Barcode fertig ist.
+    """
+    futures = {}
+    for code in dict.fromkeys(codes):
+        if barcode_cache.peek(code, fmt) is None:
+            futures[code] = _get_render_pool().submit(_render_barcode, code, fmt, BARCODE_OPTIONS)
+
+    for code in codes:
+        future = futures.pop(code, None)
+        if future is not None:
+            data, _ = barcode_cache.store(code, fmt, future.result())
+        else:
+            data, _ = barcode_cache.get(code, fmt)
+        yield code, data
+
+
+def encode_cursor(values: list) -> str:
+    """Keyset-Cursor (z. B. [sortwert, id]) als URL-sicheren String kodieren"""
+    raw = json.dumps(values, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Gegenstück zu encode_cursor – wirft ValueError bei ungültigem Cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("Ungültiger Cursor") from exc
+    if not isinstance(values, list):
+        raise ValueError("Ungültiger Cursor")
+    return values
 
-    # Einstellungen für sauberes, randloses Bild
-    options = {
-        "write_text": False,   # ❌ keine Zahlen unter dem Strichcode
-        "quiet_zone": 2,       # etwas weniger Rand
-        "module_height": 15.0, # Strichhöhe anpassen
-        "module_width": 0.3,   # Strichdicke
-    }
 
-    barcode_class(code, writer=ImageWriter()).write(rv, options)
-    return base64.b64encode(rv.getvalue()).decode("utf-8")
\ No newline at end of file
+def like_pattern(text: str) -> str:
+    """Suchtext für ILIKE '%text%' escapen (Escape-Zeichen: Backslash)"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
@@ -0,0 +1,358 @@
+# app/ws_bus.py
+"""
+Event-Bus zwischen mehreren uvicorn-Workern.
+
+Jeder Worker hält nur seine eigenen WebSockets. ConnectionManager.broadcast stellt
+ein Event lokal zu und veröffentlicht es zusätzlich über den Bus; die anderen
+Worker empfangen es und geben es an ihre lokalen Verbindungen weiter.
+
+WS_BUS = local     → nur dieser Prozess (Standard, ein Worker)
+WS_BUS = unix      → Unix-Datagram-Sockets in WS_BUS_SOCKET_DIR (mehrere Worker auf einem Host)
+WS_BUS = postgres  → PostgreSQL LISTEN/NOTIFY (mehrere Worker/Hosts an derselben DB)
+WS_BUS_SEND_TIMEOUT_MS → unix: so lange wird auf einen vollen Empfänger gewartet
+
+Neben den WS-Events laufen über denselben Bus Steuer-Nachrichten zwischen den
+Workern ("!<art>\n<daten>"), z. B. "Benutzer X aus dem Principal-Cache werfen".
+Module melden per on_control() einen Handler an und senden mit notify().
+
+Unix und PostgreSQL stückeln große Nachrichten ("<worker>|<nr>|<teil>|<anzahl>|<daten>").
+Unvollständige Nachrichten (Teil verloren, Verbindung weg) hält der Empfänger nur
+begrenzt fest. Verworfene Nachrichten werden gezählt und geloggt.
+"""
+
+import asyncio
+import glob
+import itertools
+import logging
+import os
+import secrets
+import socket
+from typing import Callable
+from sqlalchemy.engine import make_url
+from app.database import SQLALCHEMY_DATABASE_URL
+
+WS_BUS = os.getenv("WS_BUS", "local")
+WS_BUS_SOCKET_DIR = os.getenv("WS_BUS_SOCKET_DIR", "/tmp/ws-bus")
+WS_BUS_CHANNEL = os.getenv("WS_BUS_CHANNEL", "ws_events")
+WS_BUS_RECONNECT_SECONDS = 2.0
+
+logger = logging.getLogger(__name__)
+
+# Unix-Datagramme: gewünschte Socket-Puffer. Der Kernel kappt sie (net.core.wmem_max /
+# rmem_max) – die tatsächliche Größe wird zurückgelesen und größere Nachrichten gestückelt
+UNIX_SOCKET_BUFFER_BYTES = 4 * 1024 * 1024
+
+# Empfänger-Warteschlange voll (net.unix.max_dgram_qlen) → so lange pro Worker auf Platz warten
+UNIX_SEND_TIMEOUT_MS = int(os.getenv("WS_BUS_SEND_TIMEOUT_MS", "100"))
+
+# Platz für den Kopf "<worker>|<nr>|<teil>|<anzahl>|" in jedem Datagramm
+FRAME_HEADER_BYTES = 256
+
+# Höchstens so viele unvollständige Nachrichten festhalten (älteste fliegt raus)
+BUS_MAX_PARTIAL_MESSAGES = 64
+
+# NOTIFY-Payload ist auf 8000 Bytes begrenzt → größere Events werden gestückelt
+NOTIFY_CHUNK_BYTES = 7000
+
+# Steuer-Nachrichten beginnen mit diesem Zeichen (WS-Events beginnen mit dem Thema)
+CONTROL_PREFIX = "!"
+
+
+class LocalBus:
+    """Ein Prozess – nichts zu verteilen"""
+    name = "local"
+
+    def __init__(self):
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self._deliver: Callable[[str], None] | None = None
+        self._handlers: dict[str, Callable[[str], None]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+        # Stückelung (Unix, PostgreSQL): eigene Kennung, Nachrichtennummer, halbe Nachrichten
+        self._origin = f"{socket.gethostname()}-{os.getpid()}-{secrets.token_hex(2)}"
+        self._ids = itertools.count(1)
+        self._parts: dict[tuple[str, str], list[str]] = {}
+
+    async def start(self, deliver: Callable[[str], None]):
+        self._deliver = deliver
+
+    async def publish(self, text: str):
+        pass
+
+    def on_control(self, kind: str, handler: Callable[[str], None]):
+        """Handler für Steuer-Nachrichten der anderen Worker (läuft im Event-Loop)"""
+        self._handlers[kind] = handler
+
+    def notify(self, kind: str, data: str = ""):
+        """Steuer-Nachricht an die anderen Worker – auch aus sync Routen (Threadpool) aufrufbar"""
+        if self._loop is None:
+            return  # ein Prozess bzw. Bus nicht gestartet
+        coro = self.publish(f"{CONTROL_PREFIX}{kind}\n{data}")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            running.create_task(coro)
+        else:
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _dispatch(self, text: str):
+        """Empfangene Nachricht: Steuer-Nachricht an ihren Handler, sonst WS-Event"""
+        if not text.startswith(CONTROL_PREFIX):
+            self._deliver(text)
+            return
+        kind, _, data = text[len(CONTROL_PREFIX):].partition("\n")
+        handler = self._handlers.get(kind)
+        if handler is not None:
+            handler(data)
+
+    def _frames(self, text: str, limit: int) -> list[str]:
+        """Nachricht in Teile mit Kopf "<worker>|<nr>|<teil>|<anzahl>|" zerlegen (Daten ≤ limit Bytes)"""
+        message_id = next(self._ids)
+        chunks = _split_utf8(text.encode("utf-8"), limit)
+        return [f"{self._origin}|{message_id}|{index}|{len(chunks)}|{chunk}" for index, chunk in enumerate(chunks)]
+
+    def _receive_frame(self, frame: str):
+        """Teil einer Nachricht – sobald alle Teile da sind, wird sie weitergegeben"""
+        origin, message_id, index, count, data = frame.split("|", 4)
+        if origin == self._origin:
+            return
+        if count == "1":
+            self.received += 1
+            self._dispatch(data)
+            return
+
+        key = (origin, message_id)
+        parts = self._parts.setdefault(key, [])
+        if int(index) != len(parts):
+            # Teil fehlt → die Nachricht wird nie vollständig
+            del self._parts[key]
+            self._drop(f"Nachricht {origin}/{message_id} unvollständig (Teil {len(parts)} fehlt)")
+            return
+
+        parts.append(data)
+        if len(parts) < int(count):
+            if len(self._parts) > BUS_MAX_PARTIAL_MESSAGES:
+                stale = next(iter(self._parts))
+                del self._parts[stale]
+                self._drop(f"Nachricht {stale[0]}/{stale[1]} unvollständig verworfen")
+            return
+
+        del self._parts[key]
+        self.received += 1
+        self._dispatch("".join(parts))
+
+    def _drop_partial(self, reason: str):
+        """Alle halben Nachrichten verwerfen (z. B. nach Verbindungsverlust)"""
+        for origin, message_id in self._parts:
+            self._drop(f"Nachricht {origin}/{message_id} unvollständig ({reason})")
+        self._parts.clear()
+
+    def _drop(self, reason: str):
+        self.dropped += 1
+        logger.warning("Event-Bus (%s): %s", self.name, reason)
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published, "received": self.received,
+                "dropped": self.dropped, "partial": len(self._parts)}
+
+
+class UnixSocketBus(LocalBus):
+    """
+    Jeder Worker bindet <dir>/<pid>.sock; veröffentlicht wird per sendto an alle
+    anderen Sockets im Verzeichnis. Sockets beendeter Worker werden dabei aufgeräumt.
+    """
+    name = "unix"
+
+    def __init__(self, directory: str = WS_BUS_SOCKET_DIR):
+        super().__init__()
+        self._directory = directory
+        self._path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._sock: socket.socket | None = None
+        self._lock = asyncio.Lock()
+        self.datagram_bytes = 0
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._loop = asyncio.get_running_loop()
+        os.makedirs(self._directory, exist_ok=True)
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UNIX_SOCKET_BUFFER_BYTES)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UNIX_SOCKET_BUFFER_BYTES)
+        # Linux meldet den doppelten Wert (Verwaltungsanteil) → die Hälfte passt sicher in ein Datagramm
+        self.datagram_bytes = min(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+        ) // 2
+        if self.datagram_bytes < UNIX_SOCKET_BUFFER_BYTES:
+            logger.info("Event-Bus (unix): Socket-Puffer gekappt, Nachrichten über %d Bytes werden gestückelt",
+                        self.datagram_bytes - FRAME_HEADER_BYTES)
+        sock.bind(self._path)
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(self.datagram_bytes)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._receive_frame(data.decode("utf-8"))
+
+    async def publish(self, text: str):
+        if self._sock is None:
+            return
+        frames = [frame.encode("utf-8") for frame in self._frames(text, self.datagram_bytes - FRAME_HEADER_BYTES)]
+        self.published += 1
+
+        # Nacheinander: die Teile verschiedener Nachrichten sollen sich nicht überholen
+        async with self._lock:
+            for path in glob.glob(os.path.join(self._directory, "*.sock")):
+                if path != self._path:
+                    await self._send_frames(frames, path)
+
+    async def _send_frames(self, frames: list[bytes], path: str):
+        loop = asyncio.get_running_loop()
+        try:
+            for frame in frames:
+                deadline = loop.time() + UNIX_SEND_TIMEOUT_MS / 1000
+                while self._sock is not None:
+                    try:
+                        self._sock.sendto(frame, path)
+                        break
+                    except BlockingIOError:
+                        # Empfänger liest gerade nicht mit – kurz warten, ein hängender Worker bremst nicht lange
+                        if loop.time() >= deadline:
+                            raise
+                        await asyncio.sleep(0.001)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Worker existiert nicht mehr
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        except OSError as exc:
+            # Empfänger-Puffer voll – Rest der Nachricht nicht mehr an diesen Worker
+            self._drop(f"Nachricht an {os.path.basename(path)} verworfen ({exc.__class__.__name__})")
+
+    async def stop(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+
+def _split_utf8(data: bytes, limit: int) -> list[str]:
+    """Bytes in Stücke ≤ limit teilen, ohne ein UTF-8-Zeichen zu zerschneiden"""
+    chunks, start = [], 0
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        chunks.append(data[start:end].decode("utf-8"))
+        start = end
+    return chunks or [""]
+
+
+class PostgresBus(LocalBus):
+    """
+    LISTEN/NOTIFY über eine eigene asyncpg-Verbindung (zusätzlich zum Pool).
+    Nachricht: "<worker>|<nr>|<teil>|<anzahl>|<daten>" – eigene Nachrichten werden ignoriert.
+    """
+    name = "postgres"
+
+    def __init__(self, dsn: str, channel: str = WS_BUS_CHANNEL):
+        super().__init__()
+        self._dsn = dsn
+        self._channel = channel
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._stopping = False
+
+    async def start(self, deliver):
+        await super().start(deliver)
+        self._loop = asyncio.get_running_loop()
+        await self._connect()
+
+    async def _connect(self):
+        import asyncpg
+
+        conn = await asyncpg.connect(self._dsn)
+        await conn.add_listener(self._channel, self._on_notify)
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+
+    def _on_terminated(self, conn):
+        self._conn = None
+        # Restliche Teile laufen über eine andere Verbindung nicht mehr ein
+        self._drop_partial("Verbindung verloren")
+        if not self._stopping:
+            asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopping and self._conn is None:
+            await asyncio.sleep(WS_BUS_RECONNECT_SECONDS)
+            try:
+                await self._connect()
+            except Exception as exc:
+                logger.warning("Event-Bus (postgres): Verbindung fehlgeschlagen (%s), neuer Versuch", exc)
+                continue
+
+    def _on_notify(self, conn, pid, channel, payload: str):
+        self._receive_frame(payload)
+
+    async def publish(self, text: str):
+        if self._conn is None:
+            self._drop("keine Verbindung, Nachricht verworfen")
+            return
+
+        frames = self._frames(text, NOTIFY_CHUNK_BYTES)
+
+        try:
+            async with self._lock:
+                # Eine Transaktion → alle Teile kommen zusammen und in Reihenfolge an
+                async with self._conn.transaction():
+                    for frame in frames:
+                        await self._conn.execute("SELECT pg_notify($1, $2)", self._channel, frame)
+            self.published += 1
+        except Exception as exc:
+            self._drop(f"NOTIFY fehlgeschlagen ({exc.__class__.__name__}), Nachricht verworfen")
+
+    async def stop(self):
+        self._stopping = True
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+def _postgres_dsn() -> str:
+    url = os.getenv("WS_BUS_URL") or SQLALCHEMY_DATABASE_URL
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def create_bus():
+    if WS_BUS == "unix":
+        return UnixSocketBus()
+    if WS_BUS == "postgres":
+        return PostgresBus(_postgres_dsn())
+    if WS_BUS != "local":
+        raise RuntimeError(f"Unbekannter WS_BUS '{WS_BUS}' (erlaubt: local, unix, postgres)")
+    return LocalBus()
+
+
+event_bus = create_bus()
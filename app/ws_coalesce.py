@@ -0,0 +1,135 @@
+# app/ws_coalesce.py
+"""
+Zeitfenster vor ConnectionManager.broadcast: gleichartige Events (z. B. die
+pulver_tracked einer Inventur) werden kurz gesammelt und als ein
+"<event>_batch" mit allen betroffenen IDs verschickt.
+
+Geflusht wird, sobald das Fenster abläuft, die Batch-Größe erreicht ist oder
+ein anderes Event desselben Themas kommt (Reihenfolge bleibt erhalten).
+Ein Fenster mit nur einem Event geht unverändert raus.
+
+WS_COALESCE_EVENTS     → Events, die gesammelt werden (Komma-Liste, leer = aus)
+WS_COALESCE_WINDOW_MS  → Fensterlänge in ms (0 = aus)
+WS_COALESCE_MAX_BATCH  → spätestens nach so vielen Events flushen
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+WS_COALESCE_EVENTS = tuple(e for e in os.getenv("WS_COALESCE_EVENTS", "pulver_tracked").split(",") if e)
+WS_COALESCE_WINDOW_MS = int(os.getenv("WS_COALESCE_WINDOW_MS", "150"))
+WS_COALESCE_MAX_BATCH = int(os.getenv("WS_COALESCE_MAX_BATCH", "200"))
+
+
+def merge_events(name: str, events: list[dict]) -> dict:
+    """Mehrere Events gleichen Typs → ein Sammel-Event (Format wie pulver_tracked_batch)"""
+    merged = {
+        "event": f"{name}_batch",
+        "ids": list(dict.fromkeys(e["id"] for e in events if "id" in e)),
+        "count": len(events),
+    }
+
+    seqs = [e["change_seq"] for e in events if e.get("change_seq")]
+    if seqs:
+        merged["change_seq"] = max(seqs)
+
+    # Zeilen für den Delta-Patch im Client (fortlaufend nach change_seq)
+    changes = [e["pulver"] for e in events if e.get("pulver")]
+    if changes:
+        merged["changes"] = sorted(changes, key=lambda c: c.get("change_seq") or 0)
+
+    return merged
+
+
+class _Batch:
+    __slots__ = ("topic", "events", "started", "timer")
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.events: list[dict] = []
+        self.started = time.monotonic()
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class EventCoalescer:
+    def __init__(self, publish: Callable[[str, dict], Awaitable[None]],
+                 events=WS_COALESCE_EVENTS, window_ms: int = WS_COALESCE_WINDOW_MS,
+                 max_batch: int = WS_COALESCE_MAX_BATCH):
+        self._publish = publish
+        self.events = frozenset(events)
+        self.window_ms = window_ms
+        self.max_batch = max(max_batch, 1)
+        self._pending: dict[str, _Batch] = {}
+
+        self.events_in = 0
+        self.messages_out = 0
+        self.flushed = {"window": 0, "size": 0, "order": 0, "shutdown": 0}
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._latency_total_ms = 0.0
+
+    def accepts(self, message: dict) -> bool:
+        return self.window_ms > 0 and message.get("event") in self.events
+
+    async def add(self, topic: str, message: dict):
+        name = message["event"]
+        batch = self._pending.get(name)
+        if batch is None:
+            batch = self._pending[name] = _Batch(topic)
+            loop = asyncio.get_running_loop()
+            batch.timer = loop.call_later(
+                self.window_ms / 1000, lambda: loop.create_task(self._flush(name, "window"))
+            )
+
+        batch.events.append(message)
+        self.events_in += 1
+
+        if len(batch.events) >= self.max_batch:
+            await self._flush(name, "size")
+
+    async def flush_topic(self, topic: str, reason: str = "order"):
+        """Offene Fenster eines Themas vor einem anderen Event desselben Themas leeren"""
+        for name in [n for n, b in self._pending.items() if b.topic == topic]:
+            await self._flush(name, reason)
+
+    async def flush_all(self, reason: str = "shutdown"):
+        for name in list(self._pending):
+            await self._flush(name, reason)
+
+    async def _flush(self, name: str, reason: str):
+        batch = self._pending.pop(name, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        events = batch.events
+        message = events[0] if len(events) == 1 else merge_events(name, events)
+
+        latency_ms = (time.monotonic() - batch.started) * 1000
+        self.flushed[reason] += 1
+        self.messages_out += 1
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self._latency_total_ms += latency_ms
+
+        await self._publish(batch.topic, message)
+
+    def stats(self) -> dict:
+        flushes = self.messages_out
+        return {
+            "events": sorted(self.events),
+            "window_ms": self.window_ms,
+            "max_batch": self.max_batch,
+            "pending": {name: len(b.events) for name, b in self._pending.items()},
+            "events_in": self.events_in,
+            "messages_out": flushes,
+            "flushed": dict(self.flushed),
+            "flush_latency_ms": {
+                "last": round(self.last_latency_ms, 2),
+                "avg": round(self._latency_total_ms / flushes, 2) if flushes else 0.0,
+                "max": round(self.max_latency_ms, 2),
+            },
+        }
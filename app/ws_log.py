@@ -0,0 +1,309 @@
+# app/ws_log.py
+"""
+Sequenziertes Event-Log für /ws/app.
+
+Jedes Broadcast-Event bekommt eine fortlaufende Nummer ("seq") und landet in
+einem begrenzten Ringpuffer. Ein Client, der sich nach einem Abbruch neu
+verbindet, schickt seine letzte seq und bekommt nur die verpassten Events.
+"resync_required" gibt es nur, wenn die Lücke schon aus dem Puffer gefallen ist.
+
+WS_EVENT_LOG_SIZE           → Events im Ringpuffer (pro Prozess)
+WS_EVENT_LOG_PERSIST=1      → zusätzlich die letzten WS_EVENT_LOG_PERSIST_SIZE Events
+                              in der Tabelle ws_events; die seq ist dann die Zeilen-ID
+                              und damit über alle Worker gleich
+WS_EVENT_LOG_GAP_MS         → so lange wartet ein Worker auf eine fehlende seq
+
+Ohne Persistenz zählt jeder Worker selbst. Die "epoch" kennzeichnet die Zählung –
+landet ein Client nach einem Neustart oder bei einem anderen Worker, passt sie
+nicht mehr und er muss neu laden. Mit mehreren Workern (WS_BUS ≠ local) ist die
+Persistenz deshalb Pflicht und standardmäßig an.
+
+Mit Persistenz kommen Events anderer Worker über den Bus später an als eigene:
+Worker B kann seine seq 12 schon haben, während die 11 von Worker A noch unterwegs
+ist. Events werden darum strikt in seq-Reihenfolge zugestellt – eine spätere seq
+wartet, bis die Lücke gefüllt ist (höchstens WS_EVENT_LOG_GAP_MS). Sonst sähe ein
+Client 12 vor 11, würde mit since=12 fortsetzen und die 11 nie bekommen.
+
+Die Inserts laufen gebündelt über eine eigene Verbindung (database.event_session),
+nicht über die Schreib-Engine der Routen: während ein Insert läuft, sammeln sich
+die nächsten Events und gehen gemeinsam in EINER Transaktion raus.
+"""
+
+import asyncio
+import os
+import secrets
+from collections import deque
+from typing import Callable
+from sqlalchemy import delete, func, insert, select
+from app.database import event_session
+from app.models import WsEvent
+
+WS_EVENT_LOG_SIZE = int(os.getenv("WS_EVENT_LOG_SIZE", "1000"))
+# Mehrere Worker brauchen die gemeinsame Zählung aus der Datenbank
+WS_EVENT_LOG_PERSIST = os.getenv(
+    "WS_EVENT_LOG_PERSIST", "0" if os.getenv("WS_BUS", "local") == "local" else "1"
+) == "1"
+WS_EVENT_LOG_PERSIST_SIZE = int(os.getenv("WS_EVENT_LOG_PERSIST_SIZE", "10000"))
+WS_EVENT_LOG_GAP_MS = int(os.getenv("WS_EVENT_LOG_GAP_MS", "200"))
+
+# Alte Zeilen nicht bei jedem Insert löschen
+WS_EVENT_LOG_TRIM_EVERY = 500
+
+
+def with_seq(seq: int | None, body: str) -> str:
+    """seq vorne in das fertig serialisierte JSON-Objekt einsetzen (ohne neu zu serialisieren)"""
+    if seq is None:
+        return body
+    return f'{{"seq":{seq},{body[1:]}'
+
+
+class EventLog:
+    """
+    Nummeriert Events und gibt sie in seq-Reihenfolge an `deliver(topic, text)`
+    weiter (ConnectionManager.deliver). head ist die höchste zugestellte seq –
+    alles darunter ist entweder zugestellt oder als Lücke aufgegeben.
+    """
+
+    def __init__(self, deliver: Callable[[str, str], None], size: int = WS_EVENT_LOG_SIZE,
+                 persist: bool = WS_EVENT_LOG_PERSIST, persist_size: int = WS_EVENT_LOG_PERSIST_SIZE,
+                 gap_ms: int = WS_EVENT_LOG_GAP_MS):
+        self._deliver = deliver
+        self.size = size
+        self.persist = persist
+        self.persist_size = persist_size
+        self.gap_seconds = gap_ms / 1000
+        self.epoch = "db" if persist else secrets.token_hex(4)
+        self._entries: deque[tuple[int, str, str]] = deque(maxlen=size)
+        self._seq = 0
+        self._inserts = 0
+
+        # seq → (topic, body): wartet auf eine fehlende kleinere seq
+        self._held: dict[int, tuple[str, str]] = {}
+        self._gap_timer: asyncio.TimerHandle | None = None
+
+        # Gebündelte Inserts: (topic, body, Future der seq)
+        self._pending_inserts: list[tuple[str, str, asyncio.Future]] = []
+        self._flusher: asyncio.Task | None = None
+
+        self.appended = 0
+        self.held_back = 0
+        self.gaps_skipped = 0
+        self.late = 0
+        self.insert_batches = 0
+        self.replayed = 0
+        self.replayed_from_db = 0
+        self.resyncs = 0
+        self.persist_errors = 0
+
+    @property
+    def head(self) -> int:
+        return self._seq
+
+    def position(self) -> dict:
+        return {"seq": self._seq, "epoch": self.epoch}
+
+    async def start(self):
+        """Mit Persistenz: Zählung dort fortsetzen, wo die Tabelle steht"""
+        if not self.persist:
+            return
+        async with event_session() as db:
+            self._seq = await db.scalar(select(func.max(WsEvent.seq))) or 0
+
+    # ------------------------------------------------------------
+    # 🔹 Schreiben
+    # ------------------------------------------------------------
+    async def append(self, topic: str, body: str) -> int | None:
+        """Eigenes Event nummerieren und zustellen → seq (für den Bus)"""
+        if not self.persist:
+            seq = self._seq + 1
+            self._deliver(topic, self._remember(seq, topic, body))
+            return seq
+
+        try:
+            seq = await self._insert(topic, body)
+        except Exception:
+            # Event trotzdem zustellen – nur ohne seq (Client kann es nicht nachholen)
+            self.persist_errors += 1
+            self._deliver(topic, body)
+            return None
+
+        self._sequence(seq, topic, body)
+        return seq
+
+    def append_remote(self, topic: str, seq: int | None, body: str):
+        """Event eines anderen Workers: mit Persistenz gilt dessen seq, sonst eigene Zählung"""
+        if not self.persist:
+            self._deliver(topic, self._remember(self._seq + 1, topic, body))
+        elif seq is None:
+            self._deliver(topic, body)
+        else:
+            self._sequence(seq, topic, body)
+
+    def _remember(self, seq: int, topic: str, body: str) -> str:
+        text = with_seq(seq, body)
+        self._entries.append((seq, topic, text))
+        self._seq = max(self._seq, seq)
+        self.appended += 1
+        return text
+
+    # ------------------------------------------------------------
+    # 🔹 Reihenfolge (nur mit Persistenz)
+    # ------------------------------------------------------------
+    def _sequence(self, seq: int, topic: str, body: str):
+        if seq <= self._seq:
+            # Lücke wurde schon aufgegeben (oder Duplikat) → trotzdem zustellen
+            self.late += 1
+            self._deliver(topic, self._remember(seq, topic, body))
+            return
+
+        self._held[seq] = (topic, body)
+        self._release()
+        if seq in self._held:
+            self.held_back += 1
+
+    def _release(self):
+        """Alles zustellen, was lückenlos an head anschließt"""
+        while self._seq + 1 in self._held:
+            seq = self._seq + 1
+            topic, body = self._held.pop(seq)
+            self._deliver(topic, self._remember(seq, topic, body))
+
+        if not self._held:
+            if self._gap_timer is not None:
+                self._gap_timer.cancel()
+                self._gap_timer = None
+        elif self._gap_timer is None:
+            self._gap_timer = asyncio.get_running_loop().call_later(self.gap_seconds, self._skip_gap)
+
+    def _skip_gap(self):
+        """Fehlende seq kam nicht (Bus-Verlust, Rollback) → bis zur nächsten vorhandenen springen"""
+        self._gap_timer = None
+        if self._held:
+            self.gaps_skipped += 1
+            self._seq = min(self._held) - 1
+            self._release()
+
+    # ------------------------------------------------------------
+    # 🔹 Gebündelte Inserts
+    # ------------------------------------------------------------
+    async def _insert(self, topic: str, body: str) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._pending_inserts.append((topic, body, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_inserts())
+        return await future
+
+    async def _flush_inserts(self):
+        # Was während eines Inserts dazukommt, geht im nächsten Durchlauf gemeinsam raus
+        while self._pending_inserts:
+            batch, self._pending_inserts = self._pending_inserts, []
+            try:
+                seqs = await self._insert_batch([(topic, body) for topic, body, _ in batch])
+            except Exception as exc:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for (_, _, future), seq in zip(batch, seqs):
+                if not future.done():
+                    future.set_result(seq)
+
+    async def _insert_batch(self, events: list[tuple[str, str]]) -> list[int]:
+        async with event_session() as db:
+            rows = await db.execute(
+                insert(WsEvent).returning(WsEvent.seq, sort_by_parameter_order=True),
+                [{"topic": topic, "payload": body} for topic, body in events],
+            )
+            seqs = list(rows.scalars())
+
+            trim_before = self._inserts // WS_EVENT_LOG_TRIM_EVERY
+            self._inserts += len(seqs)
+            if self._inserts // WS_EVENT_LOG_TRIM_EVERY != trim_before:
+                await db.execute(delete(WsEvent).where(WsEvent.seq <= seqs[-1] - self.persist_size))
+
+            await db.commit()
+
+        self.insert_batches += 1
+        return seqs
+
+    # ------------------------------------------------------------
+    # 🔹 Nachholen
+    # ------------------------------------------------------------
+    async def replay(self, since: int, epoch: str, topics) -> list[str] | None:
+        """
+        Verpasste Events (seq > since) der Themen als fertige JSON-Texte.
+        None → Lücke nicht mehr vorhanden, Client muss neu laden.
+        """
+        topics = set(topics)
+
+        if epoch != self.epoch:
+            self.resyncs += 1
+            return None
+        if since >= self._seq:
+            return []
+
+        oldest = self._entries[0][0] if self._entries else self._seq + 1
+        if since + 1 >= oldest:
+            texts = [text for seq, topic, text in sorted(self._entries) if seq > since and topic in topics]
+            self.replayed += len(texts)
+            return texts
+
+        if self.persist:
+            texts = await self._replay_from_db(since, topics)
+            if texts is not None:
+                return texts
+
+        self.resyncs += 1
+        return None
+
+    async def _replay_from_db(self, since: int, topics: set[str]) -> list[str] | None:
+        # Nur bis head: darunter ist jede seq zugestellt oder als Lücke aufgegeben. Darüber kann
+        # die Tabelle schon seq N+1 enthalten, während N noch nicht committet ist (PostgreSQL
+        # vergibt die seq vor dem Commit) – der Client setzte sonst bei N+1 fort und verlöre N.
+        # Alles über head kommt live und in seq-Reihenfolge, sobald er abonniert ist.
+        head = self._seq
+        try:
+            async with event_session() as db:
+                floor = await db.scalar(select(func.min(WsEvent.seq)))
+                if floor is None or since + 1 < floor:
+                    return None
+                rows = (await db.execute(
+                    select(WsEvent.seq, WsEvent.payload)
+                    .where(WsEvent.seq > since, WsEvent.seq <= head, WsEvent.topic.in_(topics))
+                    .order_by(WsEvent.seq)
+                )).all()
+        except Exception:
+            self.persist_errors += 1
+            return None
+
+        texts = [with_seq(seq, payload) for seq, payload in rows]
+        last = rows[-1][0] if rows else since
+
+        # Was während der Abfrage dazukam, steht schon im Ringpuffer
+        texts += [text for seq, topic, text in sorted(self._entries) if seq > last and topic in topics]
+
+        self.replayed_from_db += len(rows)
+        self.replayed += len(texts)
+        return texts
+
+    def stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "head": self._seq,
+            "size": self.size,
+            "retained": len(self._entries),
+            "oldest": self._entries[0][0] if self._entries else None,
+            "evicted": max(self.appended - len(self._entries), 0),
+            "persist": self.persist,
+            "replayed": self.replayed,
+            "replayed_from_db": self.replayed_from_db,
+            "resyncs": self.resyncs,
+            "persist_errors": self.persist_errors,
+            "held": len(self._held),
+            "held_back": self.held_back,
+            "gaps_skipped": self.gaps_skipped,
+            "late": self.late,
+            "inserts": self._inserts,
+            "insert_batches": self.insert_batches,
+        }
@@ -1,22 +1,258 @@
+import asyncio
+import os
+import time
 from fastapi import WebSocket, WebSocketDisconnect
+from app.permissions import permission_registry
+from app.serialization import dumps
+from app.ws_coalesce import EventCoalescer
+from app.ws_log import EventLog
+
+# Ausgehende Nachrichten pro Verbindung – wer mehr Rückstand hat, wird getrennt
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
+# Close-Code für zu langsame Clients ("Try Again Later") – der Client verbindet sich neu
+WS_SLOW_CONSUMER_CLOSE_CODE = 1013
+WS_CLOSE_TIMEOUT_SECONDS = 2.0
+WS_TOKEN_EXPIRED_CLOSE_CODE = 4401
+
+# Themen → benötigte Berechtigung (eine davon reicht)
+WS_TOPIC_PERMISSIONS = {
+    "pulver": ("pulver.manage", "pulver.track"),
+    "users": ("user.manage",),
+    "roles": ("roles.manage",),
+    "locks": ("pulver.manage",),
+}
+
+# Event-Präfix ("pulver_tracked" → "pulver") → Thema
+WS_EVENT_TOPICS = {
+    "pulver": "pulver",
+    "user": "users",
+    "role": "roles",
+    "permission": "roles",
+    "lock": "locks",
+}
+
+
+def event_topic(message: dict) -> str | None:
+    return WS_EVENT_TOPICS.get(str(message.get("event", "")).split("_", 1)[0])
+
+
+def may_subscribe(role_id, topic: str) -> bool:
+    # Nur bekannte Themen als String (Listen o. Ä. aus dem JSON wären nicht hashbar)
+    if not isinstance(topic, str):
+        return False
+    return any(permission_registry.has_permission(role_id, p) for p in WS_TOPIC_PERMISSIONS.get(topic, ()))
+
+
+class _Client:
+    """Eine Verbindung mit eigener Sende-Queue, eigenem Writer-Task und Themen"""
+    __slots__ = ("websocket", "queue", "writer", "role_id", "expires_at", "topics")
+
+    def __init__(self, websocket: WebSocket, queue_size: int, role_id, expires_at):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task | None = None
+        self.role_id = role_id
+        self.expires_at = expires_at
+        self.topics: set[str] = set()
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """
+    Broadcast ohne gegenseitiges Blockieren: die Nachricht wird einmal serialisiert
+    und nur in die Queues der Verbindungen gelegt. Jede Verbindung sendet in ihrem
+    eigenen Task – ein hängender Browser-Tab bremst die anderen nicht mehr aus.
+    Läuft eine Queue über, wird der Client getrennt (Slow Consumer).
+
+    Mit mehreren Workern verteilt der Event-Bus (app/ws_bus.py) jedes Event an die
+    anderen Prozesse, die es per deliver_remote() an ihre lokalen Verbindungen geben.
+
+    Zugestellt wird nur an Verbindungen, die das Thema des Events abonniert haben
+    und deren Rolle die passende Berechtigung besitzt (Index Thema → Verbindungen).
+
+    Häufige Events (WS_COALESCE_EVENTS) laufen vorher durch ein kurzes Sammelfenster
+    (app/ws_coalesce.py) und gehen als ein "<event>_batch" raus.
 
-    async def connect(self, websocket: WebSocket):
+    Jedes Event bekommt eine seq und bleibt im Event-Log (app/ws_log.py), damit
+    Clients nach einem Reconnect per resume() nur das Verpasste nachholen.
+    """
+
+    def __init__(self, queue_size: int = WS_SEND_QUEUE_SIZE):
+        self._queue_size = queue_size
+        self._clients: dict[WebSocket, _Client] = {}
+        self._topics: dict[str, set[_Client]] = {topic: set() for topic in WS_TOPIC_PERMISSIONS}
+        self.bus = None
+        self.coalescer = EventCoalescer(self._publish)
+        self.log = EventLog(self.deliver)
+        self.broadcasts = 0
+        self.messages_queued = 0
+        self.messages_sent = 0
+        self.evicted_slow = 0
+        self.unrouted = 0
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self._clients)
+
+    async def connect(self, websocket: WebSocket, role_id=None, expires_at=None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = _Client(websocket, self._queue_size, role_id, expires_at)
+        client.writer = asyncio.create_task(self._writer(client))
+        self._clients[websocket] = client
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        for topic in client.topics:
+            self._topics[topic].discard(client)
+        if client.writer and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics) -> tuple[list[str], list[str]]:
+        """Themen abonnieren – gibt (aktuelle Themen, abgelehnte Themen) zurück"""
+        client = self._clients.get(websocket)
+        if client is None:
+            return [], list(topics)
+
+        denied = []
+        for topic in topics:
+            if may_subscribe(client.role_id, topic):
+                client.topics.add(topic)
+                self._topics[topic].add(client)
+            else:
+                denied.append(topic)
+        return sorted(client.topics), denied
+
+    async def resume(self, websocket: WebSocket, topics, since: int, epoch: str) -> tuple[list[str], list[str]]:
+        """Abonnieren und alle Events nach `since` nachreichen (oder resync_required)"""
+        client = self._clients.get(websocket)
+        if client is None:
+            return [], list(topics)
+
+        allowed = [t for t in topics if may_subscribe(client.role_id, t)]
+        missed = await self.log.replay(since, epoch, allowed)
+
+        # Ab hier kein await mehr → kein Live-Event kann sich zwischen Nachgeholtes und Abo schieben
+        current, denied = self.subscribe(websocket, topics)
+        if missed is None:
+            self.send(websocket, {"event": "resync_required", "topics": current, **self.log.position()})
+            return current, denied
+
+        for text in missed:
+            try:
+                client.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self._evict(client)
+                break
+        return current, denied
+
+    def unsubscribe(self, websocket: WebSocket, topics) -> list[str]:
+        client = self._clients.get(websocket)
+        if client is None:
+            return []
+        for topic in topics:
+            if isinstance(topic, str) and topic in client.topics:
+                client.topics.discard(topic)
+                self._topics[topic].discard(client)
+        return sorted(client.topics)
+
+    def send(self, websocket: WebSocket, message: dict):
+        """Direkte Antwort an eine Verbindung (über deren Queue, Reihenfolge bleibt erhalten)"""
+        client = self._clients.get(websocket)
+        if client is None:
+            return
+        try:
+            client.queue.put_nowait(dumps(message).decode("utf-8"))
+        except asyncio.QueueFull:
+            self._evict(client)
+
+    async def _writer(self, client: _Client):
+        try:
+            while True:
+                text = await client.queue.get()
+                await client.websocket.send_text(text)
+                self.messages_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Verbindung weg (WebSocketDisconnect, Netzwerkfehler, …)
+            self.disconnect(client.websocket)
+
+    def _evict(self, client: _Client, code: int = WS_SLOW_CONSUMER_CLOSE_CODE, reason: str = "Slow consumer"):
+        if code == WS_SLOW_CONSUMER_CLOSE_CODE:
+            self.evicted_slow += 1
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket, code, reason))
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int, reason: str):
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), WS_CLOSE_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    def use_bus(self, bus):
+        self.bus = bus
 
     async def broadcast(self, message: dict):
-        for connection in list(self.active_connections):
+        topic = event_topic(message)
+        if topic is None:
+            self.unrouted += 1
+            return
+
+        if self.coalescer.accepts(message):
+            await self.coalescer.add(topic, message)
+            return
+
+        # Gesammelte Events desselben Themas zuerst – sonst überholt dieses Event sie
+        await self.coalescer.flush_topic(topic)
+        await self._publish(topic, message)
+
+    async def _publish(self, topic: str, message: dict):
+        body = dumps(message).decode("utf-8")
+        # Das Log stellt (in seq-Reihenfolge) über deliver() zu
+        seq = await self.log.append(topic, body)
+        self.broadcasts += 1
+        if self.bus is not None:
+            await self.bus.publish(f"{topic}\n{seq or ''}\n{body}")
+
+    def deliver_remote(self, payload: str):
+        """Nachricht vom Event-Bus: "<thema>\n<seq>\n<json ohne seq>" """
+        topic, seq, body = payload.split("\n", 2)
+        self.log.append_remote(topic, int(seq) if seq else None, body)
+
+    def deliver(self, topic: str, text: str):
+        """Fertig serialisiertes Event an die Abonnenten dieses Prozesses"""
+        now = time.time()
+
+        for client in list(self._topics.get(topic, ())):
+            if client.expires_at and now >= client.expires_at:
+                self._evict(client, WS_TOKEN_EXPIRED_CLOSE_CODE, "Token abgelaufen")
+                continue
+            # Rechte der Rolle können sich seit dem Abonnieren geändert haben
+            if not may_subscribe(client.role_id, topic):
+                continue
             try:
-                await connection.send_json(message)
-            except:
-                self.disconnect(connection)
+                client.queue.put_nowait(text)
+                self.messages_queued += 1
+            except asyncio.QueueFull:
+                self._evict(client)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._clients),
+            "queue_size": self._queue_size,
+            "queued_now": sum(c.queue.qsize() for c in self._clients.values()),
+            "broadcasts": self.broadcasts,
+            "messages_queued": self.messages_queued,
+            "messages_sent": self.messages_sent,
+            "evicted_slow": self.evicted_slow,
+            "unrouted": self.unrouted,
+            "subscribers": {topic: len(clients) for topic, clients in self._topics.items()},
+            "coalescing": self.coalescer.stats(),
+            "event_log": self.log.stats(),
+            "bus": self.bus.stats() if self.bus is not None else None,
+        }
 
 manager = ConnectionManager()
@@ -0,0 +1,85 @@
+# app/zpl.py
+
+import os
+
+# Druckerauflösung in Punkten pro mm (8 = 203 dpi, 12 = 300 dpi)
+ZPL_DOTS_PER_MM = int(os.getenv("ZPL_DOTS_PER_MM", "8"))
+
+# A6 hochkant wie etikett.html
+LABEL_WIDTH_MM = 105
+LABEL_HEIGHT_MM = 148
+LABEL_PADDING_MM = 10
+
+ZPL_MEDIA_TYPE = "application/zpl"
+
+
+def _dots(mm: float) -> int:
+    return round(mm * ZPL_DOTS_PER_MM)
+
+
+def _pt(points: float) -> int:
+    """Schriftgröße in pt → Punkthöhe am Drucker"""
+    return _dots(points * 0.3528)
+
+
+def _text(value) -> str:
+    """Feldinhalt für ^FH escapen (^, ~ und \\ sind Steuerzeichen)"""
+    text = "" if value is None else str(value)
+    return text.replace("\\", "\\5C").replace("^", "\\5E").replace("~", "\\7E")
+
+
+def _field(x: int, y: int, width: int, height: int, value, align: str = "L") -> str:
+    """Textzeile in einem Feldblock (^FB) – align: L, C oder R"""
+    return f"^FO{x},{y}^A0N,{height},{height}^FB{width},1,0,{align},0^FH\\^FD{_text(value)}^FS"
+
+
+def _code128_width(code: str, module: int) -> int:
+    """Breite eines Code128-B-Barcodes in Punkten (Start + Daten + Prüfzeichen + Stopp)"""
+    return (11 * (len(code) + 2) + 13) * module
+
+
+def render_label_zpl(pulver) -> str:
+    """
+    Ein Etikett als ZPL – Layout entspricht etikett.html.
+    Der Barcode wird vom Drucker selbst erzeugt (^BC), es wird kein Bild gerendert.
+    `pulver` ist ein Objekt oder Dict mit den Feldern aus etikett.html.
+    """
+    get = pulver.get if isinstance(pulver, dict) else lambda f: getattr(pulver, f)
+
+    width = _dots(LABEL_WIDTH_MM)
+    inner = _dots(LABEL_WIDTH_MM - 2 * LABEL_PADDING_MM)
+    left = _dots(LABEL_PADDING_MM)
+
+    # Barcode oben, zentriert (0,3 mm Modulbreite ≈ 2–3 Punkte)
+    code = get("barcode") or ""
+    module = max(1, round(0.3 * ZPL_DOTS_PER_MM))
+    barcode_y = _dots(LABEL_PADDING_MM + 10)
+    barcode_x = max(0, (width - _code128_width(code, module)) // 2)
+    barcode_height = _dots(15)
+    text_y = barcode_y + barcode_height + _dots(2)
+
+    # Farbe / Qualität / Oberfläche
+    details_y = text_y + _pt(12) + _dots(8)
+    details_step = _pt(14) + _dots(6)
+
+    # Unterer Bereich
+    bottom_y = _dots(LABEL_HEIGHT_MM - LABEL_PADDING_MM) - _pt(11) - _pt(10) - _dots(2)
+    half = inner // 2
+
+    lines = [
+        "^XA",
+        "^CI28",  # UTF-8 (Umlaute)
+        f"^PW{width}",
+        f"^LL{_dots(LABEL_HEIGHT_MM)}",
+        f"^FO{barcode_x},{barcode_y}^BY{module}^BCN,{barcode_height},N,N,N^FH\\^FD{_text(code)}^FS",
+        _field(left, text_y, inner, _pt(12), code, "C"),
+        _field(left, details_y, inner, _pt(14), f"Farbe: {get('farbe') or ''}", "C"),
+        _field(left, details_y + details_step, inner, _pt(14), f"Qualität: {get('qualitaet') or ''}", "C"),
+        _field(left, details_y + 2 * details_step, inner, _pt(14), f"Oberfläche: {get('oberflaeche') or ''}", "C"),
+        _field(left, bottom_y, half, _pt(11), get("hersteller"), "L"),
+        _field(left, bottom_y + _pt(11) + _dots(1), half, _pt(10), f"Art.-Nr: {get('artikelnummer') or ''}", "L"),
+        _field(left + half, bottom_y, inner - half, _pt(12), f"{get('start_menge_kg')} kg", "R"),
+        _field(left + half, bottom_y + _pt(12) + _dots(1), inner - half, _pt(10), get("lagerort"), "R"),
+        "^XZ",
+    ]
+    return "\n".join(lines) + "\n"
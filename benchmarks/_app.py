@@ -0,0 +1,42 @@
+# benchmarks/_app.py
+"""
+Gemeinsames Setup der Benchmarks: App gegen eine frische SQLite-Datei laden.
+
+Aufruf immer aus dem Projektordner (Templates/Static werden relativ gefunden):
+    python -m benchmarks.login_storm
+"""
+
+import os
+import tempfile
+
+
+def load_app():
+    """DATABASE_URL muss vor dem ersten Import von app.database stehen"""
+    if "DATABASE_URL" not in os.environ:
+        directory = tempfile.mkdtemp(prefix="bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+
+    from app.main import app
+    return app
+
+
+async def close_app():
+    """Pools schließen – aiosqlite hält sonst einen Thread offen und der Prozess endet nicht"""
+    from app.database import async_engine, event_engine
+    await async_engine.dispose()
+    await event_engine.dispose()
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summary(values: list[float]) -> str:
+    """Millisekunden: p50 / p99 / max"""
+    return (f"p50 {percentile(values, 50) * 1000:7.1f} ms   "
+            f"p99 {percentile(values, 99) * 1000:7.1f} ms   "
+            f"max {max(values, default=0) * 1000:7.1f} ms")
@@ -0,0 +1,126 @@
+# benchmarks/async_routes.py
+"""
+p99-Latenz paralleler Requests mit und ohne Async-Modus der Datenbank.
+
+Pro Modus ein eigener Prozess mit eigener DB (DB_ASYNC=1 bzw. DB_ASYNC=0):
+    schreibend → POST /api/pulver/track (async-Route, Compare-and-Swap)
+    lesend     → GET /api/me (leichter Request, der nur den Event-Loop braucht)
+Gemessen werden die Latenzen beider Sorten und die Event-Loop-Verzögerung.
+
+    python -m benchmarks.async_routes --writers 20 --requests 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks._app import close_app, load_app, percentile, summary
+
+TICK_SECONDS = 0.005
+READ_INTERVAL_SECONDS = 0.02
+
+
+async def _run_mode(writers: int, requests: int) -> dict:
+    import httpx
+
+    app = load_app()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        login = await client.post("/api/login", data={"username": "admin", "password": "Admin123!"})
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        barcodes = []
+        for index in range(writers):
+            response = await client.post("/api/pulver/", headers=headers, json={
+                "artikelnummer": f"BENCH-{index}", "hersteller": "Bench", "start_menge_kg": 10_000,
+            })
+            barcodes.append(response.json()["pulver"]["barcode"])
+
+        write_latencies: list[float] = []
+        read_latencies: list[float] = []
+        lags: list[float] = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(TICK_SECONDS)
+                lags.append(time.perf_counter() - start - TICK_SECONDS)
+
+        async def writer(barcode: str):
+            for step in range(requests):
+                start = time.perf_counter()
+                response = await client.post("/api/pulver/track", headers=headers,
+                                             json={"barcode": barcode, "menge_neu": 10_000 - step - 1})
+                write_latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        async def reader():
+            while not done.is_set():
+                start = time.perf_counter()
+                response = await client.get("/api/me", headers=headers)
+                read_latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+                # Gleiche Last in beiden Modi: jeder Leser fragt höchstens alle READ_INTERVAL
+                await asyncio.sleep(READ_INTERVAL_SECONDS)
+
+        tick = asyncio.create_task(ticker())
+        readers = [asyncio.create_task(reader()) for _ in range(4)]
+        started = time.perf_counter()
+        await asyncio.gather(*(writer(b) for b in barcodes))
+        duration = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(tick, *readers)
+
+    await close_app()
+
+    return {"write": write_latencies, "read": read_latencies, "lag": lags, "duration": duration}
+
+
+def _child(args):
+    result = asyncio.run(_run_mode(args.writers, args.requests))
+    print("RESULT " + json.dumps(result))
+
+
+def _spawn(mode: str, args) -> dict:
+    env = {**os.environ, "DB_ASYNC": "1" if mode == "async" else "0"}
+    env.pop("DATABASE_URL", None)  # jeder Lauf mit frischer DB
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.async_routes", "--child",
+         "--writers", str(args.writers), "--requests", str(args.requests)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    line = next(l for l in output.splitlines() if l.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="p99 mit und ohne Async-Datenbankmodus")
+    parser.add_argument("--writers", type=int, default=20, help="parallele Scanner (je ein eigenes Pulver)")
+    parser.add_argument("--requests", type=int, default=30, help="Buchungen pro Scanner")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args)
+        return
+
+    results = {mode: _spawn(mode, args) for mode in ("async", "sync")}
+
+    print(f"\n{args.writers} parallele Scanner × {args.requests} Buchungen, dazu 4 lesende Clients")
+    for mode, result in results.items():
+        print(f"  DB_ASYNC={'1' if mode == 'async' else '0'}  ({mode}, {result['duration']:.2f} s)")
+        print(f"    POST /track  {summary(result['write'])}")
+        print(f"    GET  /me     {summary(result['read'])}   ({len(result['read'])} Requests)")
+        print(f"    Loop-Lag     {summary(result['lag'])}")
+
+    # Der Async-Modus soll vor allem die anderen Requests nicht mehr ausbremsen
+    async_read_p99 = percentile(results["async"]["read"], 99)
+    sync_read_p99 = percentile(results["sync"]["read"], 99)
+    assert async_read_p99 < sync_read_p99, f"GET /me p99 async {async_read_p99:.4f}s ≥ sync {sync_read_p99:.4f}s"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/login_storm.py
+"""
+Event-Loop-Latenz während eines Login-Sturms (Schichtwechsel).
+
+Ein Ticker-Task schläft in kurzen Intervallen und misst, wie viel zu spät er
+wieder aufwacht (= wie lange der Loop blockiert war), während N parallele
+POST /api/login laufen. Vergleich:
+
+    service  → Login wie in der App (pbkdf2 im HashingService-Pool)
+    inline   → pbkdf2 direkt auf dem Event-Loop (so lief create_user vorher)
+
+    python -m benchmarks.login_storm --logins 50
+"""
+
+import argparse
+import asyncio
+import time
+from benchmarks._app import close_app, load_app, summary
+
+TICK_SECONDS = 0.005
+
+
+async def _measure_lag(work) -> tuple[list[float], float]:
+    """Verspätung des Tickers (Sekunden) während `work` läuft → (lags, dauer)"""
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(time.perf_counter() - start - TICK_SECONDS)
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await work()
+    duration = time.perf_counter() - started
+    done.set()
+    await task
+    return lags, duration
+
+
+async def run(logins: int) -> dict:
+    import httpx
+    from passlib.hash import pbkdf2_sha256
+    from app.hashing import HASH_MAX_PENDING
+
+    app = load_app()
+    form = {"username": "admin", "password": "Admin123!"}
+    results = {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # Aufwärmen (Principal-Cache, Permission-Registry, Verbindungspool)
+        assert (await client.post("/api/login", data=form)).status_code == 200
+
+        async def storm():
+            responses = await asyncio.gather(*(client.post("/api/login", data=form) for _ in range(logins)))
+            statuses = {r.status_code for r in responses}
+            assert statuses <= {200, 503}, statuses
+
+        results["service"] = await _measure_lag(storm)
+
+    await close_app()
+
+    stored = pbkdf2_sha256.hash(form["password"])
+
+    async def inline_login():
+        await asyncio.sleep(0)
+        pbkdf2_sha256.verify(form["password"], stored)
+
+    async def inline_storm():
+        await asyncio.gather(*(inline_login() for _ in range(logins)))
+
+    results["inline"] = await _measure_lag(inline_storm)
+
+    print(f"\n{logins} parallele Logins (HASH_MAX_PENDING={HASH_MAX_PENDING}), Ticker alle {TICK_SECONDS * 1000:.0f} ms")
+    for name, (lags, duration) in results.items():
+        print(f"  {name:8} Loop-Verzögerung: {summary(lags)}   Dauer {duration:5.2f} s")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event-Loop-Latenz während eines Login-Sturms")
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.logins))
+
+    # Mit dem Hashing-Pool darf der Loop nie so lange stehen wie beim Inline-Hashing
+    service_max = max(results["service"][0], default=0)
+    inline_max = max(results["inline"][0], default=0)
+    assert service_max < inline_max, f"Loop blockiert trotz Hashing-Pool ({service_max:.3f}s ≥ {inline_max:.3f}s)"
+
+
+if __name__ == "__main__":
+    main()
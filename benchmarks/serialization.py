@@ -0,0 +1,119 @@
+# benchmarks/serialization.py
+"""
+Vorher/Nachher der Pulverliste (GET /api/pulver/ ohne limit) bei 10k und 100k Zeilen.
+
+    vorher   → ORM-Objekte laden, Dict pro Objekt, jsonable_encoder + JSONResponse
+    nachher  → _query_pulver_list (nur Listenspalten als Row-Tupel) + orjson
+
+Gemessen wird Abfrage + Serialisierung, bestes von --repeat Läufen. Beide
+Wege müssen dasselbe JSON liefern.
+
+    python -m benchmarks.serialization --rows 10000 100000
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from benchmarks._app import load_app
+
+
+def _seed(rows: int):
+    """Genau `rows` aktive Pulver in der Tabelle (Core-Insert in Blöcken)"""
+    from sqlalchemy import delete, insert
+    from app.database import SessionLocal
+    from app.models import Pulver, PulverBewegung
+
+    created = datetime(2025, 1, 1)
+    db = SessionLocal()
+    try:
+        db.execute(delete(PulverBewegung))
+        db.execute(delete(Pulver))
+        for start in range(0, rows, 5000):
+            db.execute(insert(Pulver), [
+                {
+                    "barcode": f"BENCH-{i:06d}", "artikelnummer": f"ART-{i:06d}",
+                    "hersteller": "Tiger", "farbe": f"RAL {7000 + i % 50}", "qualitaet": "Fassade",
+                    "oberflaeche": "matt", "anwendung": "außen", "start_menge_kg": 25.0,
+                    "menge_kg": 25.0 - i % 25, "lagerort": f"Regal {i % 40}", "aktiv": True,
+                    "deleted": False, "created_by": 1, "created_at": created + timedelta(seconds=i),
+                }
+                for i in range(start, min(start + 5000, rows))
+            ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _before(db) -> bytes:
+    """Stand vor der Umstellung: ganze Entities + jsonable_encoder"""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from app.models import Pulver
+    from app.routes.pulver import _pulver_to_dict
+
+    pulver = db.query(Pulver).filter(Pulver.deleted == False, Pulver.aktiv == True).all()
+    payload = [_pulver_to_dict(p) for p in pulver]
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def _after(db) -> bytes:
+    """Aktueller Weg der Route: Spaltenprojektion + orjson"""
+    from app.routes.pulver import _query_pulver_list
+    from app.serialization import dumps
+
+    payload = _query_pulver_list(db, False, None, None, None, None, None,
+                                 None, "id", "asc", None, None, False)
+    return dumps(payload)
+
+
+def _best_of(fn, repeat: int) -> tuple[float, bytes]:
+    from app.database import SessionLocal
+
+    best, body = float("inf"), b""
+    for _ in range(repeat):
+        db = SessionLocal()  # frische Session → leere Identity-Map wie pro Request
+        try:
+            start = time.perf_counter()
+            body = fn(db)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            db.close()
+    return best, body
+
+
+def run(row_counts: list[int], repeat: int) -> dict:
+    load_app()
+    results = {}
+
+    for rows in row_counts:
+        _seed(rows)
+        before, before_body = _best_of(_before, repeat)
+        after, after_body = _best_of(_after, repeat)
+
+        # gleiche Antwort, nur schneller
+        assert json.loads(before_body) == json.loads(after_body), "Antwort weicht ab"
+        assert len(json.loads(after_body)) == rows
+
+        results[rows] = (before, after)
+        print(f"  {rows:>7} Zeilen   vorher {before * 1000:8.1f} ms   nachher {after * 1000:8.1f} ms"
+              f"   Faktor {before / after:4.1f}×   ({len(after_body) / 1_000_000:.1f} MB)")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pulverliste: ORM + jsonable_encoder vs. Spalten + orjson")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"\nGET /api/pulver/ – Abfrage + Serialisierung, bestes von {args.repeat}")
+    results = run(args.rows, args.repeat)
+
+    for rows, (before, after) in results.items():
+        assert after < before, f"{rows} Zeilen: nachher {after:.3f}s ≥ vorher {before:.3f}s"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/ws_fanout.py
+"""
+Broadcast an 1.000 WebSocket-Verbindungen, davon einige absichtlich langsam.
+
+Simulierte Verbindungen (kein Netzwerk) direkt am ConnectionManager:
+    schnell  → send_text kehrt sofort zurück
+    langsam  → send_text hängt (eingefrorener Browser-Tab), close ebenso
+
+Geprüft wird:
+    - jeder schnelle Client bekommt jedes Event, in Reihenfolge
+    - jeder langsame Client wird als Slow Consumer getrennt (Close-Code 1013)
+    - kein schneller Client wird getrennt
+    - broadcast() und die Zustellung bleiben trotz hängender Clients schnell
+
+    python -m benchmarks.ws_fanout --connections 1000 --slow 50 --events 1000
+"""
+
+import argparse
+import asyncio
+import time
+import orjson
+from benchmarks._app import close_app, load_app, percentile, summary
+
+
+class FakeWebSocket:
+    """Minimale WebSocket-Attrappe für den ConnectionManager"""
+
+    def __init__(self, slow: bool, published: dict[int, float]):
+        self.slow = slow
+        self._published = published
+        self.received: list[int] = []
+        self.latencies: list[float] = []
+        self.close_code: int | None = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.slow:
+            await asyncio.Event().wait()  # kommt nie zurück
+        number = orjson.loads(text)["n"]
+        self.latencies.append(time.perf_counter() - self._published[number])
+        self.received.append(number)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.close_code = code
+        if self.slow:
+            await asyncio.Event().wait()
+
+
+async def run(connections: int, slow: int, events: int, queue_size: int) -> dict:
+    load_app()
+    from app.database import SessionLocal
+    from app.models import Role
+    from app.ws_manager import ConnectionManager, WS_SLOW_CONSUMER_CLOSE_CODE
+
+    db = SessionLocal()
+    try:
+        admin_role_id = db.query(Role.id).filter(Role.name.ilike("admin")).scalar()
+    finally:
+        db.close()
+
+    manager = ConnectionManager(queue_size=queue_size)
+    published: dict[int, float] = {}
+    sockets = [FakeWebSocket(index < slow, published) for index in range(connections)]
+    for websocket in sockets:
+        await manager.connect(websocket, role_id=admin_role_id)
+        current, denied = manager.subscribe(websocket, ["pulver"])
+        assert current == ["pulver"] and not denied
+
+    broadcast_times: list[float] = []
+    started = time.perf_counter()
+    for number in range(events):
+        published[number] = time.perf_counter()
+        await manager.broadcast({"event": "pulver_created", "n": number, "barcode": f"OZS-{number:05d}"})
+        broadcast_times.append(time.perf_counter() - published[number])
+        await asyncio.sleep(0)  # Writer-Tasks laufen lassen (wie zwischen zwei Requests)
+
+    # Queues der schnellen Clients leerlaufen lassen
+    fast = [ws for ws in sockets if not ws.slow]
+    while any(len(ws.received) < events for ws in fast if ws.close_code is None):
+        await asyncio.sleep(0.001)
+    duration = time.perf_counter() - started
+    await asyncio.sleep(0)  # ausstehende close()-Tasks starten
+
+    stats = manager.stats()
+    for websocket in list(manager.active_connections):
+        manager.disconnect(websocket)
+    await close_app()
+
+    slow_sockets = [ws for ws in sockets if ws.slow]
+    return {
+        "duration": duration,
+        "broadcast": broadcast_times,
+        "delivery": [latency for ws in fast for latency in ws.latencies],
+        "fast_complete": sum(ws.received == list(range(events)) for ws in fast),
+        "fast_closed": sum(ws.close_code is not None for ws in fast),
+        "slow_evicted": sum(ws.close_code == WS_SLOW_CONSUMER_CLOSE_CODE for ws in slow_sockets),
+        "stats": stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WebSocket-Broadcast mit langsamen Clients")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=50, help="davon hängende Clients")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--max-broadcast-p99-ms", type=float, default=50.0)
+    args = parser.parse_args(argv)
+    assert args.events > args.queue_size + 1, "sonst läuft keine Queue eines langsamen Clients über"
+
+    result = asyncio.run(run(args.connections, args.slow, args.events, args.queue_size))
+    fast = args.connections - args.slow
+
+    print(f"\n{args.connections} Verbindungen ({args.slow} hängend), {args.events} Events, Queue {args.queue_size}")
+    print(f"  broadcast()   {summary(result['broadcast'])}")
+    print(f"  Zustellung    {summary(result['delivery'])}   ({len(result['delivery'])} Nachrichten)")
+    print(f"  Dauer {result['duration']:.2f} s   vollständig {result['fast_complete']}/{fast}"
+          f"   getrennt (langsam) {result['slow_evicted']}/{args.slow}"
+          f"   getrennt (schnell) {result['fast_closed']}")
+
+    assert result["fast_complete"] == fast, "schnelle Clients haben Events verpasst"
+    assert result["fast_closed"] == 0, "schnelle Clients wurden getrennt"
+    assert result["slow_evicted"] == args.slow, "hängende Clients wurden nicht getrennt"
+    assert result["stats"]["evicted_slow"] == args.slow
+    broadcast_p99 = percentile(result["broadcast"], 99) * 1000
+    assert broadcast_p99 < args.max_broadcast_p99_ms, f"broadcast() p99 {broadcast_p99:.1f} ms"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""pulver change_seq for delta sync
+
+Revision ID: 3f1c2a9b7d10
+Revises: ed5082a22604
+Create Date: 2026-10-18 09:12:31.418202
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, Sequence[str], None] = 'ed5082a22604'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    change_counters = op.create_table('change_counters',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Zählerzeile vorab anlegen – next_change_seq fügt nie selbst ein
+    op.bulk_insert(change_counters, [{'name': 'pulver', 'value': 0}])
+    with op.batch_alter_table('pulver') as batch_op:
+        batch_op.add_column(sa.Column('change_seq', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_pulver_change_seq'), ['change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('pulver') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pulver_change_seq'))
+        batch_op.drop_column('change_seq')
+    op.drop_table('change_counters')
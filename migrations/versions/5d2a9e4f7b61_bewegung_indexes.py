@@ -0,0 +1,32 @@
+"""pulver_bewegung indexes for keyset history
+
+Revision ID: 5d2a9e4f7b61
+Revises: 8b4e7c2d1a53
+Create Date: 2026-10-18 14:05:31.482907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2a9e4f7b61'
+down_revision: Union[str, Sequence[str], None] = '8b4e7c2d1a53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_pulver_bewegung_pulver_datum', 'pulver_bewegung', ['pulver_id', 'datum', 'id'], unique=False)
+    op.create_index('ix_pulver_bewegung_user_datum', 'pulver_bewegung', ['user_id', 'datum', 'id'], unique=False)
+    op.create_index('ix_pulver_bewegung_datum', 'pulver_bewegung', ['datum', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_pulver_bewegung_datum', table_name='pulver_bewegung')
+    op.drop_index('ix_pulver_bewegung_user_datum', table_name='pulver_bewegung')
+    op.drop_index('ix_pulver_bewegung_pulver_datum', table_name='pulver_bewegung')
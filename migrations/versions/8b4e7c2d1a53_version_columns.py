@@ -0,0 +1,32 @@
+"""version columns for optimistic locking
+
+Revision ID: 8b4e7c2d1a53
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 11:40:07.235117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e7c2d1a53'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('pulver', 'roles', 'users'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('users', 'roles', 'pulver'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,34 @@
+"""ws_events tail for websocket replay
+
+Revision ID: 9c3f1a7e2b84
+Revises: 5d2a9e4f7b61
+Create Date: 2026-10-18 17:41:08.215634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3f1a7e2b84'
+down_revision: Union[str, Sequence[str], None] = '5d2a9e4f7b61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ws_events',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('topic', sa.String(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('seq')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ws_events')
@@ -0,0 +1,53 @@
+# tests/conftest.py
+"""
+Alle Tests laufen gegen eine frische, dateibasierte SQLite-DB (WAL-Profil wie im Betrieb).
+DATABASE_URL muss gesetzt sein, bevor app.database zum ersten Mal importiert wird.
+"""
+
+import itertools
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='tests-')}/test.db"
+
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Mit Lifespan und EINEM Event-Loop für alle Requests (die async Engine hängt am Loop)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def admin_token(client):
+    response = client.post("/api/login", data={"username": "admin", "password": "Admin123!"})
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
+
+
+@pytest.fixture(scope="session")
+def auth_headers(admin_token):
+    return {"Authorization": f"Bearer {admin_token}"}
+
+
+# über alle Tests hinweg fortlaufend (id() eines Zählers pro Test wird wiederverwendet)
+_pulver_numbers = itertools.count(1)
+
+
+@pytest.fixture
+def new_pulver(client, auth_headers):
+    """Legt ein Pulver mit eindeutiger Artikelnummer an und gibt dessen JSON zurück"""
+    def create(start_menge_kg: float = 100.0) -> dict:
+        response = client.post("/api/pulver/", headers=auth_headers, json={
+            "artikelnummer": f"TEST-{os.getpid()}-{next(_pulver_numbers)}",
+            "hersteller": "Test",
+            "start_menge_kg": start_menge_kg,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()["pulver"]
+
+    return create
@@ -0,0 +1,29 @@
+# tests/test_change_tracking.py
+"""
+Änderungszähler für den Delta-Sync: die Zeile kommt aus Migration/Seeding,
+next_change_seq legt sie nie selbst an (gleichzeitige erste Schreiber).
+"""
+
+import pytest
+from app.database import SessionLocal
+from app.change_tracking import next_change_seq
+from app.models import ChangeCounter
+
+
+def test_counter_row_is_seeded(client):
+    db = SessionLocal()
+    try:
+        assert db.get(ChangeCounter, "pulver") is not None
+    finally:
+        db.close()
+
+
+def test_missing_counter_is_an_error(client):
+    db = SessionLocal()
+    try:
+        with pytest.raises(RuntimeError):
+            next_change_seq(db, "gibt-es-nicht")
+        assert db.get(ChangeCounter, "gibt-es-nicht") is None
+    finally:
+        db.rollback()
+        db.close()
@@ -0,0 +1,46 @@
+# tests/test_labels.py
+"""
+Sammeldruck /api/pulver/labels: nur mit Berechtigung, und nur begrenzt viele
+Läufe gleichzeitig (jeder belegt den Render-Prozesspool).
+"""
+
+from app.routes import pulver
+
+
+def _take_all_slots() -> int:
+    taken = 0
+    while pulver._label_batch_slots.acquire(blocking=False):
+        taken += 1
+    return taken
+
+
+def _release(count: int):
+    for _ in range(count):
+        pulver._label_batch_slots.release()
+
+
+def test_batch_labels_require_login(client, new_pulver):
+    p = new_pulver()
+    assert client.get("/api/pulver/labels", params={"ids": [p["id"]]}).status_code == 401
+
+
+def test_batch_labels_are_capped_and_release_their_slot(client, auth_headers, new_pulver):
+    p = new_pulver()
+    params = {"ids": [p["id"]]}
+
+    # alle Plätze belegt → 503
+    taken = _take_all_slots()
+    try:
+        response = client.get("/api/pulver/labels", params=params, headers=auth_headers)
+        assert response.status_code == 503
+    finally:
+        _release(taken)
+
+    response = client.get("/api/pulver/labels", params=params, headers=auth_headers)
+    assert response.status_code == 200
+    assert p["barcode"] in response.text
+
+    # nach der Antwort sind wieder alle Plätze frei
+    taken = _take_all_slots()
+    _release(taken)
+    assert taken == pulver.MAX_CONCURRENT_LABEL_BATCHES
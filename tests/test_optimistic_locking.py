@@ -0,0 +1,60 @@
+# tests/test_optimistic_locking.py
+"""Bearbeiten ohne oder mit veralteter version darf nichts überschreiben"""
+
+import itertools
+
+_names = itertools.count(1)
+
+
+def _create_user(client, auth_headers, role_id: int = 1) -> dict:
+    name = f"lock{next(_names)}"
+    response = client.post("/api/users/", headers=auth_headers,
+                           json={"username": name, "email": f"{name}@test.local", "role_id": role_id})
+    assert response.status_code == 200, response.text
+    user_id = response.json()["user"]["id"]
+    return client.get(f"/api/users/{user_id}", headers=auth_headers).json()
+
+
+def test_update_user_requires_version(client, auth_headers):
+    user = _create_user(client, auth_headers)
+
+    response = client.put(f"/api/users/{user['id']}", headers=auth_headers, json={"email": "neu@test.local"})
+    assert response.status_code == 400
+
+
+def test_update_user_rejects_stale_version(client, auth_headers):
+    user = _create_user(client, auth_headers)
+    url = f"/api/users/{user['id']}"
+
+    first = client.put(url, headers=auth_headers, json={"email": "a@test.local", "version": user["version"]})
+    assert first.status_code == 200
+    assert first.json()["version"] == user["version"] + 1
+
+    stale = client.put(url, headers=auth_headers, json={"email": "b@test.local", "version": user["version"]})
+    assert stale.status_code == 409
+
+
+def test_stale_edit_after_delete_and_restore_is_rejected(client, auth_headers):
+    # Admins lassen sich nicht löschen → eigene Rolle
+    role = client.post("/api/roles/", headers=auth_headers, json={"name": f"lockrolle{next(_names)}", "description": ""})
+    assert role.status_code == 200, role.text
+    user = _create_user(client, auth_headers, role.json()["role"]["id"])
+    url = f"/api/users/{user['id']}"
+
+    # Editor öffnet das Modal, währenddessen wird gelöscht und wiederhergestellt
+    assert client.delete(url, headers=auth_headers).status_code == 200
+    assert client.put(f"/api/users/restore/{user['id']}", headers=auth_headers).status_code == 200
+
+    stale = client.put(url, headers=auth_headers, json={"email": "alt@test.local", "version": user["version"]})
+    assert stale.status_code == 409
+    assert client.get(url, headers=auth_headers).json()["version"] == user["version"] + 2
+
+
+def test_assign_permissions_requires_version(client, auth_headers):
+    role = client.post("/api/roles/", headers=auth_headers, json={"name": f"lockrolle{next(_names)}", "description": ""})
+    assert role.status_code == 200, role.text
+    role_id = role.json()["role"]["id"]
+
+    response = client.post("/api/roles/assign_permissions", headers=auth_headers,
+                           json={"role_id": role_id, "permission_ids": []})
+    assert response.status_code == 400
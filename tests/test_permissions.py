@@ -0,0 +1,54 @@
+# tests/test_permissions.py
+"""
+Permission-Registry: ein veralteter Stand wird im Hintergrund neu geladen, der
+Aufrufer (z. B. ein async Route im Event-Loop) wartet nie auf die Datenbank.
+"""
+
+import threading
+import time
+from app.permissions import PermissionRegistry, PERMISSIONS_CHANGED
+
+
+class _SlowRegistry(PermissionRegistry):
+    """Neuaufbau dauert spürbar und merkt sich, in welchem Thread er lief"""
+
+    def __init__(self):
+        super().__init__(max_age=60)
+        self.rebuild_threads: list[str] = []
+        self.rebuilt = threading.Event()
+
+    def rebuild(self, db=None):
+        time.sleep(0.2)
+        self.rebuild_threads.append(threading.current_thread().name)
+        with self._lock:
+            self._state = ({"pulver.track": 1 << 1}, {1: 1 << 1})
+            self._loaded_at = time.monotonic()
+        self.rebuilt.set()
+
+
+def test_stale_registry_refreshes_in_background():
+    registry = _SlowRegistry()
+    registry._state = ({"pulver.track": 1 << 1}, {})
+    registry._loaded_at = time.monotonic() - 120
+
+    started = time.perf_counter()
+    assert registry.has_permission(1, "pulver.track") is False  # alter Stand gilt weiter
+    assert time.perf_counter() - started < 0.1, "Aufrufer hat auf den Neuaufbau gewartet"
+
+    assert registry.rebuilt.wait(2)
+    assert registry.rebuild_threads == ["permission-registry"]
+    assert registry.has_permission(1, "pulver.track") is True
+
+
+def test_permissions_changed_message_triggers_refresh(monkeypatch):
+    from app import permissions
+    from app.ws_bus import event_bus
+
+    registry = _SlowRegistry()
+    registry._state = ({}, {})
+    registry._loaded_at = time.monotonic()
+    monkeypatch.setattr(permissions, "permission_registry", registry)
+
+    # Nachricht eines anderen Workers
+    event_bus._dispatch(f"!{PERMISSIONS_CHANGED}\n")
+    assert registry.rebuilt.wait(2)
@@ -0,0 +1,56 @@
+# tests/test_principal_cache.py
+"""
+Principal-Cache mit mehreren Workern: invalidate_user() muss den Eintrag auch in
+den anderen Prozessen verwerfen (Steuer-Nachricht über den Event-Bus).
+"""
+
+import asyncio
+import os
+from types import SimpleNamespace
+from app.principal_cache import Principal, PrincipalCache, PRINCIPAL_INVALIDATED
+from app.ws_bus import UnixSocketBus
+
+
+def _principal(user_id: int) -> Principal:
+    return Principal(SimpleNamespace(
+        id=user_id, username=f"user{user_id}", role_id=1, role=None,
+        active=True, deleted=False, must_change_password=False,
+    ))
+
+
+def test_invalidation_reaches_other_worker(tmp_path):
+    async def scenario():
+        # zwei "Worker" mit je eigenem Bus-Socket und eigenem Cache
+        caches = [PrincipalCache(), PrincipalCache()]
+        buses = [UnixSocketBus(str(tmp_path)), UnixSocketBus(str(tmp_path))]
+        buses[1]._path = os.path.join(str(tmp_path), "worker-b.sock")
+
+        for bus, cache in zip(buses, caches):
+            bus.on_control(PRINCIPAL_INVALIDATED, lambda data, cache=cache: cache.drop_user(int(data)))
+            await bus.start(lambda text: None)
+            cache.put("user7", 1, _principal(7))
+            cache.put("user8", 1, _principal(8))
+
+        caches[0].drop_user(7)
+        buses[0].notify(PRINCIPAL_INVALIDATED, "7")
+        for _ in range(100):
+            if caches[1].get("user7", 1) is None:
+                break
+            await asyncio.sleep(0.01)
+
+        assert caches[1].get("user7", 1) is None
+        assert caches[1].get("user8", 1) is not None, "nur der betroffene Benutzer fliegt raus"
+
+        for bus in buses:
+            await bus.stop()
+
+    asyncio.run(scenario())
+
+
+def test_cache_stats_in_monitoring(client, auth_headers):
+    response = client.get("/api/monitoring/caches", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    stats = response.json()
+    assert {"entries", "hits", "misses"} <= set(stats["principal"])
+    assert {"executed", "coalesced", "in_flight"} <= set(stats["single_flight"])
+    assert {"entries", "hits", "misses"} <= set(stats["barcode"])
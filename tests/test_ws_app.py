@@ -0,0 +1,58 @@
+# tests/test_ws_app.py
+"""
+Globaler Event-Socket /ws/app: ungültige Themen dürfen die Verbindung nicht
+kaputtmachen oder Einträge im ConnectionManager zurücklassen, und ein
+ungültiger Token muss beim Browser als Close-Code 4401 ankommen.
+"""
+
+import time
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from app.ws_manager import manager
+
+
+def test_invalid_token_closes_with_4401(client):
+    with client.websocket_connect("/ws/app?token=ungueltig") as websocket:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            websocket.receive_text()
+    assert exc.value.code == 4401
+
+
+@pytest.mark.parametrize("action", ["subscribe", "unsubscribe"])
+def test_non_string_topics_are_rejected(client, admin_token, action):
+    with client.websocket_connect(f"/ws/app?token={admin_token}") as websocket:
+        websocket.send_json({"action": action, "topics": [["pulver"]]})
+        assert websocket.receive_json() == {"event": "error", "detail": "Ungültige Nachricht"}
+
+        # Verbindung bleibt benutzbar
+        websocket.send_json({"action": "subscribe", "topics": ["pulver"]})
+        reply = websocket.receive_json()
+        assert reply["event"] == "subscribed" and reply["topics"] == ["pulver"]
+
+
+def test_manager_ignores_unhashable_topics(client, admin_token):
+    before = set(manager.active_connections)
+    with client.websocket_connect(f"/ws/app?token={admin_token}&topics=pulver") as websocket:
+        websocket.receive_json()  # subscribed
+        connection = next(ws for ws in manager.active_connections if ws not in before)
+        assert manager.subscribe(connection, [["x"], {"a": 1}, "pulver"]) == (["pulver"], [["x"], {"a": 1}])
+        assert manager.unsubscribe(connection, [["pulver"]]) == ["pulver"]
+
+
+def _wait_for_connections(count: int):
+    # Abmelden läuft im Server-Task → kurz auf das Aufräumen warten
+    deadline = time.monotonic() + 2
+    while len(manager.active_connections) != count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(manager.active_connections) == count
+
+
+def test_disconnect_releases_client(client, admin_token):
+    before = len(manager.active_connections)
+    with client.websocket_connect(f"/ws/app?token={admin_token}&topics=pulver") as websocket:
+        websocket.receive_json()
+        assert len(manager.active_connections) == before + 1
+        websocket.send_json({"action": "subscribe", "topics": [["x"]]})
+        websocket.receive_json()
+    _wait_for_connections(before)
+    assert manager.stats()["subscribers"]["pulver"] == 0
@@ -0,0 +1,65 @@
+# tests/test_ws_bus.py
+"""
+Event-Bus zwischen Workern: Nachrichten über der tatsächlichen Datagramm-Größe
+werden gestückelt, halbe Nachrichten nur begrenzt festgehalten, Verluste geloggt.
+"""
+
+import asyncio
+import logging
+import os
+from app import ws_bus
+from app.ws_bus import BUS_MAX_PARTIAL_MESSAGES, PostgresBus, UnixSocketBus
+
+
+def test_large_message_is_split_to_the_real_socket_buffer(tmp_path, monkeypatch):
+    # kleiner Puffer wie bei gekapptem net.core.wmem_max
+    monkeypatch.setattr(ws_bus, "UNIX_SOCKET_BUFFER_BYTES", 16 * 1024)
+    text = "pulver\n7\n" + "Ölfarbe RAL 7016 – " * 20_000  # ~400 KB, Mehrbyte-Zeichen
+
+    async def scenario():
+        received: list[str] = []
+        sender, receiver = UnixSocketBus(str(tmp_path)), UnixSocketBus(str(tmp_path))
+        receiver._path = os.path.join(str(tmp_path), "worker-b.sock")
+        await sender.start(lambda text: None)
+        await receiver.start(received.append)
+
+        assert sender.datagram_bytes < len(text.encode("utf-8"))
+        await sender.publish(text)
+        for _ in range(200):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+
+        for bus in (sender, receiver):
+            await bus.stop()
+        return received, sender.stats()
+
+    received, stats = asyncio.run(scenario())
+    assert received == [text]
+    assert stats["dropped"] == 0
+
+
+def test_partial_messages_are_bounded_and_logged(caplog):
+    bus = PostgresBus("postgresql://localhost/test")
+    bus._deliver = lambda text: None
+
+    with caplog.at_level(logging.WARNING, logger="app.ws_bus"):
+        # von jeder Nachricht kommt nur der erste von zwei Teilen an
+        for message_id in range(BUS_MAX_PARTIAL_MESSAGES + 10):
+            bus._receive_frame(f"worker-a|{message_id}|0|2|teil")
+
+    assert bus.stats()["partial"] == BUS_MAX_PARTIAL_MESSAGES
+    assert bus.dropped == 10
+    assert "unvollständig" in caplog.text
+
+
+def test_partial_messages_are_cleared_on_disconnect():
+    bus = PostgresBus("postgresql://localhost/test")
+    bus._deliver = lambda text: None
+    bus._stopping = True  # kein Reconnect im Test
+
+    bus._receive_frame("worker-a|1|0|3|teil")
+    bus._on_terminated(None)
+
+    assert bus.stats()["partial"] == 0
+    assert bus.dropped == 1
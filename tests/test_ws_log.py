@@ -0,0 +1,122 @@
+# tests/test_ws_log.py
+"""
+Event-Log mit Persistenz (mehrere Worker): Events werden strikt in seq-Reihenfolge
+zugestellt, auch wenn fremde Events über den Bus später ankommen, und die Inserts
+in ws_events laufen gebündelt.
+"""
+
+import asyncio
+from sqlalchemy import delete, insert, select
+from app.database import event_session, write_session
+from app.models import WsEvent
+from app.ws_log import EventLog, with_seq
+
+
+class _Recorder:
+    def __init__(self):
+        self.delivered: list[str] = []
+
+    def __call__(self, topic: str, text: str):
+        self.delivered.append(text)
+
+    def seqs(self) -> list[int]:
+        return [int(text.split(",", 1)[0].removeprefix('{"seq":')) for text in self.delivered]
+
+
+def _log(recorder, head: int = 10, gap_ms: int = 1000) -> EventLog:
+    log = EventLog(recorder, persist=True, gap_ms=gap_ms)
+    log._seq = head  # wie nach start(): Stand der Tabelle
+    return log
+
+
+def test_remote_event_arriving_late_is_delivered_first():
+    async def scenario():
+        recorder = _Recorder()
+        log = _log(recorder)
+
+        # eigene 12 ist schon da, die 11 des anderen Workers noch unterwegs
+        log.append_remote("pulver", 12, '{"event":"pulver_created"}')
+        assert recorder.delivered == []
+        assert log.head == 10, "Client darf nicht mit since=12 fortsetzen, solange die 11 fehlt"
+
+        log.append_remote("pulver", 11, '{"event":"pulver_updated"}')
+        assert recorder.seqs() == [11, 12]
+        assert log.head == 12
+        assert await log.replay(10, "db", ["pulver"]) == recorder.delivered
+
+    asyncio.run(scenario())
+
+
+def test_missing_seq_is_skipped_after_timeout():
+    async def scenario():
+        recorder = _Recorder()
+        log = _log(recorder, gap_ms=20)
+
+        log.append_remote("pulver", 12, '{"event":"pulver_created"}')
+        await asyncio.sleep(0.1)
+        assert recorder.seqs() == [12]
+        assert log.stats()["gaps_skipped"] == 1
+
+        # kommt die 11 doch noch, wird sie trotzdem zugestellt
+        log.append_remote("pulver", 11, '{"event":"pulver_updated"}')
+        assert recorder.seqs() == [12, 11]
+        assert log.stats()["late"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_appends_share_insert_batches(client):
+    recorder = _Recorder()
+    log = EventLog(recorder, persist=True)
+
+    async def scenario():
+        await log.start()
+        return await asyncio.gather(*(log.append("pulver", f'{{"event":"pulver_created","n":{n}}}') for n in range(50)))
+
+    seqs = client.portal.call(scenario)
+
+    assert seqs == sorted(seqs) and len(set(seqs)) == 50
+    assert recorder.seqs() == seqs
+    assert all(text.endswith(f'"n":{n}}}') for n, text in enumerate(recorder.delivered))
+    # erster Insert allein, der Rest wartet und geht gemeinsam raus
+    assert log.stats()["insert_batches"] <= 2
+
+
+def test_event_inserts_do_not_wait_for_the_write_engine(client):
+    log = EventLog(_Recorder(), persist=True)
+
+    async def scenario():
+        await log.start()
+        async with write_session() as db:
+            await db.execute(select(1))  # hält die (einzige) Verbindung der Schreib-Engine
+            return await asyncio.wait_for(log.append("pulver", '{"event":"pulver_created"}'), 2)
+
+    assert client.portal.call(scenario) is not None
+    assert log.stats()["persist_errors"] == 0
+
+
+def test_db_replay_stops_at_head_while_lower_seq_is_uncommitted(client):
+    recorder = _Recorder()
+    log = EventLog(recorder, size=1, persist=True)  # Ringpuffer hält nur das letzte Event
+
+    async def scenario():
+        await log.start()
+        seqs = [await log.append("pulver", f'{{"event":"pulver_updated","n":{n}}}') for n in range(3)]
+        head = seqs[-1]
+
+        # Worker B hat head+2 schon committet, head+1 von Worker A ist noch offen
+        async with event_session() as db:
+            await db.execute(insert(WsEvent).values(seq=head + 2, topic="pulver", payload='{"event":"pulver_created"}'))
+            await db.commit()
+        try:
+            return seqs, await log.replay(seqs[0], "db", ["pulver"])
+        finally:
+            async with event_session() as db:
+                await db.execute(delete(WsEvent).where(WsEvent.seq == head + 2))
+                await db.commit()
+
+    seqs, replayed = client.portal.call(scenario)
+
+    # nichts über head – head+1 und head+2 kommen live in Reihenfolge
+    assert replayed == recorder.delivered[1:]
+    assert replayed[-1] == with_seq(seqs[-1], '{"event":"pulver_updated","n":2}')